@@ -18,8 +18,11 @@ import bpy
 from bpy.props import PointerProperty, IntProperty, FloatProperty, StringProperty, EnumProperty, BoolProperty
 from bpy.types import AddonPreferences, PropertyGroup, Operator
 from bpy_extras.io_utils import ExportHelper, ImportHelper
+from mathutils import Vector
 
-from .utils import PhotogrammetryModule, get_binpath_for_module, get_binary_path, CroppingPrettyPrinter
+from . import jobs
+from .jobs import Job
+from .utils import PhotogrammetryModule, get_binpath_for_module, get_binary_path, CroppingPrettyPrinter, freeze_properties, load_ply_mesh
 
 
 # modules will exist as directories in the current directory
@@ -62,16 +65,30 @@ class PHOTOGRAMMETRY_PT_preferences(AddonPreferences):
         description='Name of the collection that will be created when adding photogrammetry objects',
         default='Photogrammetry'
     )
+    max_workers: IntProperty(
+        name='Parallel Workers',
+        description='Number of tasks, such as image conversions, to run in parallel. 0 uses one per CPU',
+        default=0,
+        min=0
+    )
     
     def draw(self, context):
         layout = self.layout
         layout.prop(self, "collection_name")
+        layout.prop(self, "max_workers")
 
 
 class PHOTOGRAMMETRY_OT_process(bpy.types.Operator):
     bl_idname = "photogrammetry.process"
     bl_label = "Process photogrammetry from current scene settings"
 
+    _timer = None
+    _job = None
+
+    @classmethod
+    def poll(cls, context):
+        return not (jobs.current and jobs.current.running)
+
     def execute(self, context):
         scene = context.scene
         p = scene.photogrammetry
@@ -96,14 +113,125 @@ class PHOTOGRAMMETRY_OT_process(bpy.types.Operator):
         pprint = CroppingPrettyPrinter(maxlist=10, maxdict=10)
         pprint.pprint(data)
         if data:
+            exporter = outputs[p.output]
+            if exporter.background and not bpy.app.background:
+                # writing, converting and running external binaries happens in a background job, polled by a timer
+                self._job = Job(exporter.name, exporter.func, freeze_properties(load_props), data, scene=scene)
+                self._job.start()
+                wm = context.window_manager
+                self._timer = wm.event_timer_add(0.1, window=context.window)
+                wm.modal_handler_add(self)
+                return {'RUNNING_MODAL'}
+
             try:
-                outputs[p.output].func(load_props, data, scene=scene)
+                exporter.func(load_props, data, scene=scene)
             except AttributeError as ex:
                 p.last_error = str(ex)
                 return {'FINISHED'}
 
         return {'FINISHED'}
 
+    def modal(self, context, event):
+        if event.type == 'ESC' and event.value == 'PRESS':
+            self._job.cancel()
+        if event.type != 'TIMER':
+            return {'PASS_THROUGH'}
+
+        self._job.process_main_calls()
+        for window in context.window_manager.windows:
+            for area in window.screen.areas:
+                if area.type == 'PROPERTIES':
+                    area.tag_redraw()
+        if self._job.running:
+            return {'PASS_THROUGH'}
+
+        context.window_manager.event_timer_remove(self._timer)
+        if self._job.state == 'FAILED':
+            context.scene.photogrammetry.last_error = self._job.error
+        elif self._job.state == 'CANCELLED':
+            context.scene.photogrammetry.last_error = 'Processing was cancelled'
+        return {'FINISHED'}
+
+
+class PHOTOGRAMMETRY_OT_cancel(bpy.types.Operator):
+    bl_idname = "photogrammetry.cancel"
+    bl_label = "Cancel photogrammetry processing"
+
+    @classmethod
+    def poll(cls, context):
+        return jobs.current and jobs.current.running
+
+    def execute(self, context):
+        jobs.current.cancel()
+        return {'FINISHED'}
+
+
+class PHOTOGRAMMETRY_OT_load_points(bpy.types.Operator):
+    bl_idname = "photogrammetry.load_points"
+    bl_label = "Load Points"
+    bl_description = "Load the active point cloud again from its PLY file, at a different level of detail or cropped to the bounds of the other selected objects"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    points: IntProperty(name='Points', default=0, min=0, description='Roughly how many points to load, decimated using a voxel grid (0 = every point)')
+    crop: BoolProperty(name='Crop to Selected', default=False, description='Only load points within the bounding box of the other selected objects')
+
+    @classmethod
+    def poll(cls, context):
+        obj = context.active_object
+        return obj and obj.type == 'MESH' and 'photogrammetry_ply' in obj and not (jobs.current and jobs.current.running)
+
+    def invoke(self, context, event):
+        return context.window_manager.invoke_props_dialog(self)
+
+    def execute(self, context):
+        obj = context.active_object
+        filepath = obj['photogrammetry_ply']
+        if not os.path.exists(filepath):
+            self.report({'ERROR'}, f'Point cloud {filepath} no longer exists')
+            return {'CANCELLED'}
+
+        bounds = None
+        if self.crop:
+            # corners of the other selected objects' bounding boxes, in the point cloud's space
+            to_local = obj.matrix_world.inverted()
+            corners = [to_local @ o.matrix_world @ Vector(c) for o in context.selected_objects if o != obj for c in o.bound_box]
+            if not corners:
+                self.report({'ERROR'}, 'Select the objects to crop to along with the point cloud')
+                return {'CANCELLED'}
+            bounds = ([min(c[i] for c in corners) for i in range(3)], [max(c[i] for c in corners) for i in range(3)])
+
+        previous = obj.data
+        obj.data = load_ply_mesh(filepath, name=previous.name, points=self.points, bounds=bounds)
+        if not previous.users:
+            bpy.data.meshes.remove(previous)
+        if len(obj.data.polygons) and (self.points or bounds):
+            self.report({'WARNING'}, f'{os.path.basename(filepath)} has faces, so every point was loaded without decimating or cropping')
+        return {'FINISHED'}
+
+
+class PHOTOGRAMMETRY_OT_create_cameras(bpy.types.Operator):
+    bl_idname = "photogrammetry.create_cameras"
+    bl_label = "Create Cameras"
+    bl_description = "Create camera objects for the vertices selected in edit mode of a mesh of camera instances"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    @classmethod
+    def poll(cls, context):
+        obj = context.active_object
+        return obj and obj.type == 'MESH' and 'photogrammetry_cameras' in obj
+
+    def execute(self, context):
+        # imported here so the addon doesn't depend on the blender exporter importing cleanly
+        from .blender.load import create_selected_cameras
+        obj = context.active_object
+        obj.update_from_editmode()
+        cameras = create_selected_cameras(obj, context.scene.photogrammetry.out_blender, obj.users_collection[0])
+        if not cameras:
+            self.report({'WARNING'}, 'Select the vertices of the cameras to create in edit mode')
+            return {'CANCELLED'}
+        self.report({'INFO'}, f'Created {len(cameras)} cameras')
+        return {'FINISHED'}
+
 
 # # The following class is generated dynamically based on which modules are present with valid binaries
 # # Concept derived from: https://blog.hamaluik.ca/posts/dynamic-blender-properties/
@@ -149,6 +277,16 @@ def draw_master(self, layout):
     layout.separator()
     layout.operator("photogrammetry.process", text='Process')
 
+    job = jobs.current
+    if job and job.running:
+        box = layout.box()
+        for stage, progress in job.stages:
+            progress = f' ({progress:.0%})' if progress is not None else ''
+            box.label(text=f'{stage}{progress}', icon='TIME')
+        for line in list(job.log)[-5:]:
+            box.label(text=line)
+        box.operator("photogrammetry.cancel", text='Cancel')
+
     if self.last_error:
         layout.separator()
         box = layout.box()
@@ -200,6 +338,15 @@ class PHOTOGRAMMETRY_PT_settings(bpy.types.Panel):
         p = context.scene.photogrammetry
         p.draw(layout)
 
+        # point clouds imported from PLY files can be loaded again in more or less detail
+        obj = context.active_object
+        if obj and 'photogrammetry_ply' in obj:
+            layout.separator()
+            layout.operator("photogrammetry.load_points", text=f'Load Points for {obj.name}')
+        if obj and 'photogrammetry_cameras' in obj:
+            layout.separator()
+            layout.operator("photogrammetry.create_cameras", text='Create Cameras for Selected Vertices')
+
 
 classes = list(set([i.property_group for i in inputs.values() if i.property_group] + [o.property_group for o in outputs.values() if o.property_group]))
 classes = classes + [
@@ -207,6 +354,9 @@ classes = classes + [
     PHOTOGRAMMETRY_PG_master,
     PHOTOGRAMMETRY_PT_settings,
     PHOTOGRAMMETRY_OT_process,
+    PHOTOGRAMMETRY_OT_cancel,
+    PHOTOGRAMMETRY_OT_load_points,
+    PHOTOGRAMMETRY_OT_create_cameras,
 ]
 
 
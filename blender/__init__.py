@@ -4,4 +4,4 @@ from .load import load
 from ..utils import PhotogrammetryModule
 
 importer = PhotogrammetryModule('Blender Motion Tracking', 'Use tracking data from current scene', PHOTOGRAMMETRY_PG_input_blender, extract)
-exporter = PhotogrammetryModule('Blender', 'Import data into current scene', PHOTOGRAMMETRY_PG_output_blender, load)
+exporter = PhotogrammetryModule('Blender', 'Import data into current scene', PHOTOGRAMMETRY_PG_output_blender, load, background=False)
@@ -1,7 +1,16 @@
 import bpy
 import os
+import re
+import shutil
+import tempfile
+import subprocess
+import numpy as np
 from math import floor
 from mathutils import Vector, Matrix, Euler
+from ..convert import ConversionCache, convert_images, link_images
+from ..jobs import run_command
+from ..reconstruction import ReconstructionBuilder
+from ..utils import get_binpath_for_module, get_binary_path, get_worker_count
 
 
 def create_render_scene(scene, clip):
@@ -55,13 +64,145 @@ def create_render_scene(scene, clip):
     return sc
 
 
+def get_clip_path(clip, frame):
+    """ Path of the file of an image sequence clip shown on a scene frame """
+    # the first file's number is the clip's first frame
+    path = bpy.path.abspath(clip.filepath)
+    match = re.match(r'^(.*?)(\d+)(\D*)$', os.path.basename(path))
+    if not match:
+        return path
+    head, number, tail = match.groups()
+    number = int(number) + frame - clip.frame_start + clip.frame_offset
+    return os.path.join(os.path.dirname(path), f'{head}{number:0>{len(match.group(2))}}{tail}')
+
+
+def write_frames(properties, scene, export_scene, clip, frames, dirpath):
+    """
+    Writes each scene frame of the clip as <dirpath>/<frame>.jpg, either by rendering it
+    through export_scene or from the clip's own files. Frames already written from the same
+    source with the same settings are skipped.
+    :returns: the filename of each frame
+    """
+    os.makedirs(dirpath, exist_ok=True)
+    filenames = [os.path.join(dirpath, '{0:0>4}.jpg'.format(f)) for f in frames]
+    # sources are hashed too, so a clip replaced by another with the same size and mtime isn't mistaken for it
+    cache = ConversionCache(dirpath, fingerprint=True)
+    source = bpy.path.abspath(clip.filepath)
+
+    if properties.frame_source == 'CLIP' and clip.source == 'SEQUENCE':
+        jobs = [(get_clip_path(clip, f), filename) for f, filename in zip(frames, filenames)]
+        if all(os.path.splitext(path)[1].lower() in ('.jpg', '.jpeg') for path, _ in jobs):
+            link_images(jobs, strategy='HARDLINK', cache=cache)
+        else:
+            convert_images(jobs, workers=get_worker_count(), max_size=max(clip.size), cache=cache)
+        return filenames
+
+    ffmpeg = get_binary_path(get_binpath_for_module(os.path.realpath(__file__)), 'ffmpeg') or shutil.which('ffmpeg')
+    if properties.frame_source == 'CLIP' and clip.source == 'MOVIE' and ffmpeg:
+        # ffmpeg numbers frames from 0
+        params = {'source': 'FFMPEG', 'format': 'JPEG'}
+        outdated = [(f - clip.frame_start + clip.frame_offset, filename) for f, filename in zip(frames, filenames)
+                    if not cache.is_current(source, filename, dict(params, frame=f))]
+        if outdated:
+            extract_movie_frames(ffmpeg, source, outdated)
+            for f, filename in zip(frames, filenames):
+                cache.update([(source, filename)], [filename], dict(params, frame=f))
+            cache.save()
+        return filenames
+
+    if properties.frame_source == 'CLIP':
+        print(f'Unable to read the frames of movie clip "{clip.name}" directly, rendering them instead')
+    params = {'source': 'RENDER', 'format': 'JPEG'}
+    try:
+        for f, filename in zip(frames, filenames):
+            if cache.is_current(source, filename, dict(params, frame=f)):
+                continue
+            # never render through an existing frame, it may be a link to a clip image
+            if os.path.lexists(filename):
+                os.remove(filename)
+            export_scene.frame_set(f)
+            export_scene.render.filepath = filename
+            bpy.ops.render.render(write_still=True, scene=export_scene.name)
+            cache.update([(source, filename)], [filename], dict(params, frame=f))
+    finally:
+        cache.save()
+    return filenames
+
+
+def extract_movie_frames(ffmpeg, movie, frames):
+    """ Decodes a movie once, writing each (frame number, target) of frames as a JPEG """
+    numbers = sorted(n for n, _ in frames)
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(frames[0][1])) as tmp:
+        # select only the frames required, which are written in order as 000001.jpg, 000002.jpg, etc.
+        # the filter is passed as a file as it can be too long for the command line
+        script = os.path.join(tmp, 'select.txt')
+        with open(script, 'w') as f:
+            f.write(f"select='{get_select_expression(numbers)}'")
+        args = [ffmpeg, '-hide_banner', '-nostdin', '-y', '-i', movie, '-filter_script:v', script] + \
+            get_passthrough_args(ffmpeg) + ['-q:v', '1', os.path.join(tmp, '%06d.jpg')]
+        if run_command(args) != 0:
+            raise AttributeError(f'Unable to extract frames from {movie}, see system console for details')
+        targets = dict(frames)
+        for i, n in enumerate(numbers):
+            path = os.path.join(tmp, f'{i + 1:0>6}.jpg')
+            if not os.path.exists(path):
+                raise AttributeError(f'Frame {n} could not be extracted from {movie}')
+            os.replace(path, targets[n])
+
+
+def get_passthrough_args(ffmpeg):
+    """ ffmpeg arguments to write every selected frame once, -vsync being deprecated for -fps_mode from ffmpeg 5.1 """
+    try:
+        output = subprocess.run([ffmpeg, '-hide_banner', '-version'], stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                universal_newlines=True, errors='replace').stdout
+    except OSError:
+        output = ''
+    # development builds are versioned by their commit instead, assume they're recent
+    match = re.search(r'version n?(\d+)\.(\d+)', output)
+    if match and (int(match.group(1)), int(match.group(2))) < (5, 1):
+        return ['-vsync', '0']
+    return ['-fps_mode', 'passthrough']
+
+
+def get_select_expression(numbers):
+    """ ffmpeg select expression for the given sorted frame numbers, as a range when they're evenly spaced """
+    steps = set(np.diff(numbers).tolist())
+    if len(numbers) > 2 and len(steps) == 1:
+        first, last, step = numbers[0], numbers[-1], steps.pop()
+        return f'between(n,{first},{last})*not(mod(n-{first},{step}))'
+    return '+'.join(f'eq(n,{n})' for n in numbers)
+
+
+def get_markers(tracks, frame_range):
+    """
+    Reads the markers of each track within a frame range, without looking them up frame by frame.
+    :returns: (visible, markers) where visible[i, j] is whether tracks[j] has a marker on frame_range[i]
+              and markers[i, j] is its position (0.0...1.0 from bottom left)
+    """
+    visible = np.zeros((len(frame_range), len(tracks)), dtype=bool)
+    markers = np.zeros((len(frame_range), len(tracks), 2))
+    for j, track in enumerate(tracks):
+        count = len(track.markers)
+        frames = np.empty(count, dtype=np.int32)
+        co = np.empty(count * 2, dtype=np.float32)
+        track.markers.foreach_get('frame', frames)
+        track.markers.foreach_get('co', co)
+
+        # index within the frame range of each marker's frame
+        index = (frames - frame_range.start) // frame_range.step
+        inside = (frames >= frame_range.start) & (frames < frame_range.stop) & ((frames - frame_range.start) % frame_range.step == 0)
+        visible[index[inside], j] = True
+        markers[index[inside], j] = co.reshape(count, 2)[inside]
+    return visible, markers
+
+
 def extract(properties, *args, **kwargs):
     """ Prepares a scene for export (including writing frames to <dirpath>).
     :param scene: the scene to export
     :param clip: the movieclip with tracking data
     :param filepath: the target filepath
     :param frame_range: a list of integers representing which frames to export
-    :returns: {
+    :returns: Reconstruction (see reconstruction.py), which can also be read as {
         'resolution': (width, height),
         'trackers': { 
             id<int>: {
@@ -112,7 +253,15 @@ def extract(properties, *args, **kwargs):
 
         tracking = clip.tracking  # tracking contains camera info, default tracker settings, stabilisation info, etc
         cameras = {}
-        active_tracks = []  # contains all bundled trackers active during specified frame range
+
+        # every marker of the bundled tracks (only these can become points) is read in bulk, as
+        # visible[frame index, track index] and its position in markers[frame index, track index]
+        tracks = [track for track in tracking.tracks if track.has_bundle]
+        visible, markers = get_markers(tracks, frame_range)
+
+        # knock out tracks that appear in <2 cameras, then any frames left without tracks
+        visible[:, visible.sum(axis=0) < 2] = False
+        frames = np.flatnonzero(visible.any(axis=1))
 
         # get the global transform for the camera without camera constraint to 
         # project the tracked points bundle into world space
@@ -125,25 +274,12 @@ def extract(properties, *args, **kwargs):
         reconstructed_matrix = reconstruction.cameras.matrix_from_frame(frame=framenr)
         mw = scene.camera.matrix_world @ reconstructed_matrix.inverted()
 
-        for cid, f in enumerate(frame_range):
-            # render each movie clip frame to jpeg still
-            scene.frame_set(f)
-            export_scene.frame_set(f)
-            filename = os.path.join(dirpath, '{0:0>4}.jpg'.format(f))
-            export_scene.render.filepath = filename
-            bpy.ops.render.render(write_still=True, scene=export_scene.name)
-
-            # get the unique tracks at this frame
-            tracks = []
-            for track in tracking.tracks:
-                if track.has_bundle and track.markers.find_frame(f):
-                    tracks.append(track)
-                    if track not in active_tracks:
-                        active_tracks.append(track)
+        # write each movie clip frame with tracks to jpeg still
+        filenames = write_frames(properties, scene, export_scene, clip, [frame_range[cid] for cid in frames.tolist()], dirpath)
 
-            # if no tracks were found at this time, skip the camera
-            if not tracks:
-                continue
+        for cid, filename in zip(frames.tolist(), filenames):
+            f = frame_range[cid]
+            scene.frame_set(f)
 
             # get camera transforms for this frame
             cd = scene.camera.data
@@ -159,62 +295,32 @@ def extract(properties, *args, **kwargs):
                 't': tuple(t),
                 'R': tuple(map(tuple, tuple(R))), # tuple(R) = (Vec3, Vec3, Vec3)
                 'principal': tuple(tracking.camera.principal),
-                'tracks': tracks,
-                'trackers': {},
             })
 
-        # knock out active_tracks that appear in <2 cameras
-        to_remove = []
-        for track in active_tracks:
-            track_cameras = []
-            for camera in cameras.values():
-                if track in camera['tracks']:
-                    track_cameras.append(camera)
-            if len(track_cameras) < 2:
-                to_remove.append(track)
-
-        to_remove_cams = []
-        for track in to_remove:
-            active_tracks.remove(track)
-            # also remove this track from any cameras and if that causes a camera to 
-            # have no more tracks, remove the camera too
-            for cid, camera in cameras.items():
-                if track in camera['tracks']:
-                    camera['tracks'].remove(track)
-                    if not camera['tracks']:
-                        to_remove_cams.append(cid)
-        for cid in to_remove_cams:
-            cameras.pop(cid, None)
+        # points are ordered by the frame each track first appears in
+        active_tracks = np.flatnonzero(visible.any(axis=0))
+        active_tracks = active_tracks[np.lexsort((active_tracks, visible[:, active_tracks].argmax(axis=0)))]
 
         # now build the final reference structure
-        trackers = {}
-        for idx, track in enumerate(active_tracks):
-            trackers[idx] = {
-                'co': tuple(mw @ track.bundle),
-                'rgb': (0, 0, 0),
-                'error': track.average_error,
-            }
-            # loop over every camera that this track is visible in
-            track_cameras = [camera for camera in cameras.values() if track in camera['tracks']]
-            for camera in track_cameras:
-                # The pixel positions are floating point numbers in a coordinate system where the origin is the center of the image, 
-                # the x-axis increases to the right, and the y-axis increases towards the top of the image. Thus, (-w/2, -h/2) is 
-                # the lower-left corner of the image, and (w/2, h/2) is the top-right corner (where w and h are the width and height of the image).
-                # http://www.cs.cornell.edu/~snavely/bundler/bundler-v0.4-manual.html
-                marker = track.markers.find_frame(camera['frame'])
-                camera['trackers'][idx] = tuple(map(lambda i, j: i * j, list(marker.co - voffset), list(clip_size)))
-        
-        # remove helper keys
-        for camera in cameras.values():
-            camera.pop('frame', None)
-            camera.pop('tracks', None)
+        builder = ReconstructionBuilder()
+        for cid, camera in cameras.items():
+            builder.add_camera(cid, camera['filename'], camera['f'], camera['k'], camera['R'], camera['t'], principal=camera['principal'])
+
+        for idx, tid in enumerate(active_tracks.tolist()):
+            track = tracks[tid]
+            builder.add_point(idx, tuple(mw @ track.bundle), (0, 0, 0), track.average_error)
+
+        # every camera that each track is visible in, in camera order
+        # The pixel positions are floating point numbers in a coordinate system where the origin is the center of the image, 
+        # the x-axis increases to the right, and the y-axis increases towards the top of the image. Thus, (-w/2, -h/2) is 
+        # the lower-left corner of the image, and (w/2, h/2) is the top-right corner (where w and h are the width and height of the image).
+        # http://www.cs.cornell.edu/~snavely/bundler/bundler-v0.4-manual.html
+        point_idx, cids = np.nonzero(visible[:, active_tracks].T)
+        xy = (markers[cids, active_tracks[point_idx]] - tuple(voffset)) * tuple(clip_size)
+        builder.add_observations(point_idx, cids, xy)
 
         # return standard format
-        return {
-            'resolution': tuple(map(int, clip_size)),
-            'cameras': cameras,
-            'trackers': trackers,
-        }
+        return builder.build(resolution=tuple(map(int, clip_size)))
 
     except Exception as ex:
         raise ex
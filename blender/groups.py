@@ -8,11 +8,16 @@ class PHOTOGRAMMETRY_PG_input_blender(PropertyGroup):
     clip: StringProperty(name='Movie Clip')
     frame_step: IntProperty(name='Frame Step', description='Number of frames to skip when exporting', default=1, min=1)
     dirpath: StringProperty(name='Image Directory', subtype='DIR_PATH', default=os.path.join('//renderoutput', 'photogrammetry'))
+    frame_source: EnumProperty(items=[
+        ('RENDER', 'Render', 'Render each frame of the movie clip through the compositor'),
+        ('CLIP', 'Clip Files', 'Use the files of an image sequence clip directly, or extract the frames of a movie with ffmpeg (when installed), which is much faster than rendering'),
+    ], name='Frames', default='RENDER', description='How the frames of the movie clip are written to the image directory. Frames already written from the same clip are skipped either way')
     
     def draw(self, layout):
         layout.prop(self, 'dirpath')
         layout.prop_search(self, 'clip', bpy.data, 'movieclips')
         layout.prop(self, 'frame_step')
+        layout.prop(self, 'frame_source', expand=True)
 
 
 class PHOTOGRAMMETRY_PG_output_blender(PropertyGroup):
@@ -23,11 +28,19 @@ class PHOTOGRAMMETRY_PG_output_blender(PropertyGroup):
         ('BACK', 'Back', 'Display image behind the 3D objects'),
         ('FRONT', 'Front', 'Display image in front of the 3D objects'),
     ], name='Camera Background Display', default='BACK')
+    camera_display: EnumProperty(items=[
+        ('OBJECTS', 'Objects', 'Create a camera object for each image'),
+        ('INSTANCES', 'Instances', 'Store cameras as the vertices of a single mesh, drawn as frusta with geometry nodes, which stays responsive with thousands of cameras. Camera objects can be created for selected vertices later (Blender 3.2+)'),
+    ], name='Cameras', default='OBJECTS')
     animate_camera: BoolProperty(name='Create animated camera', description='Create keyframed camera in order of corresponding image names', default=False)
+    animated_only: BoolProperty(name='Only create animated camera', description='Create the animated camera without a camera object for each image, which is much faster for thousands of images', default=False)
 
     def draw(self, layout):
         layout.prop(self, 'update_render_size')
         layout.prop(self, 'relative_paths')
         layout.prop(self, 'camera_alpha')
         layout.prop(self, 'camera_display_depth', expand=True)
+        layout.prop(self, 'camera_display', expand=True)
         layout.prop(self, 'animate_camera')
+        if self.animate_camera:
+            layout.prop(self, 'animated_only')
@@ -1,9 +1,11 @@
 import bpy
 import os
-import bmesh
-from mathutils import Vector, Matrix
+import re
+import numpy as np
 
-from ..utils import set_active_collection, get_image_size, get_prefs
+from ..reconstruction import as_reconstruction
+from ..transforms import matrix_to_euler, camera_centre
+from ..utils import set_active_collection, get_image_size, get_prefs, create_mesh
 
 
 def load(properties, data, *args, **kwargs):
@@ -16,106 +18,243 @@ def load(properties, data, *args, **kwargs):
     collection = set_active_collection(**kwargs)
     camera_collection = set_active_collection(name=f'{prefs.collection_name or "Photogrammetry"}-Cameras', parent=collection, **kwargs)
 
-    resolution = data.get('resolution', None)
-    if not resolution and len(data['cameras']):
-        resolution = get_image_size(next(c for c in data['cameras'].values())['filename'])
+    data = as_reconstruction(data)
+    resolution = data.resolution
+    if not resolution and data.num_cameras:
+        resolution = get_image_size(data.filenames[0])
     if properties.update_render_size:
         scene.render.resolution_x, scene.render.resolution_y = resolution
 
-    animated_camera = None
-    if properties.animate_camera:
+    # every camera's transform and lens, in order of image name
+    order = sorted(range(data.num_cameras), key=lambda i: os.path.basename(data.filenames[i]))
+    filenames = [data.filenames[i] for i in order]
+    names = [os.path.splitext(os.path.basename(f))[0] for f in filenames]
+    # rotation in file needs to be transposed to work properly
+    rotations = matrix_to_euler(np.swapaxes(data.rotation[order], -1, -2)).reshape(-1, 3)
+
+    # https://github.com/simonfuhrmann/mve/wiki/Math-Cookbook
+    # t = -R * c
+    # where c is the real world position as I've calculated, and t is the camera location stored in bundle.out
+    locations = camera_centre(data.rotation[order], data.translation[order]).reshape(-1, 3)
+
+    lenses = (data.focal[order] * 35) / scene.render.resolution_x
+    # https://blender.stackexchange.com/questions/58235/what-are-the-units-for-camera-shift
+    shifts = np.zeros((len(order), 2))
+    if resolution:
+        x, y = resolution
+        principal = data.principal[order]
+        shifts = (np.array([x / 2.0, y / 2.0]) - principal) / float(max(x, y))
+        shifts[np.isnan(shifts)] = 0
+
+    instances = properties.camera_display == 'INSTANCES'
+    if instances and bpy.app.version < (3, 2, 0):
+        print('Camera instances require Blender 3.2 or later, creating camera objects instead')
+        instances = False
+
+    if properties.animate_camera and properties.animated_only:
+        pass
+    elif instances:
+        create_camera_instances(f'{prefs.collection_name or "Photogrammetry"}Cameras', filenames,
+                                locations, rotations, lenses, shifts, resolution, camera_collection)
+    else:
+        for i, name in enumerate(names):
+            create_camera(name, filenames[i], locations[i], rotations[i], lenses[i], shifts[i], properties, camera_collection)
+
+    if properties.animate_camera and len(order) > 0:
         name = 'AnimatedPhotogrammetryCamera'
         cdata = bpy.data.cameras.new(name)
         cdata.sensor_width = 35
         animated_camera = bpy.data.objects.new(name, cdata)
         camera_collection.objects.link(animated_camera)
 
-    ordered_cameras = sorted(data['cameras'].values(), key=lambda c: os.path.basename(c['filename']))
-    for i, camera in enumerate(ordered_cameras):
-        # rotation in file needs to be transposed to work properly
-        mrot = Matrix(camera['R'])
-        mrot.transpose()
-        rotation = mrot.to_euler('XYZ')
-
-        # https://github.com/simonfuhrmann/mve/wiki/Math-Cookbook
-        # t = -R * c
-        # where c is the real world position as I've calculated, and t is the camera location stored in bundle.out
-        translation = -1 * mrot @ Vector(camera['t'])
-        
-        # create and link camera
-        name = os.path.splitext(os.path.basename(camera['filename']))[0]
-        cdata = bpy.data.cameras.new(name)
-        cam = bpy.data.objects.new(name, cdata)
-        camera_collection.objects.link(cam)
-
-        # add background images per camera!
-        cdata.show_background_images = True
-        bg = cdata.background_images.new()
-        image_path = camera['filename']
-        if properties.relative_paths:
-            image_path = bpy.path.relpath(image_path)
-        try:
-            img = bpy.data.images.load(image_path, check_existing=True)
-            bg.image = img
-            bg.alpha = properties.camera_alpha
-            bg.display_depth = properties.camera_display_depth
-        except:
-            pass
+        # only set from the first camera - animating these properties could be trippy
+        cdata.lens = lenses[0]
+        cdata.shift_x, cdata.shift_y = shifts[0]
+        animate(animated_camera, name, {'location': locations, 'rotation_euler': rotations})
+        animated_camera.location = locations[0]
+        animated_camera.rotation_euler = rotations[0]
 
-        # set parameters
-        cam.location = translation
-        cam.rotation_euler = rotation
-        cdata.sensor_width = 35
-        cdata.lens = (camera['f'] * 35) / scene.render.resolution_x
-        if 'principal' in camera:
-            # https://blender.stackexchange.com/questions/58235/what-are-the-units-for-camera-shift
-            x, y = resolution
-            px, py = camera['principal']
-            max_dimension = float(max(x, y))
-            cdata.shift_x = (x / 2.0 - px) / max_dimension
-            cdata.shift_y = (y / 2.0 - py) / max_dimension
-
-        if animated_camera:
-            animated_camera.location = cam.location
-            animated_camera.rotation_euler = cam.rotation_euler
-            animated_camera.keyframe_insert('location', frame=i+1)
-            animated_camera.keyframe_insert('rotation_euler', frame=i+1)
-
-            # only needs to occur for the first camera - animating these properties could be trippy
-            if i == 0:
-                animated_camera.data.lens = cdata.lens
-                animated_camera.data.shift_x = cdata.shift_x
-                animated_camera.data.shift_y = cdata.shift_y
-
-    if animated_camera and len(ordered_cameras) > 0:
-        # attempt to set background movieclip
+        # show the images as a sequence, in the same order as the keyframes
         try:
-            animated_camera.data.show_background_images = True
-            bg = animated_camera.data.background_images.new()
-            bpy.ops.clip.open(directory=os.path.dirname(ordered_cameras[0]['filename']), files=[{'name':os.path.basename(c['filename'])} for c in ordered_cameras])
-            bg.source = 'MOVIE_CLIP'
-            bg.clip = bpy.data.movieclips[os.path.basename(ordered_cameras[0]['filename'])]
+            cdata.show_background_images = True
+            bg = cdata.background_images.new()
+            img = load_image(filenames[0], properties.relative_paths)
+            img.source = 'SEQUENCE'
+            bg.image = img
+            bg.image_user.frame_duration = len(order)
+            bg.image_user.frame_start = 1
+            # the sequence starts from the number in the first image's name
+            number = re.search(r'(\d+)\D*$', os.path.basename(filenames[0]))
+            bg.image_user.frame_offset = int(number.group(1)) - 1 if number else 0
+            bg.image_user.use_auto_refresh = True
             bg.alpha = properties.camera_alpha
             bg.display_depth = properties.camera_display_depth
         except:
             pass
 
-    coords = []
-    for tracker in data['trackers'].values():
-        coords.append(Vector(tracker['co']))
-
-    mesh = bpy.data.meshes.new("PhotogrammetryPoints")
+    # add all points as vertices at once, along with their colours and reprojection errors
+    attributes = {}
+    if not np.isnan(data.errors).all():
+        attributes['error'] = ('FLOAT', data.errors)
+    mesh = create_mesh("PhotogrammetryPoints", data.coords, colours=data.colours, attributes=attributes)
     obj = bpy.data.objects.new("PhotogrammetryPoints", mesh)
 
     collection.objects.link(obj)
     scene.view_layers[0].objects.active = obj
     obj.select_set(True)
 
-    # add all coords from bundler points as vertices
-    bm = bmesh.new()
-    for v in coords:
-        bm.verts.new(v)
 
-    # make the bmesh the object's mesh
-    bm.to_mesh(mesh)  
-    bm.free()
+def create_camera(name, filename, location, rotation, lens, shift, properties, collection):
+    """ Creates a camera object showing its image in the background """
+    cdata = bpy.data.cameras.new(name)
+    cam = bpy.data.objects.new(name, cdata)
+    collection.objects.link(cam)
+
+    # add background images per camera, image datablocks are shared and their pixels only read when displayed
+    cdata.show_background_images = True
+    bg = cdata.background_images.new()
+    try:
+        bg.image = load_image(filename, properties.relative_paths)
+        bg.alpha = properties.camera_alpha
+        bg.display_depth = properties.camera_display_depth
+    except:
+        pass
+
+    # set parameters
+    cam.location = location
+    cam.rotation_euler = rotation
+    cdata.sensor_width = 35
+    cdata.lens = lens
+    cdata.shift_x, cdata.shift_y = shift
+    return cam
+
+
+def create_camera_instances(name, filenames, locations, rotations, lenses, shifts, resolution, collection):
+    """
+    Represents cameras as the vertices of a single mesh, storing their rotation, lens and
+    shift as attributes, and displays them as frusta instanced by geometry nodes. Camera
+    objects can be created for selected vertices with create_selected_cameras.
+    """
+    # frusta are as deep as a camera of the same lens would be drawn with a width of 1
+    scales = np.ones((len(lenses), 3))
+    scales[:, 2] = np.asarray(lenses) / 35
+    mesh = create_mesh(name, locations, attributes={
+        'rotation': ('FLOAT_VECTOR', rotations),
+        'scale': ('FLOAT_VECTOR', scales),
+        'lens': ('FLOAT', lenses),
+        'shift': ('FLOAT_VECTOR', np.c_[shifts, np.zeros(len(shifts))]),
+    })
+    obj = bpy.data.objects.new(name, mesh)
+    obj['photogrammetry_cameras'] = list(filenames)
+    collection.objects.link(obj)
+
+    # a pyramid from the camera to a unit wide image plane, looking down -Z as cameras do
+    aspect = resolution[1] / resolution[0] if resolution else 1.0
+    frustum_mesh = bpy.data.meshes.new(f'{name}Frustum')
+    frustum_mesh.from_pydata(
+        [(0, 0, 0), (-0.5, -0.5 * aspect, -1), (0.5, -0.5 * aspect, -1), (0.5, 0.5 * aspect, -1), (-0.5, 0.5 * aspect, -1), (0, 0.7 * aspect, -1)],
+        [(0, 1), (0, 2), (0, 3), (0, 4), (1, 2), (2, 3), (3, 4), (4, 1), (3, 5), (4, 5)], [])
+    frustum = bpy.data.objects.new(f'{name}Frustum', frustum_mesh)
+
+    # the frustum needs a collection to be evaluated and saved, one that's hidden so only its instances are drawn
+    helpers = bpy.data.collections.new(f'{name}Helpers')
+    helpers.hide_viewport = True
+    helpers.hide_render = True
+    helpers.objects.link(frustum)
+    collection.children.link(helpers)
+
+    modifier = obj.modifiers.new('Cameras', 'NODES')
+    modifier.node_group = create_instancing_node_group(f'{name}Instances', frustum)
+    return obj
+
+
+def create_instancing_node_group(name, instance):
+    """ Geometry nodes instancing an object on each point, rotated and scaled by the rotation and scale attributes """
+    group = bpy.data.node_groups.new(name, 'GeometryNodeTree')
+    if hasattr(group, 'interface'):
+        # Blender 4.0+
+        group.interface.new_socket('Geometry', in_out='INPUT', socket_type='NodeSocketGeometry')
+        group.interface.new_socket('Geometry', in_out='OUTPUT', socket_type='NodeSocketGeometry')
+    else:
+        group.inputs.new('NodeSocketGeometry', 'Geometry')
+        group.outputs.new('NodeSocketGeometry', 'Geometry')
+
+    nodes, links = group.nodes, group.links
+    group_input = nodes.new('NodeGroupInput')
+    group_input.location = (-600, 0)
+    group_output = nodes.new('NodeGroupOutput')
+    group_output.location = (300, 0)
+
+    info = nodes.new('GeometryNodeObjectInfo')
+    info.location = (-400, -100)
+    info.inputs['Object'].default_value = instance
+    instance_on_points = nodes.new('GeometryNodeInstanceOnPoints')
+    links.new(group_input.outputs[0], instance_on_points.inputs['Points'])
+    links.new(info.outputs['Geometry'], instance_on_points.inputs['Instance'])
+
+    for i, (attribute, socket) in enumerate((('rotation', 'Rotation'), ('scale', 'Scale'))):
+        node = nodes.new('GeometryNodeInputNamedAttribute')
+        node.location = (-400, -300 - i * 150)
+        node.data_type = 'FLOAT_VECTOR'
+        node.inputs['Name'].default_value = attribute
+        # the output matching the data type is the only one enabled
+        links.new(next(o for o in node.outputs if o.enabled), instance_on_points.inputs[socket])
+
+    links.new(instance_on_points.outputs['Instances'], group_output.inputs[0])
+    return group
+
+
+def create_selected_cameras(obj, properties, collection):
+    """ Creates camera objects, parented to obj, for the selected vertices of a mesh made by create_camera_instances """
+    mesh = obj.data
+    count = len(mesh.vertices)
+
+    def read(name, key, size):
+        values = np.empty(count * size, dtype=np.float32)
+        mesh.attributes[name].data.foreach_get(key, values)
+        return values.reshape(count, size)
+
+    selected = np.empty(count, dtype=bool)
+    mesh.vertices.foreach_get('select', selected)
+    locations = np.empty(count * 3, dtype=np.float32)
+    mesh.vertices.foreach_get('co', locations)
+    locations = locations.reshape(count, 3)
+    rotations = read('rotation', 'vector', 3)
+    lenses = read('lens', 'value', 1)[:, 0]
+    shifts = read('shift', 'vector', 3)[:, :2]
+
+    cameras = []
+    filenames = obj['photogrammetry_cameras']
+    for i in np.flatnonzero(selected).tolist():
+        name = os.path.splitext(os.path.basename(filenames[i]))[0]
+        cam = create_camera(name, filenames[i], locations[i], rotations[i], lenses[i], shifts[i], properties, collection)
+        cam.parent = obj
+        cameras.append(cam)
+    return cameras
+
+
+def load_image(filename, relative_path=True):
+    if relative_path:
+        filename = bpy.path.relpath(filename)
+    return bpy.data.images.load(filename, check_existing=True)
+
+
+def animate(obj, name, paths):
+    """
+    Keyframes obj on frames 1...n by filling F-curves in bulk, rather than inserting a keyframe at a time.
+    Keyframe points added this way are Bezier with automatic handles, as keyframe_insert would create.
+    :param paths: {data path: (n, k) values of each of its k components}
+    """
+    action = bpy.data.actions.new(name)
+    obj.animation_data_create().action = action
+    for path, values in paths.items():
+        values = np.asarray(values, dtype=np.float32)
+        co = np.empty((len(values), 2), dtype=np.float32)
+        co[:, 0] = np.arange(1, len(values) + 1)
+        for index in range(values.shape[1]):
+            fcurve = action.fcurves.new(path, index=index, action_group='Object Transforms')
+            fcurve.keyframe_points.add(len(values))
+            co[:, 1] = values[:, index]
+            fcurve.keyframe_points.foreach_set('co', co.ravel())
+            fcurve.update()
+    return action
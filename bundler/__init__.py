@@ -1,7 +1,7 @@
 from .extract import extract
-from .groups import PHOTOGRAMMETRY_PG_bundler
+from .groups import PHOTOGRAMMETRY_PG_input_bundler, PHOTOGRAMMETRY_PG_bundler
 from .load import load
 from ..utils import PhotogrammetryModule
 
-importer = PhotogrammetryModule('Bundler', 'Read a Bundler .OUT file and associated images', PHOTOGRAMMETRY_PG_bundler, extract)
+importer = PhotogrammetryModule('Bundler', 'Read a Bundler .OUT file and associated images', PHOTOGRAMMETRY_PG_input_bundler, extract)
 exporter = PhotogrammetryModule('Bundler', 'Output undistorted images and bundle.out file', PHOTOGRAMMETRY_PG_bundler, load)
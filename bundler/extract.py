@@ -1,9 +1,7 @@
 import bpy
 import os
-import shutil
-import subprocess
-from mathutils import Vector, Matrix
-from collections import namedtuple
+import numpy as np
+from ..reconstruction import ReconstructionBuilder
 from ..utils import get_image_size
 
 
@@ -15,7 +13,7 @@ def extract(properties, *args, **kargs):
     dirpath = bpy.path.abspath(properties.dirpath)
     if not dirpath:
         raise AttributeError('Bundler Data Directory must be provided.\nEnsure bundle.out and list.txt exist.')
-    
+
     bundle_path = os.path.join(dirpath, 'bundle.out')
     image_path = os.path.join(dirpath, 'list.txt')
     if not os.path.exists(bundle_path):
@@ -23,63 +21,133 @@ def extract(properties, *args, **kargs):
     if not os.path.exists(image_path):
         raise AttributeError('Bundler Data Directory does not contain list.txt')
 
-    with open(bundle_path, 'r') as f:
-        lines = f.readlines()
-
     with open(image_path, 'r') as f:
         images = f.readlines()  # TODO: make sure focal length is removed if present
 
-    cameras = {}
-    trackers = {}
-    data = {
-        'trackers': trackers,
-        'cameras': cameras
-    }
-
-    total_cameras, total_points = map(int, lines[1].split())
-    for i in range(int(total_cameras)):
-        # each camera uses 5 lines
-        idx = 2 + i * 5
-        # read data
-        focal, k1, k2 = list(map(float, lines[idx].split()))
-        rotation = []
-        rotation.append(map(float, lines[idx + 1].split()))
-        rotation.append(map(float, lines[idx + 2].split()))
-        rotation.append(map(float, lines[idx + 3].split()))
-        translation = Vector(map(float, lines[idx + 4].split()))
-        
-        filename = images[i].strip()
-        if not os.path.isabs(filename) or not os.path.isfile(filename):
-            filename = os.path.join(dirpath, filename)
-
-        # create cameras
-        cameras.setdefault(i, {
-            'filename': filename,
-            'f': focal,
-            'k': (k1, k2, 0),
-            't': tuple(translation),
-            'R': tuple(map(tuple, tuple(rotation))),
-            'trackers': {},
-        })
-        
-        if 'resolution' not in data:
-            data.setdefault('resolution', get_image_size(filename))
-    
-    for i in range(int(total_points)):
-        # each point uses 3 lines
-        idx = 2 + int(total_cameras) * 5 + i * 3
-        trackers.setdefault(i, {
-            'co': tuple(map(float, lines[idx].split())),
-            'rgb': tuple(map(int, lines[idx + 1].split())),
-        })
-        
-        view_list = lines[idx + 2].split()
-        for v in range(int(view_list[0])):
-            vidx = v * 4 + 1
-            cidx = int(view_list[vidx])
-            # sift = int(view_list[vidx + 1])
-            # The origin of the image is the center of the image, the positive x-axis points right, and the positive y-axis points up 
-            # (in addition, in the camera coordinate system, the positive z-axis points backwards, so the camera is looking down the negative z-axis, as in OpenGL)
-            cameras[cidx]['trackers'].setdefault(i, (float(view_list[vidx + 2]), float(view_list[vidx + 3])))
-
-    return data
\ No newline at end of file
+    builder = ReconstructionBuilder()
+    resolution = None
+
+    with open(bundle_path, 'r') as f:
+        tokens = TokenReader(f)
+        total_cameras, total_points = map(int, tokens.take(2))
+
+        # each camera is 15 values: <f> <k1> <k2>, <R> (3 rows), <t>
+        cameras = tokens.take(total_cameras * 15).reshape(total_cameras, 15)
+        for i, camera in enumerate(cameras.tolist()):
+            focal, k1, k2 = camera[0:3]
+            rotation = (tuple(camera[3:6]), tuple(camera[6:9]), tuple(camera[9:12]))
+            translation = tuple(camera[12:15])
+
+            filename = images[i].strip()
+            if not os.path.isabs(filename) or not os.path.isfile(filename):
+                filename = os.path.join(dirpath, filename)
+
+            # create cameras
+            builder.add_camera(i, filename, focal, (k1, k2, 0), rotation, translation)
+
+            if not resolution:
+                resolution = get_image_size(filename)
+
+        read_points(tokens, builder, total_points, max_points=properties.max_points, stride=properties.point_stride)
+
+    return builder.build(resolution=resolution)
+
+
+def read_points(tokens, builder, total_points, max_points=0, stride=1):
+    """
+    Reads the points and their view lists from the token stream into the builder, one
+    buffered chunk at a time. Only every stride'th point is kept, up to max_points (when
+    non-zero), and reading stops as soon as max_points have been kept.
+    """
+    point = 0
+    kept = 0
+    while point < total_points and not (max_points and kept >= max_points):
+        # locate every whole point within the tokens read so far
+        # <position> (3), <colour> (3), <view list> = <count> (<camera> <key> <x> <y>)...
+        buffer, position, end = tokens.buffer, tokens.position, len(tokens.buffer)
+        starts = []
+        while point + len(starts) < total_points and position + 7 <= end:
+            count = int(buffer[position + 6])
+            if count < 0:
+                raise AttributeError('bundle.out contains an invalid view list')
+            if position + 7 + 4 * count > end:
+                break
+            starts.append(position)
+            position += 7 + 4 * count
+
+        if not starts:
+            if not tokens.fill():
+                raise AttributeError('bundle.out ended before all {} points were read'.format(total_points))
+            continue
+        tokens.position = position
+
+        starts = np.array(starts, dtype=np.int64)
+        point_ids = point + np.arange(len(starts))
+        point += len(starts)
+        keep = point_ids % stride == 0
+        starts, point_ids = starts[keep], point_ids[keep]
+        if max_points:
+            starts, point_ids = starts[:max_points - kept], point_ids[:max_points - kept]
+        kept += len(starts)
+
+        headers = buffer[starts[:, None] + np.arange(7)]
+        builder.add_points(point_ids, headers[:, 0:3], headers[:, 3:6])
+
+        # The origin of the image is the center of the image, the positive x-axis points right, and the positive y-axis points up
+        # (in addition, in the camera coordinate system, the positive z-axis points backwards, so the camera is looking down the negative z-axis, as in OpenGL)
+        counts = headers[:, 6].astype(np.int64)
+        offsets = np.concatenate(([0], np.cumsum(counts)))
+        views = np.repeat(starts + 7 - 4 * offsets[:-1], counts) + 4 * np.arange(offsets[-1])
+        builder.add_observations(np.repeat(point_ids, counts), buffer[views].astype(np.int64),
+                                 np.stack((buffer[views + 2], buffer[views + 3]), axis=-1))
+
+
+def read_tokens(fid, chunk_size=1 << 24):
+    """ Yields the whitespace separated numbers of a text stream as float64 arrays, one chunk at a time """
+    remainder = ''
+    while True:
+        text = fid.read(chunk_size)
+        if not text:
+            break
+        text = remainder + text
+        # hold back a trailing token that may continue into the next chunk
+        split = len(text)
+        while split and not text[split - 1].isspace():
+            split -= 1
+        text, remainder = text[:split], text[split:]
+        if text.strip():
+            yield np.fromstring(text, dtype=np.float64, sep=' ')
+    if remainder.strip():
+        yield np.fromstring(remainder, dtype=np.float64, sep=' ')
+
+
+class TokenReader(object):
+    """
+    Buffers the numbers of a bundle.out file so they can be consumed in order without
+    holding more than one chunk of the file in memory. Comment lines at the start of
+    the file (e.g. '# Bundle file v0.3') are skipped.
+    """
+    def __init__(self, fid, chunk_size=1 << 24):
+        line = fid.readline()
+        while line.startswith('#'):
+            line = fid.readline()
+        self._chunks = read_tokens(fid, chunk_size)
+        self.buffer = np.fromstring(line, dtype=np.float64, sep=' ') if line.strip() else np.empty(0)
+        self.position = 0
+
+    def fill(self):
+        """ Appends the next chunk to the unread tokens, returning False at the end of the stream """
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            return False
+        self.buffer = np.concatenate((self.buffer[self.position:], chunk))
+        self.position = 0
+        return True
+
+    def take(self, n):
+        while len(self.buffer) - self.position < n:
+            if not self.fill():
+                raise AttributeError('bundle.out ended unexpectedly')
+        values = self.buffer[self.position:self.position + n]
+        self.position += n
+        return values
@@ -1,9 +1,20 @@
-from bpy.props import StringProperty
+from bpy.props import StringProperty, IntProperty
 from bpy.types import PropertyGroup
 
 
+class PHOTOGRAMMETRY_PG_input_bundler(PropertyGroup):
+    dirpath: StringProperty(name='Bundler Data Directory', subtype='DIR_PATH', default='//bundler')
+    max_points: IntProperty(name='Max Points', default=0, min=0, description='Stop reading after this many points for a quick preview, 0 reads every point')
+    point_stride: IntProperty(name='Point Stride', default=1, min=1, description='Only read every nth point')
+
+    def draw(self, layout):
+        layout.prop(self, 'dirpath')
+        layout.prop(self, 'max_points')
+        layout.prop(self, 'point_stride')
+
+
 class PHOTOGRAMMETRY_PG_bundler(PropertyGroup):
     dirpath: StringProperty(name='Bundler Data Directory', subtype='DIR_PATH', default='//bundler')
-    
+
     def draw(self, layout):
         layout.prop(self, 'dirpath')
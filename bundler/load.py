@@ -1,89 +1,66 @@
 import bpy
 import os
 import shutil
-from math import floor
+import numpy as np
 from pprint import pprint
 
-def convert_image(filepath, target):
-    """ Creates a scene specifically for saving an image as JPG """
-    sc = bpy.data.scenes.new('photogrammetry_helper')
-    try:
-        img = bpy.data.images.load(filepath)
-        r = sc.render
-        r.resolution_x = img.size[0]
-        r.resolution_y = img.size[1]
-        r.resolution_percentage = floor(100 * min(1.0, (3000 / max(r.resolution_x, r.resolution_y))))  # 3000px limit on PMVS
-        r.image_settings.file_format = 'JPEG'
-        r.image_settings.quality = 100
-
-        sc.display_settings.display_device = 'sRGB'
-        img.save_render(target, scene=sc)
-        bpy.data.images.remove(img)
-    finally:
-        # remove the temporary export scene
-        bpy.data.scenes.remove(sc)
-
+from ..reconstruction import as_reconstruction
+from ..textwriter import BufferedTextWriter
+from ..convert import convert_images, ConversionCache
+from ..jobs import call_main
+from ..utils import get_worker_count
 
 def load(properties, data, *args, **kwargs):
     """
     Takes the structure calculated from parsing the input and writes to the bundler file structure
     """
-    dirpath = bpy.path.abspath(properties.dirpath)
+    # relative paths are resolved against the blend file, which can only be read on the main thread
+    dirpath = call_main(bpy.path.abspath, properties.dirpath)
     if not dirpath:
         raise AttributeError('Bundler Data Directory must be provided for output.\nImage files, bundle.out and list.txt will be written to this directory.')
 
-    cameras = data['cameras']
-    camera_keys = list(cameras.keys())
-    trackers = data['trackers']
+    data = as_reconstruction(data)
 
     if not os.path.exists(dirpath):
         os.makedirs(dirpath)
 
     # copy and convert all images into bundler folder
-    for idx, key in enumerate(camera_keys):
-        camera = cameras[key]
-        filepath = camera['filename']
-        target = os.path.join(dirpath, os.path.splitext(os.path.basename(filepath))[0] + '.jpg')
-        convert_image(filepath, target)
-        #shutil.copy(camera['filename'], dirpath)
-        camera['filename'] = os.path.basename(target)
+    targets = [os.path.join(dirpath, os.path.splitext(os.path.basename(filepath))[0] + '.jpg') for filepath in data.filenames]
+    convert_images(zip(data.filenames, targets), workers=get_worker_count(), cache=ConversionCache(dirpath))
+    filenames = [os.path.basename(target) for target in targets]
 
     # write the image list file that corresponds with the camera index in bundle.out
     with open(os.path.join(dirpath, 'list.txt'), 'w+') as f:
-        f.writelines(['{}\n'.format(camera['filename']) for id, camera in cameras.items()])
+        f.writelines(['{}\n'.format(filename) for filename in filenames])
 
     # now write the bundle file
-    sift = 0
-    with open(os.path.join(dirpath, 'bundle.out'), 'w+') as f:
-        f.write('# Bundle file v0.3\n')
-        f.write('{} {}\n'.format(len(cameras.items()), len(trackers.items())))
-        for idx, key in enumerate(camera_keys):
-            camera = cameras[key]
-            f.write('{f} {k[0]} {k[1]}\n'.format(**camera))
-            f.write('{} {} {}\n'.format(*camera['R'][0]))
-            f.write('{} {} {}\n'.format(*camera['R'][1]))
-            f.write('{} {} {}\n'.format(*camera['R'][2]))
-            f.write('{} {} {}\n'.format(*camera['t']))
-        
+    write_bundle(os.path.join(dirpath, 'bundle.out'), data)
+
+
+def write_bundle(path, data):
+    """
+    Writes a Reconstruction as a bundle.out file. Cameras and points are formatted in
+    blocks, and the view list of each point comes straight from the observation index.
+    """
+    with open(path, 'w+') as f, BufferedTextWriter(f) as writer:
+        writer.write('# Bundle file v0.3\n')
+        writer.write('{} {}\n'.format(data.num_cameras, data.num_points))
+        # <f> <k1> <k2>, <R> (3 lines), <t>
+        writer.write_rows('{0} {1[0]} {1[1]}\n'
+                          '{2[0][0]} {2[0][1]} {2[0][2]}\n'
+                          '{2[1][0]} {2[1][1]} {2[1][2]}\n'
+                          '{2[2][0]} {2[2][1]} {2[2][2]}\n'
+                          '{3[0]} {3[1]} {3[2]}\n',
+                          data.focal, data.distortion, data.rotation, data.translation)
+
         # now write the points and corresponding matching cameras
-        for tid, track in trackers.items():
-            f.write('{} {} {}\n'.format(*track['co']))
-            f.write('{} {} {}\n'.format(*track['rgb']))
-            # calculate view list
-            visible_in = {}
-            for key, camera in cameras.items():
-                if tid in camera['trackers']:
-                    visible_in[key] = camera['trackers'][tid]  # visible_in[camera 4]: (x, y)
-            
-            f.write('{count}'.format(count=len(visible_in.items())))
-            for camera_key, co in visible_in.items():
-                # The pixel positions are floating point numbers in a coordinate system where the origin is the center of the image, 
-                # the x-axis increases to the right, and the y-axis increases towards the top of the image. Thus, (-w/2, -h/2) is 
-                # the lower-left corner of the image, and (w/2, h/2) is the top-right corner (where w and h are the width and height of the image).
-                # http://www.cs.cornell.edu/~snavely/bundler/bundler-v0.4-manual.html
-                f.write(' {idx} {sift} {co[0]} {co[1]}'.format(
-                    idx=camera_keys.index(camera_key),
-                    sift=sift,
-                    co=co,))
-                sift += 1
-            f.write('\n')
+        # <position>, <colour>, <view list> = <count> (<camera> <key> <x> <y>)...
+        # The pixel positions are floating point numbers in a coordinate system where the origin is the center of the image, 
+        # the x-axis increases to the right, and the y-axis increases towards the top of the image. Thus, (-w/2, -h/2) is 
+        # the lower-left corner of the image, and (w/2, h/2) is the top-right corner (where w and h are the width and height of the image).
+        # http://www.cs.cornell.edu/~snavely/bundler/bundler-v0.4-manual.html
+        writer.write_ragged('{0[0]} {0[1]} {0[2]}\n{1[0]} {1[1]} {1[2]}\n{2}',
+                            [data.coords, data.colours, data.track_lengths],
+                            ' {0} {1} {2[0]} {2[1]}',
+                            [data.track_cameras, np.arange(data.num_observations), data.track_xy],
+                            data.track_offsets)
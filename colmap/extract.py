@@ -1,12 +1,13 @@
 import bpy
 import os
+import numpy as np
 import shutil
 import subprocess
 from configparser import ConfigParser
-from math import pi
-from mathutils import Quaternion, Vector, Matrix, Euler
 from collections import namedtuple
-from .read_model import read_model
+from .read_model import read_model_arrays
+from ..reconstruction import ReconstructionBuilder
+from ..transforms import quaternion_to_matrix, camera_centre, camera_translation, flip_axes
 from ..utils import get_image_size
 
 
@@ -49,74 +50,49 @@ def extract(properties, *args, **kargs):
     except:
         image_path = os.path.join(dirpath, '..', 'images')
 
-    cameras = {}
-    trackers = {}
-    data = {
-        'trackers': trackers,
-        'cameras': cameras
-    }
+    builder = ReconstructionBuilder()
 
     # https://colmap.github.io/format.html
     try:
-        ccameras, images, points3D = read_model(dirpath, ext=ext)
+        ccameras, images, points3D = read_model_arrays(dirpath, ext=ext)
     except Exception as ex:
         raise AttributeError(f'Error when reading COLMAP workspace directory:\n{str(ex)}')
     
     model = list(ccameras.values())[0]
     resolution = (model.width, model.height)
-    data.setdefault('resolution', resolution)
-    def shift(co):
-        # COLMAP uses the convention that the upper left image corner has coordinate (0, 0)
-        # and the center of the upper left most pixel has coordinate (0.5, 0.5).
-        # Translate the point to the center of the image.
-        return (co[0] - resolution[0] / 2.0 + 0.5,
-                co[1] - resolution[1] / 2.0 + 0.5)
 
-    for idx, i in images.items():
-        camera = ccameras[i.camera_id]
+    # The coordinates of the projection/camera center are given by -R^t * T, 
+    # where R^t is the inverse/transpose of the 3x3 rotation matrix composed
+    # from the quaternion and T is the translation vector. The local camera
+    # coordinate system of an image is defined in a way that the X axis points
+    # to the right, the Y axis to the bottom, and the Z axis to the front as
+    # seen from the image.
+    R = quaternion_to_matrix(images.qvecs)
+    c = camera_centre(R, images.tvecs)
+    R = flip_axes(R)
+    t = camera_translation(R, c)
+
+    for idx, (image_id, camera_id, name) in enumerate(zip(images.ids.tolist(), images.camera_ids.tolist(), images.names)):
+        camera = ccameras[camera_id]
         f, cx, cy = parse_camera_param_list(camera)
-        filename = i.name.strip()
+        filename = name.strip()
         if not os.path.isabs(filename) or not os.path.isfile(filename):
             filename = os.path.join(image_path, filename)
 
-        # The coordinates of the projection/camera center are given by -R^t * T, 
-        # where R^t is the inverse/transpose of the 3x3 rotation matrix composed
-        # from the quaternion and T is the translation vector. The local camera
-        # coordinate system of an image is defined in a way that the X axis points
-        # to the right, the Y axis to the bottom, and the Z axis to the front as
-        # seen from the image.
-        R = Quaternion(i.qvec).to_matrix()
-        R.transpose()
+        builder.add_camera(image_id, filename, f, (0, 0, 0), R[idx], t[idx], principal=(cx, cy))
 
-        # c = -R^T t
-        T = Vector(i.tvec)
-        c = -1 * R @ T
+    builder.add_points(points3D.ids, points3D.xyz, points3D.rgb, points3D.error)
 
-        # t = -R * c
-        R.transpose()
-        R.rotate(Euler((pi, 0, 0)))
-        t = -1 * R @ c
+    # observations come straight from the 2D points of every image that reference a 3D point
+    image_ids = np.repeat(images.ids, np.diff(images.point2D_offsets))
+    observed = np.isin(images.point3D_ids, points3D.ids)
+    # COLMAP uses the convention that the upper left image corner has coordinate (0, 0)
+    # and the center of the upper left most pixel has coordinate (0.5, 0.5).
+    # Translate the point to the center of the image.
+    xys = images.xys[observed] - (resolution[0] / 2.0 - 0.5, resolution[1] / 2.0 - 0.5)
+    builder.add_observations(images.point3D_ids[observed], image_ids[observed], xys)
 
-        cameras.setdefault(idx, {
-            'filename': filename,
-            'f': f,
-            'k': (0, 0, 0),
-            't': tuple(t),
-            'principal': (cx, cy),
-            'R': tuple(map(tuple, tuple(R))),
-            'trackers': {i.point3D_ids[tidx]: shift(i.xys[tidx])
-                         for tidx in range(len(i.xys))
-                         if i.point3D_ids[tidx] >= 0},
-        })
-
-    for idx, p in points3D.items():
-        trackers.setdefault(idx, {
-            'co': tuple(p.xyz),
-            'rgb': tuple(p.rgb),
-            'error': p.error,
-        })
-
-    return data
+    return builder.build(resolution=resolution)
 
 
 # https://github.com/SBCV/Blender-Addon-Photogrammetry-Importer/blob/4145f821b292b4cfae805c7cc1bdd5fc5af299d0/photogrammetry_importer/file_handler/colmap_file_handler.py#L37
@@ -1,4 +1,4 @@
-from bpy.props import StringProperty, BoolProperty, IntProperty, FloatProperty, PointerProperty
+from bpy.props import StringProperty, BoolProperty, IntProperty, FloatProperty, PointerProperty, EnumProperty
 from bpy.types import PropertyGroup
 from ..utils import osname
 
@@ -34,8 +34,19 @@ class PHOTOGRAMMETRY_PG_input_colmap(PropertyGroup):
 class PHOTOGRAMMETRY_PG_output_colmap(PropertyGroup):
     dirpath: StringProperty(name='Workspace Directory', subtype='DIR_PATH', default='//colmap')
     overwrite: BoolProperty(name='Overwrite Workspace Directory', default=True, description='If the workspace directory exists, all existing COLMAP files will be deleted. If you have already run dense reconstruction and only want to generate meshes, do not overwrite the workspace directory')
+    model_format: EnumProperty(items=[
+        ('.bin', 'Binary', 'Write the sparse model as cameras.bin, images.bin and points3D.bin'),
+        ('.txt', 'Text', 'Write the sparse model as cameras.txt, images.txt and points3D.txt'),
+    ], name='Sparse Model Format', default='.bin', description='File format of the sparse model written to the workspace. Binary models are smaller and faster to write and for COLMAP to read')
+    link_strategy: EnumProperty(items=[
+        ('HARDLINK', 'Hardlink', 'Hardlink source images into the workspace, using no extra disk space'),
+        ('REFLINK', 'Reflink', 'Clone source images into the workspace as copy-on-write files, on filesystems that support it (Btrfs, XFS, APFS)'),
+        ('SYMLINK', 'Symlink', 'Symlink source images into the workspace'),
+        ('COPY', 'Copy', 'Copy source images into the workspace'),
+    ], name='Images', default='HARDLINK', description='How source images are placed into the workspace images directory. Links fall back to copying when they can\'t be made, e.g. across filesystems')
     max_image_size: IntProperty(name='Max Image Size', subtype='PIXEL', default=0, min=0, description='If you run out of GPU memory during reconstruction, you can reduce the maximum image size by setting this option (0px = no limit)')
     import_points: BoolProperty(name='Reconstruct point cloud', default=True, description='If false, just export COLMAP sparse model without reconstructing. If one of the mesh options are chosen, dense reconstruction will occur regardless')
+    preview_points: IntProperty(name='Preview Points', default=0, min=0, description='Import the point cloud as a decimated preview of roughly this many points, leaving the full reconstruction on disk to load on demand (0 = every point)')
     import_poisson: BoolProperty(name='Create poisson mesh', default=False, description='Run poisson_mesher on the dense reconstruction and import the resulting mesh')
     import_delaunay: BoolProperty(name='Create delaunay mesh', default=False, description='Run delaunay_mesher on the dense reconstruction and import the resulting mesh')
     import_openmvs: BoolProperty(name='Create openMVS textured mesh', default=False, description='Run openMVS on COLMAP dense reconstruction and import the resulting textured mesh')
@@ -43,11 +54,15 @@ class PHOTOGRAMMETRY_PG_output_colmap(PropertyGroup):
     def draw(self, layout):
         layout.prop(self, 'dirpath')
         layout.prop(self, 'overwrite')
+        layout.prop(self, 'model_format', expand=True)
+        layout.prop(self, 'link_strategy')
         layout.prop(self, 'max_image_size')
 
         # allow colmap to export it's format 
         if osname == 'windows':
             layout.prop(self, 'import_points')
+            if self.import_points:
+                layout.prop(self, 'preview_points')
             layout.prop(self, 'import_poisson')
             layout.prop(self, 'import_delaunay')
             layout.prop(self, 'import_openmvs')
@@ -5,12 +5,16 @@ import shutil
 import platform
 
 import bpy
-from math import pi
-from mathutils import Matrix, Vector, Euler
+import numpy as np
 
+from ..reconstruction import as_reconstruction
+from ..convert import link_images, ConversionCache
+from ..jobs import call_main
+from ..stages import Stage, StageGraph
+from ..transforms import matrix_to_quaternion, camera_centre, camera_translation, flip_axes
 from ..openmvs.utils import interface_colmap, reconstruct_mesh, texture_mesh
-from ..utils import set_active_collection, get_binpath_for_module, get_binary_path, get_image_size, get_dominant_colours
-from .read_model import Camera, Image, Point3D
+from ..utils import set_active_collection, get_binpath_for_module, get_binary_path, get_image_size, get_dominant_colours, get_worker_count, import_ply
+from .read_model import Camera, ImagesArrays, Points3DArrays
 from .write_model import write_model
 
 """
@@ -59,7 +63,8 @@ TextureMesh.exe --working-folder C:\..\workspace\mvs\ colmap_mesh.mvs --export-t
 """
 
 def load(properties, data, *args, **kwargs):
-    dirpath = bpy.path.abspath(properties.dirpath)
+    # relative paths are resolved against the blend file, which can only be read on the main thread
+    dirpath = call_main(bpy.path.abspath, properties.dirpath)
     if not dirpath:
         raise AttributeError('COLMAP Workspace Directory must be provided for output')
 
@@ -73,66 +78,72 @@ def load(properties, data, *args, **kwargs):
             'DATASET_PATH': dirpath
         })
 
+    data = as_reconstruction(data)
+    offsets, order = data.camera_tracks()
+    track_points = data.track_points
+
     # convert our representation to the COLMAP model format
+    # images are kept when overwriting as they're synced with the conversion cache below
     for path in ['images', 'sparse', 'dense']:
         path = os.path.join(dirpath, path)
-        if overwrite and os.path.exists(path):
+        if overwrite and os.path.exists(path) and os.path.basename(path) != 'images':
             shutil.rmtree(path)
             while os.path.exists(path):
                 pass
         if not os.path.exists(path):
             os.makedirs(path)
 
-    txt_model_files = set(['cameras.txt', 'images.txt', 'points3D.txt'])
+    model_files = set([f'cameras{properties.model_format}', f'images{properties.model_format}', f'points3D{properties.model_format}'])
     bin_model_files = set(['cameras.bin', 'images.bin', 'points3D.bin'])
-    if txt_model_files != set(os.listdir(os.path.join(dirpath, 'sparse'))).intersection(txt_model_files):
+    if model_files != set(os.listdir(os.path.join(dirpath, 'sparse'))).intersection(model_files):
+        resolution = data.resolution or (0, 0)
         cameras = []
-        images = []
-        points3D = []
-        for cid, camera in data['cameras'].items():
+        names = []
+        for cid in data.camera_ids.tolist():
+            camera = data['cameras'][cid]
             if not cameras:
-                resolution = data.get('resolution', None)
-                if not resolution:
+                if not any(resolution):
                     resolution = get_image_size(camera['filename'])
                 # PINHOLE params: [fx, fy, cx, cy]
                 # params = [camera['f'], camera['f']] + list(camera.get('principal', tuple(map(lambda a: a / 2.0, resolution))))
                 # RADIAL params: [f, cx, cy, k1, k2]
                 params = [camera['f'], ] + list(camera.get('principal', tuple(map(lambda a: a / 2.0, resolution)))) + (list(camera.get('k', [])) + [0, 0])[:2]
-                cameras.append(Camera(1, 'RADIAL', resolution[0], resolution[1], params))
-
-            R = Matrix(camera['R'])
-            t = Vector(camera['t'])
-            R.transpose()
-            c = -1 * R @ t
-            R.transpose()
-            R.rotate(Euler((pi, 0, 0)))
-            T = -1 * R @ c
-            qvec = tuple(R.to_quaternion())
-            tvec = tuple(T)
-
-            xys = []
-            point3D_ids = []
-            for tid, tracker in camera['trackers'].items():
-                co = list(tracker)
-                co[0] = co[0] + resolution[0] / 2.0 - 0.5
-                co[1] = co[1] + resolution[1] / 2.0 - 0.5
-                xys.append(co)
-                point3D_ids.append(tid)
-            filename = os.path.basename(camera['filename'])
-            shutil.copy(camera['filename'], os.path.join(dirpath, 'images', filename))
-            images.append(Image(cid, qvec, tvec, 1, filename, xys, point3D_ids))
-
-        for tid, tracker in data['trackers'].items():
-            image_ids = []
-            point2D_idxs = []
-            # find all the cameras that reference this 3D point
-            for cid, camera in data['cameras'].items():
-                if tid in camera['trackers']:
-                    image_ids.append(cid)
-                    point2D_idxs.append(list(camera['trackers'].keys()).index(tid))
-            points3D.append(Point3D(tid, tracker['co'], tracker['rgb'], tracker.get('error', 0.0), image_ids, point2D_idxs))
-
-        write_model(os.path.join(dirpath, 'sparse'), '.txt', cameras, images, points3D)
+                cameras = [Camera(1, 'RADIAL', resolution[0], resolution[1], params)]
+
+            names.append(os.path.basename(camera['filename']))
+
+        # back into COLMAP's convention, keeping each camera centre where it was
+        R = flip_axes(data.rotation)
+        tvecs = camera_translation(R, camera_centre(data.rotation, data.translation))
+
+        # only link or copy images that have changed since the last export, and when overwriting remove any that are no longer used
+        link_images([(filename, os.path.join(dirpath, 'images', name)) for filename, name in zip(data.filenames, names)], strategy=properties.link_strategy, cache=ConversionCache(dirpath))
+        if overwrite:
+            for name in set(os.listdir(os.path.join(dirpath, 'images'))).difference(names):
+                os.remove(os.path.join(dirpath, 'images', name))
+
+        # the observations seen by each camera come from the camera-major view of the observation index
+        images = ImagesArrays(
+            ids=data.camera_ids,
+            qvecs=matrix_to_quaternion(R).reshape(-1, 4),
+            tvecs=tvecs.reshape(-1, 3),
+            camera_ids=np.ones(data.num_cameras, dtype=np.int64),
+            names=names,
+            point2D_offsets=offsets,
+            xys=data.track_xy[order] + (resolution[0] / 2.0 - 0.5, resolution[1] / 2.0 - 0.5),
+            point3D_ids=data.point_ids[track_points[order]])
+
+        # each point's track comes straight from the observation index
+        points3D = Points3DArrays(
+            ids=data.point_ids,
+            xyz=data.coords,
+            rgb=data.colours,
+            error=np.where(np.isnan(data.errors), 0.0, data.errors),
+            track_offsets=data.track_offsets,
+            image_ids=data.camera_ids[data.track_cameras],
+            point2D_idxs=get_point2D_idxs(data))
+
+        write_model(os.path.join(dirpath, 'sparse'), properties.model_format, cameras, images, points3D)
 
     # exit if we're not asked to perform dense reconstruction
     if not (properties.import_points or properties.import_poisson or properties.import_delaunay or properties.import_openmvs):
@@ -150,110 +161,132 @@ def load(properties, data, *args, **kwargs):
 
     # for linux, where we don't have a colmap binary, generate a script instead
     generate_shell_script = not colmap_path
-    shell_script = []
     if generate_shell_script:
         colmap_path = '$COLMAP_PATH'
 
+    # each stage declares the files it reads and writes, so it's only run again when its command or inputs change
     # image_undistorter, patch_match_stereo and stereo_fusion required for dense reconstruction
-    try:
-        reconstruct = set(os.listdir(os.path.join(dirpath, 'images'))) != set(os.listdir(os.path.join(dense_path, 'images'))) or bin_model_files != set(os.listdir(os.path.join(dense_path, 'sparse'))).intersection(bin_model_files)
-    except FileNotFoundError:
-        reconstruct = True
-    
-    if reconstruct:
-        args = [
+    images_path = os.path.join(dirpath, 'images')
+    dense_images_path = os.path.join(dense_path, 'images')
+    dense_sparse_path = os.path.join(dense_path, 'sparse')
+    dense_bin_model = [os.path.join(dense_sparse_path, f) for f in sorted(bin_model_files)]
+    depth_maps_path = os.path.join(dense_path, 'stereo', 'depth_maps')
+    normal_maps_path = os.path.join(dense_path, 'stereo', 'normal_maps')
+    stages = [
+        Stage('image_undistorter', [
             colmap_path,
             'image_undistorter',
-            '--image_path', os.path.join(dirpath, 'images'),
+            '--image_path', images_path,
             '--input_path', sparse_path,
             '--output_path', dense_path,
             '--output_type', 'COLMAP',
-        ] + (['--max_image_size', str(properties.max_image_size)] if properties.max_image_size > 0 else [])
-        shell_script.append(args)
-
-        args = [
+        ] + (['--max_image_size', str(properties.max_image_size)] if properties.max_image_size > 0 else []),
+            inputs=[images_path, sparse_path], outputs=[dense_images_path] + dense_bin_model),
+        Stage('patch_match_stereo', [
             colmap_path,
             'patch_match_stereo',
             '--workspace_path', dense_path,
-        ]
-        shell_script.append(args)
-
-        args = [
+        ], inputs=[dense_images_path] + dense_bin_model, outputs=[depth_maps_path, normal_maps_path]),
+        Stage('stereo_fusion', [
             colmap_path,
             'stereo_fusion',
             '--workspace_path', dense_path,
             '--output_path', point_cloud_path,
-        ]
-        shell_script.append(args)
-    
-    if properties.import_poisson and (overwrite or not os.path.exists(poisson_mesh_path)):
-        args = [
+        ], inputs=[depth_maps_path, normal_maps_path], outputs=[point_cloud_path]),
+    ]
+
+    if properties.import_poisson:
+        stages.append(Stage('poisson_mesher', [
             colmap_path,
             'poisson_mesher',
             '--input_path', point_cloud_path,
             '--output_path', poisson_mesh_path,
-        ]
-        shell_script.append(args)
+        ], inputs=[point_cloud_path], outputs=[poisson_mesh_path]))
     
-    if properties.import_delaunay and (overwrite or not os.path.exists(delaunay_mesh_path)):
-        args = [
+    if properties.import_delaunay:
+        stages.append(Stage('delaunay_mesher', [
             colmap_path,
             'delaunay_mesher',
             '--input_path', dense_path,
             '--output_path', delaunay_mesh_path,
-        ]
-        shell_script.append(args)
+        ], inputs=[point_cloud_path] + dense_bin_model, outputs=[delaunay_mesh_path]))
 
-    if properties.import_openmvs and (overwrite or not os.path.exists(openmvs_mesh_path)):
+    if properties.import_openmvs:
         # convert the dense model into TXT format as openMVS only supports TXT
         # --input_path C:\...\workspace\dense\sparse --output_path C:\...\workspace\dense\sparse --output_type TXT
-        args = [
+        dense_txt_model = [os.path.join(dense_sparse_path, f) for f in ['cameras.txt', 'images.txt', 'points3D.txt']]
+        stages.append(Stage('model_converter', [
             colmap_path,
             'model_converter',
-            '--input_path', os.path.join(dense_path, 'sparse'),
-            '--output_path', os.path.join(dense_path, 'sparse'),
+            '--input_path', dense_sparse_path,
+            '--output_path', dense_sparse_path,
             '--output_type', 'TXT'
-        ]
-        shell_script.append(args)
+        ], inputs=dense_bin_model, outputs=dense_txt_model))
         
         # calculate a dominant colour in the first image to use as the empty colour when texturing
         empty_colour = None
         try:
             print('Calculating dominant colour from first image...')
-            img = bpy.data.images.load(next(v for v in data['cameras'].values())['filename'])
-            # get_dominant_colours = [ ((r,g,b), count), ... ]
-            empty_colour = max(get_dominant_colours(img), key=lambda i: i[1])[0]
+            empty_colour = call_main(get_empty_colour, data.filenames[0])
             print(empty_colour)
-            bpy.data.images.remove(img)
         except Exception as ex:
             # skip empty colour
             print('Could not determine domininant colour:', ex)
             pass
 
         # now that the model has been converted, run openMVS stages
-        shell_script.append(interface_colmap(openmvs_workspace, dense_path, os.path.join(openmvs_workspace, 'scene.mvs'), execute=False))
-        shell_script.append(reconstruct_mesh(openmvs_workspace, execute=False))
-        shell_script.append(texture_mesh(openmvs_workspace, empty_colour=empty_colour, execute=False))
+        scene_path = os.path.join(openmvs_workspace, 'scene.mvs')
+        scene_mesh_path = os.path.join(openmvs_workspace, 'scene_mesh.mvs')
+        stages.append(Stage('InterfaceCOLMAP', interface_colmap(openmvs_workspace, dense_path, scene_path, execute=False),
+                            inputs=dense_txt_model + [dense_images_path, depth_maps_path], outputs=[scene_path]))
+        stages.append(Stage('ReconstructMesh', reconstruct_mesh(openmvs_workspace, execute=False),
+                            inputs=[scene_path], outputs=[scene_mesh_path]))
+        stages.append(Stage('TextureMesh', texture_mesh(openmvs_workspace, empty_colour=empty_colour, execute=False),
+                            inputs=[scene_mesh_path], outputs=[openmvs_mesh_path]))
+
+    for stage in stages:
+        stage.env = env
+    graph = StageGraph(stages, os.path.join(dirpath, '.stages.json'))
 
     if generate_shell_script:
         with open(os.path.join(dirpath, 'script.sh'), 'w') as f:
-            f.writelines([subprocess.list2cmdline(args) + os.linesep for args in shell_script])
+            f.writelines([subprocess.list2cmdline(stage.args) + os.linesep for stage in graph.outdated()])
     else:
-        for cmd_args in shell_script:
-            print(subprocess.list2cmdline(cmd_args))
-            retcode = subprocess.call(cmd_args, env=env)
-            if retcode != 0:
-                raise Exception('Command failed, see system console for details')
+        graph.run(workers=get_worker_count())
+
+        call_main(import_results, properties, point_cloud_path, poisson_mesh_path, delaunay_mesh_path, openmvs_mesh_path, **kwargs)
 
-        set_active_collection(**kwargs)
-        if properties.import_points and os.path.exists(point_cloud_path):
-            bpy.ops.import_mesh.ply(filepath=point_cloud_path)
+def get_point2D_idxs(data):
+    """
+    POINT2D_IDX of each observation, which is its position within the camera's block of the
+    camera-major view of the observation index (the same order each image's xys are written in)
+    """
+    offsets, order = data.camera_tracks()
+    point2D_idxs = np.empty(data.num_observations, dtype=np.int64)
+    point2D_idxs[order] = np.arange(data.num_observations) - np.repeat(offsets[:-1], np.diff(offsets))
+    return point2D_idxs
 
-        if properties.import_poisson and os.path.exists(poisson_mesh_path):
-            bpy.ops.import_mesh.ply(filepath=poisson_mesh_path)
 
-        if properties.import_delaunay and os.path.exists(delaunay_mesh_path):
-            bpy.ops.import_mesh.ply(filepath=delaunay_mesh_path)
+def import_results(properties, point_cloud_path, poisson_mesh_path, delaunay_mesh_path, openmvs_mesh_path, **kwargs):
+    collection = set_active_collection(**kwargs)
+    if properties.import_points and os.path.exists(point_cloud_path):
+        import_ply(point_cloud_path, collection=collection, points=properties.preview_points)
 
-        if properties.import_openmvs and os.path.exists(openmvs_mesh_path):
-            bpy.ops.import_scene.obj(filepath=openmvs_mesh_path, axis_forward='Y', axis_up='Z')
+    if properties.import_poisson and os.path.exists(poisson_mesh_path):
+        import_ply(poisson_mesh_path, collection=collection)
+
+    if properties.import_delaunay and os.path.exists(delaunay_mesh_path):
+        import_ply(delaunay_mesh_path, collection=collection)
+
+    if properties.import_openmvs and os.path.exists(openmvs_mesh_path):
+        bpy.ops.import_scene.obj(filepath=openmvs_mesh_path, axis_forward='Y', axis_up='Z')
+
+
+def get_empty_colour(filename):
+    img = bpy.data.images.load(filename)
+    try:
+        # get_dominant_colours = [ ((r,g,b), count), ... ]
+        colours = get_dominant_colours(img)
+        return max(colours, key=lambda i: i[1])[0] if colours else None
+    finally:
+        bpy.data.images.remove(img)
@@ -49,6 +49,24 @@ class Image(BaseImage):
     def qvec2rotmat(self):
         return qvec2rotmat(self.qvec)
 
+# Flat array representations of a whole model. The 2D points of image i are
+# xys[point2D_offsets[i]:point2D_offsets[i + 1]] and the track of point j is
+# image_ids/point2D_idxs[track_offsets[j]:track_offsets[j + 1]].
+ImagesArrays = collections.namedtuple(
+    "ImagesArrays", ["ids", "qvecs", "tvecs", "camera_ids", "names",
+                     "point2D_offsets", "xys", "point3D_ids"])
+Points3DArrays = collections.namedtuple(
+    "Points3DArrays", ["ids", "xyz", "rgb", "error",
+                       "track_offsets", "image_ids", "point2D_idxs"])
+
+# fixed-size record headers as stored in images.bin and points3D.bin
+IMAGE_HEADER_DTYPE = np.dtype([
+    ("id", "<i4"), ("qvec", "<f8", 4), ("tvec", "<f8", 3), ("camera_id", "<i4")])
+POINT2D_DTYPE = np.dtype([("xy", "<f8", 2), ("point3D_id", "<i8")])
+POINT3D_HEADER_DTYPE = np.dtype([
+    ("id", "<u8"), ("xyz", "<f8", 3), ("rgb", "u1", 3), ("error", "<f8"),
+    ("track_length", "<u8")])
+
 
 CAMERA_MODELS = {
     CameraModel(model_id=0, model_name="SIMPLE_PINHOLE", num_params=3),
@@ -65,6 +83,8 @@ CAMERA_MODELS = {
 }
 CAMERA_MODEL_IDS = dict([(camera_model.model_id, camera_model) \
                          for camera_model in CAMERA_MODELS])
+CAMERA_MODEL_NAMES = dict([(camera_model.model_name, camera_model) \
+                           for camera_model in CAMERA_MODELS])
 
 
 def read_next_bytes(fid, num_bytes, format_char_sequence, endian_character="<"):
@@ -165,39 +185,53 @@ def read_images_text(path):
     return images
 
 
+def read_images_binary_arrays(path_to_model_file):
+    """
+    Reads images.bin into flat arrays (see ImagesArrays). The file is memory-mapped
+    and the 2D points of each image are decoded with a single structured read.
+    """
+    buf = np.memmap(path_to_model_file, dtype=np.uint8, mode="r")
+    raw = memoryview(buf)
+    num_reg_images = struct.unpack_from("<Q", raw, 0)[0]
+    headers = np.empty(num_reg_images, dtype=IMAGE_HEADER_DTYPE)
+    names = []
+    point2D_offsets = np.zeros(num_reg_images + 1, dtype=np.int64)
+    points2D = []
+    offset = 8
+    for image_index in range(num_reg_images):
+        headers[image_index] = np.frombuffer(buf, dtype=IMAGE_HEADER_DTYPE,
+                                             count=1, offset=offset)[0]
+        offset += IMAGE_HEADER_DTYPE.itemsize
+        end, window = -1, 256
+        while end < 0:   # look for the ASCII 0 entry
+            if offset + window // 2 > len(buf):
+                raise ValueError("Unterminated image name in {}".format(path_to_model_file))
+            end = bytes(raw[offset:offset + window]).find(b"\x00")
+            window *= 2
+        names.append(bytes(raw[offset:offset + end]).decode("utf-8"))
+        offset += end + 1
+        num_points2D = struct.unpack_from("<Q", raw, offset)[0]
+        offset += 8
+        points2D.append(np.frombuffer(buf, dtype=POINT2D_DTYPE,
+                                      count=num_points2D, offset=offset))
+        point2D_offsets[image_index + 1] = point2D_offsets[image_index] + num_points2D
+        offset += POINT2D_DTYPE.itemsize * num_points2D
+    points2D = np.concatenate(points2D) if points2D else np.zeros(0, dtype=POINT2D_DTYPE)
+    return ImagesArrays(
+        ids=headers["id"].astype(np.int64), qvecs=headers["qvec"],
+        tvecs=headers["tvec"], camera_ids=headers["camera_id"].astype(np.int64),
+        names=names, point2D_offsets=point2D_offsets,
+        xys=np.ascontiguousarray(points2D["xy"]),
+        point3D_ids=np.ascontiguousarray(points2D["point3D_id"]))
+
+
 def read_images_binary(path_to_model_file):
     """
     see: src/base/reconstruction.cc
         void Reconstruction::ReadImagesBinary(const std::string& path)
         void Reconstruction::WriteImagesBinary(const std::string& path)
     """
-    images = {}
-    with open(path_to_model_file, "rb") as fid:
-        num_reg_images = read_next_bytes(fid, 8, "Q")[0]
-        for image_index in range(num_reg_images):
-            binary_image_properties = read_next_bytes(
-                fid, num_bytes=64, format_char_sequence="idddddddi")
-            image_id = binary_image_properties[0]
-            qvec = np.array(binary_image_properties[1:5])
-            tvec = np.array(binary_image_properties[5:8])
-            camera_id = binary_image_properties[8]
-            image_name = ""
-            current_char = read_next_bytes(fid, 1, "c")[0]
-            while current_char != b"\x00":   # look for the ASCII 0 entry
-                image_name += current_char.decode("utf-8")
-                current_char = read_next_bytes(fid, 1, "c")[0]
-            num_points2D = read_next_bytes(fid, num_bytes=8,
-                                           format_char_sequence="Q")[0]
-            x_y_id_s = read_next_bytes(fid, num_bytes=24*num_points2D,
-                                       format_char_sequence="ddq"*num_points2D)
-            xys = np.column_stack([tuple(map(float, x_y_id_s[0::3])),
-                                   tuple(map(float, x_y_id_s[1::3]))])
-            point3D_ids = np.array(tuple(map(int, x_y_id_s[2::3])))
-            images[image_id] = Image(
-                id=image_id, qvec=qvec, tvec=tvec,
-                camera_id=camera_id, name=image_name,
-                xys=xys, point3D_ids=point3D_ids)
-    return images
+    return images_from_arrays(read_images_binary_arrays(path_to_model_file))
 
 
 def read_points3D_text(path):
@@ -227,36 +261,120 @@ def read_points3D_text(path):
     return points3D
 
 
+def read_points3D_binary_arrays(path_to_model_file, chunk_size=1 << 16):
+    """
+    Reads points3D.bin into flat arrays (see Points3DArrays). Records are variable
+    length, so a single pass over the track lengths locates every record, then the
+    fixed-size headers and the track elements are decoded in bulk, chunk by chunk,
+    from the memory-mapped file.
+    """
+    buf = np.memmap(path_to_model_file, dtype=np.uint8, mode="r")
+    raw = memoryview(buf)
+    num_points = struct.unpack_from("<Q", raw, 0)[0]
+    header_size = POINT3D_HEADER_DTYPE.itemsize
+    length_offset = POINT3D_HEADER_DTYPE.fields["track_length"][1]
+
+    # locate each record from the track length stored in the previous header
+    unpack_length = struct.Struct("<Q").unpack_from
+    starts = [0] * num_points
+    offset = 8
+    for point_index in range(num_points):
+        starts[point_index] = offset
+        offset += header_size + 8 * unpack_length(raw, offset + length_offset)[0]
+    starts = np.array(starts, dtype=np.int64)
+    ends = np.append(starts[1:], offset)
+
+    headers = np.empty(num_points, dtype=POINT3D_HEADER_DTYPE)
+    tracks = []
+    header_bytes = np.arange(header_size)
+    for first in range(0, num_points, chunk_size):
+        last = min(first + chunk_size, num_points)
+        block = np.asarray(buf[starts[first]:ends[last - 1]])
+        positions = (starts[first:last] - starts[first])[:, np.newaxis] + header_bytes
+        headers[first:last] = block[positions].view(POINT3D_HEADER_DTYPE).ravel()
+        # everything in the block that isn't a header belongs to a track
+        is_track = np.ones(len(block), dtype=bool)
+        is_track[positions] = False
+        tracks.append(block[is_track])
+    tracks = np.concatenate(tracks) if tracks else np.zeros(0, dtype=np.uint8)
+    tracks = tracks.view("<i4").reshape(-1, 2)
+
+    track_offsets = np.zeros(num_points + 1, dtype=np.int64)
+    np.cumsum(headers["track_length"], out=track_offsets[1:])
+    return Points3DArrays(
+        ids=headers["id"].astype(np.int64), xyz=headers["xyz"],
+        rgb=headers["rgb"], error=headers["error"],
+        track_offsets=track_offsets,
+        image_ids=tracks[:, 0].astype(np.int64),
+        point2D_idxs=tracks[:, 1].astype(np.int64))
+
+
 def read_points3d_binary(path_to_model_file):
     """
     see: src/base/reconstruction.cc
         void Reconstruction::ReadPoints3DBinary(const std::string& path)
         void Reconstruction::WritePoints3DBinary(const std::string& path)
     """
+    return points3D_from_arrays(read_points3D_binary_arrays(path_to_model_file))
+
+
+def images_from_arrays(arrays):
+    images = {}
+    for i, image_id in enumerate(arrays.ids.tolist()):
+        start, end = arrays.point2D_offsets[i], arrays.point2D_offsets[i + 1]
+        images[image_id] = Image(
+            id=image_id, qvec=arrays.qvecs[i], tvec=arrays.tvecs[i],
+            camera_id=int(arrays.camera_ids[i]), name=arrays.names[i],
+            xys=arrays.xys[start:end], point3D_ids=arrays.point3D_ids[start:end])
+    return images
+
+
+def images_to_arrays(images):
+    images = list(images.values()) if isinstance(images, dict) else list(images)
+    counts = [len(image.point3D_ids) for image in images]
+    point2D_offsets = np.zeros(len(images) + 1, dtype=np.int64)
+    np.cumsum(counts, out=point2D_offsets[1:])
+    return ImagesArrays(
+        ids=np.array([image.id for image in images], dtype=np.int64),
+        qvecs=np.array([image.qvec for image in images], dtype=np.float64).reshape(-1, 4),
+        tvecs=np.array([image.tvec for image in images], dtype=np.float64).reshape(-1, 3),
+        camera_ids=np.array([image.camera_id for image in images], dtype=np.int64),
+        names=[image.name for image in images],
+        point2D_offsets=point2D_offsets,
+        xys=np.concatenate([np.reshape(image.xys, (-1, 2)) for image in images]
+                           or [np.zeros((0, 2))]).astype(np.float64),
+        point3D_ids=np.concatenate([np.asarray(image.point3D_ids, dtype=np.int64) for image in images]
+                                   or [np.zeros(0, dtype=np.int64)]))
+
+
+def points3D_from_arrays(arrays):
     points3D = {}
-    with open(path_to_model_file, "rb") as fid:
-        num_points = read_next_bytes(fid, 8, "Q")[0]
-        for point_line_index in range(num_points):
-            binary_point_line_properties = read_next_bytes(
-                fid, num_bytes=43, format_char_sequence="QdddBBBd")
-            point3D_id = binary_point_line_properties[0]
-            xyz = np.array(binary_point_line_properties[1:4])
-            rgb = np.array(binary_point_line_properties[4:7])
-            error = np.array(binary_point_line_properties[7])
-            track_length = read_next_bytes(
-                fid, num_bytes=8, format_char_sequence="Q")[0]
-            track_elems = read_next_bytes(
-                fid, num_bytes=8*track_length,
-                format_char_sequence="ii"*track_length)
-            image_ids = np.array(tuple(map(int, track_elems[0::2])))
-            point2D_idxs = np.array(tuple(map(int, track_elems[1::2])))
-            points3D[point3D_id] = Point3D(
-                id=point3D_id, xyz=xyz, rgb=rgb,
-                error=error, image_ids=image_ids,
-                point2D_idxs=point2D_idxs)
+    for i, point3D_id in enumerate(arrays.ids.tolist()):
+        start, end = arrays.track_offsets[i], arrays.track_offsets[i + 1]
+        points3D[point3D_id] = Point3D(
+            id=point3D_id, xyz=arrays.xyz[i], rgb=arrays.rgb[i],
+            error=arrays.error[i], image_ids=arrays.image_ids[start:end],
+            point2D_idxs=arrays.point2D_idxs[start:end])
     return points3D
 
 
+def points3D_to_arrays(points3D):
+    points3D = list(points3D.values()) if isinstance(points3D, dict) else list(points3D)
+    counts = [len(point.image_ids) for point in points3D]
+    track_offsets = np.zeros(len(points3D) + 1, dtype=np.int64)
+    np.cumsum(counts, out=track_offsets[1:])
+    return Points3DArrays(
+        ids=np.array([point.id for point in points3D], dtype=np.int64),
+        xyz=np.array([point.xyz for point in points3D], dtype=np.float64).reshape(-1, 3),
+        rgb=np.array([point.rgb for point in points3D], dtype=np.uint8).reshape(-1, 3),
+        error=np.array([point.error for point in points3D], dtype=np.float64),
+        track_offsets=track_offsets,
+        image_ids=np.concatenate([np.asarray(point.image_ids, dtype=np.int64) for point in points3D]
+                                 or [np.zeros(0, dtype=np.int64)]),
+        point2D_idxs=np.concatenate([np.asarray(point.point2D_idxs, dtype=np.int64) for point in points3D]
+                                    or [np.zeros(0, dtype=np.int64)]))
+
+
 def read_model(path, ext):
     if ext == ".txt":
         cameras = read_cameras_text(os.path.join(path, "cameras" + ext))
@@ -269,6 +387,22 @@ def read_model(path, ext):
     return cameras, images, points3D
 
 
+def read_model_arrays(path, ext):
+    """
+    Reads a model as (cameras, ImagesArrays, Points3DArrays). Binary models are
+    decoded directly into arrays, text models are converted after parsing.
+    """
+    if ext == ".txt":
+        cameras = read_cameras_text(os.path.join(path, "cameras" + ext))
+        images = images_to_arrays(read_images_text(os.path.join(path, "images" + ext)))
+        points3D = points3D_to_arrays(read_points3D_text(os.path.join(path, "points3D") + ext))
+    else:
+        cameras = read_cameras_binary(os.path.join(path, "cameras" + ext))
+        images = read_images_binary_arrays(os.path.join(path, "images" + ext))
+        points3D = read_points3D_binary_arrays(os.path.join(path, "points3D") + ext)
+    return cameras, images, points3D
+
+
 def qvec2rotmat(qvec):
     return np.array([
         [1 - 2 * qvec[2]**2 - 2 * qvec[3]**2,
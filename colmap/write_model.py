@@ -3,7 +3,10 @@ import sys
 import collections
 import numpy as np
 import struct
-from .read_model import Camera, CameraModel, BaseImage, Point3D, Image
+from .read_model import Camera, CameraModel, BaseImage, Point3D, Image, ImagesArrays, Points3DArrays, \
+    CAMERA_MODEL_NAMES, IMAGE_HEADER_DTYPE, POINT2D_DTYPE, POINT3D_HEADER_DTYPE, \
+    images_to_arrays, points3D_to_arrays
+from ..textwriter import BufferedTextWriter
 
 # CameraModel = collections.namedtuple(
 #     "CameraModel", ["model_id", "model_name", "num_params"])
@@ -32,46 +35,133 @@ def write_cameras_text(path, cameras):
 
 def write_images_text(path, images):
     """
+    Writes images from ImagesArrays (or Image namedtuples) in blocks.
     see: src/base/reconstruction.cc
         void Reconstruction::ReadImagesText(const std::string& path)
         void Reconstruction::WriteImagesText(const std::string& path)
     """
-    with open(path, "w") as fid:
-        fid.writelines(map(lambda line: f'{line}\n',
-                           ['# Image list with two lines of data per image:',
-                            '#   IMAGE_ID, QW, QX, QY, QZ, TX, TY, TZ, CAMERA_ID, NAME',
-                            '#   POINTS2D[] as (X, Y, POINT3D_ID)',
-                            f'# Number of images: {len(images)}, mean observations per image: ']))
-        for image in images:
-            fid.write(f'{image.id} ')
-            fid.write('{} '.format(' '.join(map(str, image.qvec))))
-            fid.write('{} '.format(' '.join(map(str, image.tvec))))
-            fid.write(f'{image.camera_id} ')
-            fid.write(f'{image.name.strip()}\n')
-            for i in range(len(image.xys)):
-                fid.write(f'{image.xys[i][0]} {image.xys[i][1]} {image.point3D_ids[i]} ')
-            fid.write('\n')
+    if not isinstance(images, ImagesArrays):
+        images = images_to_arrays(images)
+    with open(path, "w") as fid, BufferedTextWriter(fid) as writer:
+        writer.write(''.join(map(lambda line: f'{line}\n',
+                                 ['# Image list with two lines of data per image:',
+                                  '#   IMAGE_ID, QW, QX, QY, QZ, TX, TY, TZ, CAMERA_ID, NAME',
+                                  '#   POINTS2D[] as (X, Y, POINT3D_ID)',
+                                  f'# Number of images: {len(images.ids)}, mean observations per image: '])))
+        writer.write_ragged('{0} {1[0]} {1[1]} {1[2]} {1[3]} {2[0]} {2[1]} {2[2]} {3} {4}\n',
+                            [images.ids, images.qvecs, images.tvecs, images.camera_ids,
+                             np.array([name.strip() for name in images.names], dtype=object)],
+                            '{0[0]} {0[1]} {1} ', [images.xys, images.point3D_ids],
+                            images.point2D_offsets)
 
 
 def write_points3D_text(path, points3D):
     """
+    Writes points from Points3DArrays (or Point3D namedtuples) in blocks.
     see: src/base/reconstruction.cc
         void Reconstruction::ReadPoints3DText(const std::string& path)
         void Reconstruction::WritePoints3DText(const std::string& path)
     """
-    with open(path, "w") as fid:
-        fid.writelines(map(lambda line: f'{line}\n',
-                           ['# 3D point list with one line of data per point:',
-                            '#   POINT3D_ID, X, Y, Z, R, G, B, ERROR, TRACK[] as (IMAGE_ID, POINT2D_IDX)',
-                            f'# Number of points: {len(points3D)}, mean track length: ']))
-        for point in points3D:
-            fid.write(f'{point.id} ')
-            fid.write('{} '.format(' '.join(map(str, point.xyz))))
-            fid.write('{} '.format(' '.join(map(str, point.rgb))))
-            fid.write(f'{point.error} ')
-            for i in range(len(point.image_ids)):
-                fid.write(f'{point.image_ids[i]} {point.point2D_idxs[i]} ')
-            fid.write('\n')
+    if not isinstance(points3D, Points3DArrays):
+        points3D = points3D_to_arrays(points3D)
+    with open(path, "w") as fid, BufferedTextWriter(fid) as writer:
+        writer.write(''.join(map(lambda line: f'{line}\n',
+                                 ['# 3D point list with one line of data per point:',
+                                  '#   POINT3D_ID, X, Y, Z, R, G, B, ERROR, TRACK[] as (IMAGE_ID, POINT2D_IDX)',
+                                  f'# Number of points: {len(points3D.ids)}, mean track length: '])))
+        writer.write_ragged('{0} {1[0]} {1[1]} {1[2]} {2[0]} {2[1]} {2[2]} {3} ',
+                            [points3D.ids, points3D.xyz, points3D.rgb, points3D.error],
+                            '{0} {1} ', [points3D.image_ids, points3D.point2D_idxs],
+                            points3D.track_offsets)
+
+
+def write_cameras_binary(path, cameras):
+    """
+    see: src/base/reconstruction.cc
+        void Reconstruction::WriteCamerasBinary(const std::string& path)
+        void Reconstruction::ReadCamerasBinary(const std::string& path)
+    """
+    cameras = list(cameras.values()) if isinstance(cameras, dict) else list(cameras)
+    with open(path, "wb") as fid:
+        fid.write(struct.pack("<Q", len(cameras)))
+        for camera in cameras:
+            model = CAMERA_MODEL_NAMES[camera.model]
+            params = np.asarray(camera.params, dtype="<f8")
+            if len(params) != model.num_params:
+                raise ValueError(f'Camera model {camera.model} expects {model.num_params} parameters')
+            fid.write(struct.pack("<iiQQ", camera.id, model.model_id, camera.width, camera.height))
+            fid.write(params.tobytes())
+
+
+def write_images_binary(path, images):
+    """
+    Writes images from ImagesArrays (or Image namedtuples), the 2D points of each
+    image are written in one block.
+    see: src/base/reconstruction.cc
+        void Reconstruction::ReadImagesBinary(const std::string& path)
+        void Reconstruction::WriteImagesBinary(const std::string& path)
+    """
+    if not isinstance(images, ImagesArrays):
+        images = images_to_arrays(images)
+    num_images = len(images.ids)
+    headers = np.empty(num_images, dtype=IMAGE_HEADER_DTYPE)
+    headers["id"] = images.ids
+    headers["qvec"] = images.qvecs
+    headers["tvec"] = images.tvecs
+    headers["camera_id"] = images.camera_ids
+    points2D = np.empty(len(images.point3D_ids), dtype=POINT2D_DTYPE)
+    points2D["xy"] = images.xys
+    points2D["point3D_id"] = images.point3D_ids
+    offsets = images.point2D_offsets
+    with open(path, "wb") as fid:
+        fid.write(struct.pack("<Q", num_images))
+        for i in range(num_images):
+            fid.write(headers[i:i + 1].tobytes())
+            fid.write(images.names[i].strip().encode("utf-8") + b"\x00")
+            fid.write(struct.pack("<Q", offsets[i + 1] - offsets[i]))
+            fid.write(points2D[offsets[i]:offsets[i + 1]].tobytes())
+
+
+def write_points3D_binary(path, points3D, chunk_size=1 << 16):
+    """
+    Writes points from Points3DArrays (or Point3D namedtuples). Each chunk of points
+    is assembled into a single byte buffer, interleaving the fixed-size headers and
+    the variable length tracks, and written with one call.
+    see: src/base/reconstruction.cc
+        void Reconstruction::ReadPoints3DBinary(const std::string& path)
+        void Reconstruction::WritePoints3DBinary(const std::string& path)
+    """
+    if not isinstance(points3D, Points3DArrays):
+        points3D = points3D_to_arrays(points3D)
+    num_points = len(points3D.ids)
+    track_offsets = np.asarray(points3D.track_offsets, dtype=np.int64)
+    headers = np.empty(num_points, dtype=POINT3D_HEADER_DTYPE)
+    headers["id"] = points3D.ids
+    headers["xyz"] = points3D.xyz
+    headers["rgb"] = points3D.rgb
+    headers["error"] = points3D.error
+    headers["track_length"] = np.diff(track_offsets)
+    tracks = np.empty((len(points3D.image_ids), 2), dtype="<i4")
+    tracks[:, 0] = points3D.image_ids
+    tracks[:, 1] = points3D.point2D_idxs
+
+    header_size = POINT3D_HEADER_DTYPE.itemsize
+    header_bytes = np.arange(header_size)
+    with open(path, "wb") as fid:
+        fid.write(struct.pack("<Q", num_points))
+        for first in range(0, num_points, chunk_size):
+            last = min(first + chunk_size, num_points)
+            track_start, track_end = track_offsets[first], track_offsets[last]
+            # byte offset of each record within this chunk
+            starts = (np.arange(last - first) * header_size
+                      + 8 * (track_offsets[first:last] - track_start))
+            block = np.empty((last - first) * header_size + 8 * (track_end - track_start), dtype=np.uint8)
+            positions = starts[:, np.newaxis] + header_bytes
+            block[positions] = headers[first:last].view(np.uint8).reshape(-1, header_size)
+            is_track = np.ones(len(block), dtype=bool)
+            is_track[positions] = False
+            block[is_track] = tracks[track_start:track_end].view(np.uint8).ravel()
+            fid.write(block.tobytes())
 
 
 def write_model(path, ext, cameras, images, points3D):
@@ -80,6 +170,8 @@ def write_model(path, ext, cameras, images, points3D):
         write_images_text(os.path.join(path, "images" + ext), images)
         write_points3D_text(os.path.join(path, "points3D") + ext, points3D)
     elif ext == '.bin':
-        raise NotImplementedError('Only TXT format is currently supported.')
+        write_cameras_binary(os.path.join(path, "cameras" + ext), cameras)
+        write_images_binary(os.path.join(path, "images" + ext), images)
+        write_points3D_binary(os.path.join(path, "points3D") + ext, points3D)
     else:
         raise Exception('Model must have extension .txt or .bin.')
@@ -0,0 +1,382 @@
+"""
+Converts source images into the JPEGs expected by Bundler, VisualSfM and PMVS.
+
+Images are converted in parallel using Pillow (in threads) when it's installed,
+otherwise by running headless Blender worker processes, each converting a share of
+the images with this script:
+
+    blender --background --factory-startup --python convert.py -- <jobs.json>
+
+and falling back to converting them one by one in the current Blender session.
+
+A ConversionCache kept in the workspace allows images that haven't changed since the
+last export to be skipped.
+"""
+import os
+import sys
+import json
+import queue
+import hashlib
+import shutil
+import tempfile
+import threading
+import subprocess
+from math import floor
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import bpy
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+try:
+    from .jobs import call_main, check_cancelled, current_job
+except ImportError:
+    # running as a worker script outside of the addon package
+    def call_main(func, *args, **kwargs):
+        return func(*args, **kwargs)
+
+    def check_cancelled():
+        pass
+
+    def current_job():
+        return None
+
+
+# 3000px limit on PMVS
+PMVS_MAX_SIZE = 3000
+
+# prefix of the lines a worker prints for each image it has converted (or failed to)
+CONVERTED = 'photogrammetry-converted: '
+FAILED = 'photogrammetry-failed: '
+
+
+def get_resolution_percentage(width, height, max_size=PMVS_MAX_SIZE):
+    """ Percentage to scale an image by so its largest side fits within max_size """
+    return floor(100 * min(1.0, (max_size / max(width, height))))
+
+
+def convert_image(filepath, target, max_size=PMVS_MAX_SIZE):
+    """ Creates a scene specifically for saving an image as JPG """
+    sc = bpy.data.scenes.new('photogrammetry_helper')
+    try:
+        img = bpy.data.images.load(filepath)
+        r = sc.render
+        r.resolution_x = img.size[0]
+        r.resolution_y = img.size[1]
+        r.resolution_percentage = get_resolution_percentage(r.resolution_x, r.resolution_y, max_size)
+        r.image_settings.file_format = 'JPEG'
+        r.image_settings.quality = 100
+
+        sc.display_settings.display_device = 'sRGB'
+        img.save_render(target, scene=sc)
+        bpy.data.images.remove(img)
+    finally:
+        # remove the temporary export scene
+        bpy.data.scenes.remove(sc)
+
+
+def convert_image_pillow(filepath, target, max_size=PMVS_MAX_SIZE):
+    """ Saves an image as JPG with Pillow, scaled the same way Blender's resolution percentage would """
+    with Image.open(filepath) as img:
+        percentage = get_resolution_percentage(img.width, img.height, max_size)
+        if percentage < 100:
+            img = img.resize((img.width * percentage // 100, img.height * percentage // 100), Image.LANCZOS)
+        img.convert('RGB').save(target, 'JPEG', quality=100)
+
+
+def convert_images(jobs, workers=1, max_size=PMVS_MAX_SIZE, cache=None):
+    """
+    Converts each (source, target) pair of jobs, using up to the given number of workers
+    and reporting progress as images are completed. When a ConversionCache is given, targets
+    already converted from the same source with the same parameters are skipped.
+    """
+    params = {'format': 'JPEG', 'quality': 100, 'max_size': max_size}
+    jobs = list(jobs)
+    if cache:
+        jobs = cache.outdated(jobs, params)
+    # never write through an existing target, it may be a link to a source image
+    for _, target in jobs:
+        if os.path.lexists(target):
+            os.remove(target)
+    progress = Progress(len(jobs))
+    try:
+        if workers > 1 and len(jobs) > 1 and Image:
+            _convert_threaded(jobs, workers, max_size, progress)
+        elif workers > 1 and len(jobs) > 1 and bpy.app.binary_path:
+            _convert_processes(jobs, workers, max_size, progress)
+        else:
+            for source, target in jobs:
+                call_main(convert_image, source, target, max_size)
+                progress.update(target)
+    finally:
+        progress.end()
+        if cache:
+            cache.update(jobs, progress.completed, params)
+            cache.save()
+
+
+def link_images(jobs, strategy='COPY', cache=None):
+    """
+    Populates each (source, target) pair of jobs by hardlinking, reflinking, symlinking or
+    copying the source, skipping targets the cache shows are already up to date. Links that
+    can't be made (e.g. across filesystems) fall back to copying.
+    """
+    params = {'link': strategy}
+    jobs = list(jobs)
+    if cache:
+        jobs = cache.outdated(jobs, params)
+    completed = []
+    try:
+        for source, target in jobs:
+            check_cancelled()
+            link_file(source, target, strategy)
+            completed.append(target)
+    finally:
+        if cache:
+            cache.update(jobs, completed, params)
+            cache.save()
+
+
+def link_file(source, target, strategy='COPY'):
+    """ Returns the strategy that was used, which is COPY if the requested link couldn't be made """
+    # never write through an existing target, it may be a link to a source image
+    if os.path.lexists(target):
+        os.remove(target)
+    try:
+        if strategy == 'HARDLINK':
+            os.link(source, target)
+            return strategy
+        elif strategy == 'REFLINK':
+            reflink(source, target)
+            return strategy
+        elif strategy == 'SYMLINK':
+            os.symlink(os.path.abspath(source), target)
+            return strategy
+    except (OSError, NotImplementedError) as ex:
+        print(f'Unable to {strategy.lower()} {source}, copying instead:', ex)
+        if os.path.lexists(target):
+            os.remove(target)
+    shutil.copy(source, target)
+    return 'COPY'
+
+
+def reflink(source, target):
+    """ Creates a copy-on-write clone of source, supported by Btrfs, XFS and APFS among others """
+    if sys.platform.startswith('linux'):
+        import fcntl
+        FICLONE = 0x40049409
+        with open(source, 'rb') as src, open(target, 'wb') as dst:
+            try:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            except OSError:
+                dst.close()
+                os.remove(target)
+                raise
+        shutil.copystat(source, target)
+    elif sys.platform == 'darwin':
+        import ctypes
+        libc = ctypes.CDLL(None, use_errno=True)
+        if libc.clonefile(os.fsencode(source), os.fsencode(target), 0) != 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+    else:
+        raise NotImplementedError(f'reflinks are not supported on {sys.platform}')
+
+
+def fingerprint(path, block_size=1 << 20):
+    """ SHA-1 of a file's size and its first and last block_size bytes """
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        digest.update(str(size).encode('ascii'))
+        digest.update(f.read(block_size))
+        if size > block_size:
+            f.seek(max(block_size, size - block_size))
+            digest.update(f.read(block_size))
+    return digest.hexdigest()
+
+
+class ConversionCache(object):
+    """
+    Records which source file and parameters each image in a workspace was produced from,
+    in a JSON file within the workspace. An image is up to date while its source has the
+    same path, size and mtime, it was produced with the same parameters and it hasn't
+    itself been modified or removed since. With fingerprint, the source must also have
+    the same hash of its first and last MiB, e.g. for a movie many frames come from.
+    """
+    def __init__(self, dirpath, filename='.photogrammetry-images.json', fingerprint=False):
+        self.dirpath = dirpath
+        self.path = os.path.join(dirpath, filename)
+        self.fingerprint = fingerprint
+        self._fingerprints = {}
+        try:
+            with open(self.path, 'r') as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def _key(self, target):
+        return os.path.relpath(target, self.dirpath).replace(os.sep, '/')
+
+    @staticmethod
+    def _stat(path):
+        try:
+            st = os.stat(path)
+            return [st.st_size, st.st_mtime_ns]
+        except OSError:
+            return None
+
+    def _source(self, source):
+        st = self._stat(source)
+        if st is None:
+            return [os.path.abspath(source)]
+        if not self.fingerprint:
+            return [os.path.abspath(source)] + st
+        # hashed once for as long as the source is unchanged
+        key = (os.path.abspath(source), tuple(st))
+        if key not in self._fingerprints:
+            self._fingerprints[key] = fingerprint(source)
+        return [os.path.abspath(source)] + st + [self._fingerprints[key]]
+
+    def is_current(self, source, target, params):
+        entry = self.entries.get(self._key(target))
+        return bool(entry) and \
+            entry['source'] == self._source(source) and \
+            entry['params'] == params and \
+            entry['target'] == self._stat(target)
+
+    def outdated(self, jobs, params):
+        """ Returns the jobs whose targets need to be produced again """
+        return [(source, target) for source, target in jobs if not self.is_current(source, target, params)]
+
+    def update(self, jobs, completed, params):
+        """ Records the targets of jobs that have been completed """
+        completed = set(completed)
+        for source, target in jobs:
+            if target in completed:
+                self.entries[self._key(target)] = {
+                    'source': self._source(source),
+                    'params': params,
+                    'target': self._stat(target),
+                }
+
+    def save(self):
+        try:
+            with open(self.path + '.tmp', 'w') as f:
+                json.dump(self.entries, f)
+            os.replace(self.path + '.tmp', self.path)
+        except OSError as ex:
+            print('Unable to save image conversion cache:', ex)
+
+
+def _convert_threaded(jobs, workers, max_size, progress):
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(convert_image_pillow, source, target, max_size): (source, target) for source, target in jobs}
+        try:
+            for future in as_completed(futures):
+                source, target = futures[future]
+                try:
+                    future.result()
+                except Exception as ex:
+                    # Pillow couldn't read this format, let Blender convert it instead
+                    print(f'Pillow could not convert {source}, using Blender:', ex)
+                    call_main(convert_image, source, target, max_size)
+                progress.update(target)
+        finally:
+            # when cancelled, drop the queued conversions so leaving the executor only waits for those already running
+            for future in futures:
+                future.cancel()
+
+
+def _convert_processes(jobs, workers, max_size, progress):
+    workers = min(workers, len(jobs))
+    lines = queue.Queue()
+    processes = []
+    failed = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for i in range(workers):
+            jobs_path = os.path.join(tmp, f'jobs-{i}.json')
+            with open(jobs_path, 'w') as f:
+                json.dump({'max_size': max_size, 'jobs': jobs[i::workers]}, f)
+            process = subprocess.Popen(
+                [bpy.app.binary_path, '--background', '--factory-startup', '--python', os.path.realpath(__file__), '--', jobs_path],
+                stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+            threading.Thread(target=_read_lines, args=(process.stdout, lines), daemon=True).start()
+            processes.append(process)
+
+        # each reader thread puts None once its worker's output is finished
+        running = len(processes)
+        try:
+            while running:
+                line = lines.get()
+                if line is None:
+                    running -= 1
+                elif line.startswith(CONVERTED):
+                    progress.update(line[len(CONVERTED):])
+                elif line.startswith(FAILED):
+                    failed.append(line[len(FAILED):])
+        finally:
+            # stop any workers still running if conversion was cancelled
+            for process in processes:
+                if process.poll() is None and running:
+                    process.terminate()
+                process.wait()
+
+    if failed or any(process.returncode != 0 for process in processes):
+        raise AttributeError('Unable to convert images:\n{}'.format('\n'.join(failed) or 'see system console for details'))
+
+
+def _read_lines(stream, lines):
+    for line in stream:
+        lines.put(line.rstrip('\n'))
+    lines.put(None)
+
+
+class Progress(object):
+    """
+    Reports the number of images converted so far to the console, and to either the running
+    job or the window manager's progress indicator.
+    """
+    def __init__(self, total):
+        self.total = total
+        self.done = 0
+        self.completed = []
+        self.job = current_job()
+        self.wm = None
+        if self.job:
+            self.job.set_stage('Converting images')
+        else:
+            self.wm = getattr(bpy.context, 'window_manager', None)
+            if self.wm:
+                self.wm.progress_begin(0, total)
+
+    def update(self, target):
+        self.done += 1
+        self.completed.append(target)
+        print(f'Converted image {self.done}/{self.total}: {target}')
+        if self.job:
+            self.job.set_progress(self.done / self.total)
+        elif self.wm:
+            self.wm.progress_update(self.done)
+        check_cancelled()
+
+    def end(self):
+        if self.job:
+            self.job.end_stage()
+        elif self.wm:
+            self.wm.progress_end()
+
+
+if __name__ == '__main__':
+    # running as a headless worker, convert the images listed in the jobs file given after '--'
+    with open(sys.argv[-1], 'r') as f:
+        worker = json.load(f)
+    for source, target in worker['jobs']:
+        try:
+            convert_image(source, target, worker['max_size'])
+            print(f'{CONVERTED}{target}', flush=True)
+        except Exception as ex:
+            print(f'{FAILED}{target}: {ex}', flush=True)
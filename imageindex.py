@@ -0,0 +1,91 @@
+import os
+import json
+import hashlib
+import tempfile
+
+
+def get_cache_dir():
+    return os.path.join(tempfile.gettempdir(), 'blender-photogrammetry')
+
+
+class ImageIndex(object):
+    """
+    Resolves image filenames referenced by a reconstruction against one or more image
+    directories. Names are first tried directly within each directory, then (when
+    subdirs is set) looked up in a filename -> path index of each directory tree.
+
+    The index of a tree is built with a single os.scandir walk the first time it's
+    needed and cached on disk along with the modification time of every directory
+    walked. A cached index is reused as long as none of those directories changed, as
+    adding, removing or renaming a file updates the mtime of the directory it's in.
+    """
+    def __init__(self, roots, subdirs=True, cache_dir=None):
+        self.roots = list(roots)
+        self.subdirs = subdirs
+        self.cache_dir = cache_dir or get_cache_dir()
+        self._files = None
+
+    def find(self, name):
+        """ Returns the path of the named image, or None if it can't be found """
+        for root in self.roots:
+            filepath = os.path.join(root, name)
+            if os.path.exists(filepath):
+                return filepath
+
+        if not self.subdirs:
+            return None
+        if self._files is None:
+            self._files = {}
+            for root in self.roots:
+                for filename, filepath in self._load(root).items():
+                    self._files.setdefault(filename, filepath)
+        return self._files.get(os.path.basename(name))
+
+    def _cache_path(self, root):
+        key = hashlib.sha1(os.path.normcase(os.path.abspath(root)).encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, f'images-{key}.json')
+
+    def _load(self, root):
+        cache_path = self._cache_path(root)
+        try:
+            with open(cache_path, 'r') as f:
+                cached = json.load(f)
+            if all(os.stat(d).st_mtime_ns == mtime for d, mtime in cached['dirs'].items()):
+                return cached['files']
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+        dirs, files = walk(root)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(cache_path + '.tmp', 'w') as f:
+                json.dump({'root': root, 'dirs': dirs, 'files': files}, f)
+            os.replace(cache_path + '.tmp', cache_path)
+        except OSError as ex:
+            print('Unable to cache image index:', ex)
+        return files
+
+
+def walk(root):
+    """
+    Walks a directory tree with os.scandir, returning the mtime of every directory and a
+    mapping of each filename to its shallowest path in the tree.
+    """
+    dirs = {}
+    files = {}
+    pending = [root]
+    while pending:
+        subdirs = []
+        for path in pending:
+            try:
+                dirs[path] = os.stat(path).st_mtime_ns
+                with os.scandir(path) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.append(entry.path)
+                        else:
+                            files.setdefault(entry.name, entry.path)
+            except OSError:
+                continue
+        pending = subdirs
+    return dirs, files
@@ -4,32 +4,15 @@ import os
 import xml.etree.ElementTree as ET
 from math import tan, radians
 from mathutils import Vector, Matrix, Euler
+from ..imageindex import ImageIndex
+from ..reconstruction import ReconstructionBuilder
 from ..utils import get_image_size
 
 
 def extract(properties, *args, **kwargs):
     """
-    :returns: {
-        'resolution': (width, height),
-        'trackers': { 
-            int: (x, y, z),
-        },
-        'cameras': {
-            int: {
-                'filename': str,
-                'f': float,
-                'k': (k1, k2, k3),
-                'c': (x, y, z),  # real world coord
-                't': (x, y, z),  # pmvs transformed translation
-                'R': ((r00, r01, r02),
-                        (r10, r11, r12),
-                        (r20, r21, r22)),
-                'trackers': {
-                    int: (x, y),
-                }
-            }
-        }
-    }
+    :returns: Reconstruction, where each camera additionally carries:
+        'c': (x, y, z),  # real world coord
     """
     filename = bpy.path.abspath(properties.filepath)
     imagepaths = list(filter(None, bpy.path.abspath(properties.imagepath).split(';')))
@@ -38,17 +21,15 @@ def extract(properties, *args, **kwargs):
             raise AttributeError(f'ImageModeler filepath must be provided')
         raise AttributeError(f'Unable to locate ImageModeler file:\n"{filename}"')
 
-    data = {
-        'trackers': {},
-        'cameras': {},
-    }
+    images = ImageIndex(imagepaths, subdirs=properties.subdirs)
+    builder = ReconstructionBuilder()
+    resolution = None
+    locators = set()
     doc = ET.parse(filename)
     for locator in doc.findall('L'):
         co = locator.find('P').attrib
-        data['trackers'][int(locator.attrib['i'])] = {
-            'co': (float(co['x']), float(co['y']), float(co['z'])),
-            'rgb': (0, 0, 0),
-        }
+        locators.add(int(locator.attrib['i']))
+        builder.add_point(int(locator.attrib['i']), (float(co['x']), float(co['y']), float(co['z'])))
     
     cinfs = {}
     for cinf in doc.findall('CINF'):
@@ -86,36 +67,22 @@ def extract(properties, *args, **kwargs):
         f_pixels = int(shot.attrib['w']) * (f / float(cinf['fbw']))
 
         # find any filename that exists
-        filenames = [fp for fp in [os.path.join(*parts) for parts in zip(imagepaths, [shot.attrib['n'],] * len(imagepaths))] if os.path.exists(fp)]
-        if not filenames:
-            # wasn't in a root path, do we search sub directories?
-            if properties.subdirs:
-                for imagepath in imagepaths:
-                    for root, dirs, files in os.walk(imagepath):
-                        if shot.attrib['n'] in files:
-                            filenames = [os.path.join(root, shot.attrib['n'])]
-
-            # still didn't find file?
-            if not filenames:
-                raise AttributeError(f'ImageModeler image not found for camera "{shot.attrib["i"]}":\n"{shot.attrib["n"]}"')
+        filename = images.find(shot.attrib['n'])
+        if not filename:
+            raise AttributeError(f'ImageModeler image not found for camera "{shot.attrib["i"]}":\n"{shot.attrib["n"]}"')
 
-        camera = data['cameras'].setdefault(int(shot.attrib['i']), {
-            'filename': filenames[0],
-            'f': f_pixels,
-            'k': (-float(intrinsics['rd']),) * 3,
-            'c': extrinsics['T'],
-            'R': tuple(map(tuple, tuple(extrinsics['R']))),
-            't': tuple(-1 * extrinsics['R'] @ extrinsics['T']),
-        })
+        builder.add_camera(int(shot.attrib['i']), filename, f_pixels, (-float(intrinsics['rd']),) * 3,
+                           tuple(map(tuple, tuple(extrinsics['R']))), tuple(-1 * extrinsics['R'] @ extrinsics['T']),
+                           c=tuple(extrinsics['T']))
 
-        if 'resolution' not in data:
-            data.setdefault('resolution', get_image_size(camera['filename']))
+        if not resolution:
+            resolution = get_image_size(filename)
 
-        trackers = camera.setdefault('trackers', {})
         for marker in shot.find('IPLN').find('IFRM').findall('M'):
-            trackers[int(marker.attrib['i'])] = (float(marker.attrib['x']), float(marker.attrib['y']))
+            if int(marker.attrib['i']) in locators:
+                builder.add_observation(int(marker.attrib['i']), int(shot.attrib['i']), (float(marker.attrib['x']), float(marker.attrib['y'])))
 
-    return data
+    return builder.build(resolution=resolution)
 
 
 # def convert_images(self, data, out_dir):
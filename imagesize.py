@@ -0,0 +1,74 @@
+import struct
+
+
+# JPEG start of frame markers, excluding DHT (0xC4), JPG (0xC8) and DAC (0xCC)
+SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+# TIFF field types that can hold ImageWidth/ImageLength: SHORT and LONG
+TIFF_TYPES = {3: 'H', 4: 'I'}
+
+
+def probe_image_size(filename):
+    """
+    Returns the (width, height) of a JPEG, PNG or TIFF image by reading only its header,
+    or None if the format isn't recognised or the header can't be parsed.
+    """
+    try:
+        with open(filename, 'rb') as f:
+            head = f.read(26)
+            if head[:8] == b'\x89PNG\r\n\x1a\n':
+                return probe_png(head)
+            if head[:2] == b'\xff\xd8':
+                return probe_jpeg(f)
+            if head[:4] in (b'II*\x00', b'MM\x00*'):
+                return probe_tiff(f, '<' if head[:2] == b'II' else '>')
+    except (OSError, struct.error, ValueError):
+        pass
+    return None
+
+
+def probe_png(head):
+    # signature, IHDR chunk length and type, then width and height
+    if head[12:16] != b'IHDR':
+        return None
+    return struct.unpack('>II', head[16:24])
+
+
+def probe_jpeg(f):
+    f.seek(2)
+    while True:
+        byte = f.read(1)
+        while byte and byte != b'\xff':
+            byte = f.read(1)
+        # markers may be preceded by any number of 0xFF fill bytes
+        while byte == b'\xff':
+            byte = f.read(1)
+        if not byte:
+            return None
+        marker = byte[0]
+        if marker == 0xD9 or marker == 0xDA:
+            # end of image or start of scan without a frame header
+            return None
+        if marker == 0x01 or 0xD0 <= marker <= 0xD7:
+            # standalone markers have no length
+            continue
+        length, = struct.unpack('>H', f.read(2))
+        if marker in SOF_MARKERS:
+            precision, height, width = struct.unpack('>BHH', f.read(5))
+            return (width, height) if width and height else None
+        f.seek(length - 2, 1)
+
+
+def probe_tiff(f, order):
+    f.seek(4)
+    offset, = struct.unpack(order + 'I', f.read(4))
+    f.seek(offset)
+    count, = struct.unpack(order + 'H', f.read(2))
+    size = {}
+    for entry in range(count):
+        tag, type_, values, value = struct.unpack(order + 'HHI4s', f.read(12))
+        if tag in (256, 257) and type_ in TIFF_TYPES:
+            size[tag] = struct.unpack_from(order + TIFF_TYPES[type_], value)[0]
+    if 256 in size and 257 in size:
+        return (size[256], size[257])
+    return None
@@ -0,0 +1,223 @@
+"""
+Runs the output stage of a photogrammetry process in a background thread so Blender stays
+responsive while external binaries (COLMAP, PMVS, openMVS) run for minutes or hours.
+
+A Job is polled from the main thread by a modal operator's timer. Code running in the job
+uses run_command() to start external binaries, which streams their output into the job's
+log and parses progress from it, and call_main() for anything that must use bpy on the
+main thread (importing meshes, loading images). Both also work outside of a job, where
+they simply run in place.
+"""
+import os
+import re
+import queue
+import threading
+import subprocess
+from collections import deque
+from concurrent.futures import Future
+
+
+# progress printed by the external tools, e.g. COLMAP's "Processing view 3 / 50" or
+# "Undistorting image [3/50]" and openMVS's "Estimated depth-maps 3 (6%, ...)"
+PROGRESS_PATTERNS = [
+    (re.compile(r'\[\s*(\d+)\s*/\s*(\d+)\s*\]'), lambda m: int(m.group(1)) / max(1, int(m.group(2)))),
+    (re.compile(r'\b(\d+)\s*/\s*(\d+)\b'), lambda m: int(m.group(1)) / max(1, int(m.group(2)))),
+    (re.compile(r'\((\d+(?:\.\d+)?)%'), lambda m: float(m.group(1)) / 100),
+]
+
+_local = threading.local()
+
+# the job currently running, there's only ever one at a time
+current = None
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job(object):
+    def __init__(self, name, func, *args, **kwargs):
+        self.name = name
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.state = 'PENDING'
+        self.error = None
+        self.log = deque(maxlen=1000)
+        # stage name and progress of each thread working on the job, as stages can run in parallel
+        self._stages = {}
+        self._lock = threading.Lock()
+        self._cancelled = threading.Event()
+        self._processes = set()
+        self._main_calls = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name=f'photogrammetry: {name}', daemon=True)
+
+    def start(self):
+        global current
+        current = self
+        self.state = 'RUNNING'
+        self._thread.start()
+
+    def _run(self):
+        _local.job = self
+        try:
+            self.func(*self.args, **self.kwargs)
+            self.state = 'FINISHED'
+        except JobCancelled:
+            self.state = 'CANCELLED'
+        except Exception as ex:
+            self.error = str(ex)
+            self.state = 'FAILED'
+            self.write(f'Error: {ex}')
+        finally:
+            _local.job = None
+
+    @property
+    def running(self):
+        return self.state in ('PENDING', 'RUNNING')
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        self._cancelled.set()
+        for process in list(self._processes):
+            if process.poll() is None:
+                process.terminate()
+        # release anything waiting on the main thread
+        self.process_main_calls()
+
+    def write(self, line):
+        print(line)
+        self.log.append(line)
+
+    def set_stage(self, stage):
+        """ Starts a stage in the calling thread, replacing the stage it was working on """
+        with self._lock:
+            self._stages[threading.get_ident()] = (stage, None)
+        self.write(f'[{self.name}] {stage}')
+
+    def set_progress(self, progress):
+        """ Sets the progress (0 to 1) of the calling thread's stage """
+        with self._lock:
+            stage, _ = self._stages.get(threading.get_ident(), (self.name, None))
+            self._stages[threading.get_ident()] = (stage, progress)
+
+    def end_stage(self):
+        """ Ends the calling thread's stage """
+        with self._lock:
+            self._stages.pop(threading.get_ident(), None)
+
+    @property
+    def stages(self):
+        """ [(stage, progress or None), ...] of the stages running, in the order they started """
+        with self._lock:
+            stages = list(self._stages.values())
+        return stages or [(self.name, None)]
+
+    def process_main_calls(self):
+        """ Runs the calls the job has queued for the main thread, must be called from the main thread """
+        while True:
+            try:
+                future, func, args, kwargs = self._main_calls.get_nowait()
+            except queue.Empty:
+                return
+            if self.cancelled:
+                future.set_exception(JobCancelled())
+                continue
+            try:
+                future.set_result(func(*args, **kwargs))
+            except Exception as ex:
+                future.set_exception(ex)
+
+    def call_main(self, func, *args, **kwargs):
+        if self.cancelled:
+            raise JobCancelled()
+        future = Future()
+        self._main_calls.put((future, func, args, kwargs))
+        return future.result()
+
+    def run(self, args, env=None, cwd=None):
+        if self.cancelled:
+            raise JobCancelled()
+        self.set_stage(describe_command(args))
+        process = subprocess.Popen(args, env=env, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                   universal_newlines=True, errors='replace', bufsize=1)
+        self._processes.add(process)
+        if self.cancelled:
+            process.terminate()
+        try:
+            for line in process.stdout:
+                line = line.rstrip()
+                self.write(line)
+                progress = parse_progress(line)
+                if progress is not None:
+                    self.set_progress(progress)
+            retcode = process.wait()
+        finally:
+            self._processes.discard(process)
+            self.end_stage()
+        if self.cancelled:
+            raise JobCancelled()
+        return retcode
+
+
+def current_job():
+    """ The job the calling thread is running within, if any """
+    return getattr(_local, 'job', None)
+
+
+def check_cancelled():
+    job = current_job()
+    if job and job.cancelled:
+        raise JobCancelled()
+
+
+def call_main(func, *args, **kwargs):
+    """ Calls func on the main thread, waiting for its result """
+    job = current_job()
+    if job is None or threading.current_thread() is threading.main_thread():
+        return func(*args, **kwargs)
+    return job.call_main(func, *args, **kwargs)
+
+
+def submit(executor, func, *args, **kwargs):
+    """ Submits func to an executor so that it runs within the calling thread's job """
+    job = current_job()
+
+    def run():
+        _local.job = job
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _local.job = None
+    return executor.submit(run)
+
+
+def run_command(args, env=None, cwd=None):
+    """
+    Runs an external binary like subprocess.call, returning its exit code. Within a job its
+    output is streamed into the job's log and it's terminated if the job is cancelled.
+    """
+    print(subprocess.list2cmdline(args))
+    job = current_job()
+    if job is None:
+        return subprocess.call(args, env=env, cwd=cwd)
+    return job.run(args, env=env, cwd=cwd)
+
+
+def describe_command(args):
+    name = os.path.splitext(os.path.basename(args[0]))[0]
+    # include COLMAP's subcommand
+    if len(args) > 1 and re.match(r'^[a-z_]+$', str(args[1])):
+        name = f'{name} {args[1]}'
+    return name
+
+
+def parse_progress(line):
+    for pattern, value in PROGRESS_PATTERNS:
+        match = pattern.search(line)
+        if match:
+            return min(1.0, value(match))
+    return None
@@ -1,48 +1,72 @@
 import numpy as np
 
-# https://pythonprogramming.net/k-means-from-scratch-machine-learning-tutorial/
+
 class K_Means:
-    def __init__(self, k=2, tol=0.001, max_iter=300):
+    """
+    Batched k-means over an (n, d) array, seeded with k-means++ from a fixed random state so
+    results are repeatable. After fitting, centroids is a (k, d) array, labels the centroid
+    index of each row of data and counts the number of rows assigned to each centroid.
+    """
+    def __init__(self, k=2, tol=0.001, max_iter=300, seed=0):
         self.k = k
         self.tol = tol
         self.max_iter = max_iter
+        self.seed = seed
 
-    def fit(self,data):
-
-        self.centroids = {}
-
-        for i in range(self.k):
-            self.centroids[i] = data[i]
+    def fit(self, data):
+        data = np.asarray(data, dtype=np.float64)
+        data = data.reshape(len(data), int(np.prod(data.shape[1:])))
+        k = min(self.k, len(data))
+        self.centroids = self._init_centroids(data, k, np.random.RandomState(self.seed))
+        if not k:
+            # nothing to cluster, there are no centroids
+            self.labels = np.zeros(0, dtype=np.int64)
+            self.counts = np.zeros(0, dtype=np.int64)
+            return self
 
         for i in range(self.max_iter):
-            self.classifications = {}
-
-            for i in range(self.k):
-                self.classifications[i] = []
+            self.labels = self.predict(data)
+            self.counts = np.bincount(self.labels, minlength=k)
 
-            for featureset in data:
-                distances = [np.linalg.norm(featureset-self.centroids[centroid]) for centroid in self.centroids]
-                classification = distances.index(min(distances))
-                self.classifications[classification].append(featureset)
+            # sum of each dimension per centroid, centroids without any rows stay where they are
+            sums = np.stack([np.bincount(self.labels, weights=data[:, d], minlength=k) for d in range(data.shape[1])], axis=1)
+            centroids = self.centroids.copy()
+            assigned = self.counts > 0
+            centroids[assigned] = sums[assigned] / self.counts[assigned, None]
 
-            prev_centroids = dict(self.centroids)
-
-            for classification in self.classifications:
-                self.centroids[classification] = np.average(self.classifications[classification],axis=0)
+            shift = np.abs(centroids - self.centroids).max()
+            scale = max(np.abs(self.centroids).max(), 1e-12)
+            self.centroids = centroids
+            if shift / scale * 100.0 <= self.tol:
+                break
 
-            optimized = True
+        self.labels = self.predict(data)
+        self.counts = np.bincount(self.labels, minlength=k)
+        return self
 
-            for c in self.centroids:
-                original_centroid = prev_centroids[c]
-                current_centroid = self.centroids[c]
-                if np.sum((current_centroid-original_centroid)/original_centroid*100.0) > self.tol:
-                    # print(np.sum((current_centroid-original_centroid)/original_centroid*100.0))
-                    optimized = False
+    def predict(self, data):
+        """ Index of the nearest centroid for each row of data, or for a single row """
+        data = np.asarray(data, dtype=np.float64)
+        single = data.ndim == 1
+        labels = np.argmin(self._distances(data.reshape(-1, self.centroids.shape[1])), axis=1)
+        return int(labels[0]) if single else labels
 
-            if optimized:
-                break
+    def _distances(self, data):
+        """ (n, k) squared distances between each row of data and each centroid """
+        d = (data * data).sum(axis=1)[:, None] - 2 * data @ self.centroids.T + (self.centroids * self.centroids).sum(axis=1)[None, :]
+        return np.maximum(d, 0)
 
-    def predict(self,data):
-        distances = [np.linalg.norm(data-self.centroids[centroid]) for centroid in self.centroids]
-        classification = distances.index(min(distances))
-        return classification
+    @staticmethod
+    def _init_centroids(data, k, random):
+        # k-means++, each subsequent centroid is chosen with probability proportional to its squared distance
+        centroids = np.empty((k, data.shape[1]))
+        if not k:
+            return centroids
+        centroids[0] = data[random.randint(len(data))]
+        nearest = ((data - centroids[0]) ** 2).sum(axis=1)
+        for i in range(1, k):
+            total = nearest.sum()
+            index = random.choice(len(data), p=nearest / total) if total > 0 else random.randint(len(data))
+            centroids[i] = data[index]
+            nearest = np.minimum(nearest, ((data - centroids[i]) ** 2).sum(axis=1))
+        return centroids
@@ -1,9 +1,10 @@
 import bpy
 import os
 import json
+import numpy as np
 from itertools import groupby
-from math import pi
-from mathutils import Matrix, Vector, Euler
+from ..reconstruction import ReconstructionBuilder
+from ..transforms import camera_translation, flip_axes
 
 
 def extract(properties, *args, **kargs):
@@ -24,33 +25,20 @@ def extract(properties, *args, **kargs):
     views_by_pose = dict([(k, list(g)) for k, g in groupby(sorted(views, key=lambda x: x['poseId']), lambda x: x['poseId'])])
     intrinsics = dict([(i['intrinsicId'], i) for i in sfm['intrinsics']])
 
-    cameras = {}
-    trackers = {}
-    data = {
-        'trackers': trackers,
-        'cameras': cameras,
-    }
+    builder = ReconstructionBuilder()
 
+    # poses are camera to world, with rotations listed row by row
+    transforms = [extrinsic['pose']['transform'] for extrinsic in sfm['poses']]
+    R = flip_axes(np.swapaxes(np.array([transform['rotation'] for transform in transforms], dtype=np.float64).reshape(-1, 3, 3), -1, -2))
+    t = camera_translation(R, np.array([transform['center'] for transform in transforms], dtype=np.float64).reshape(-1, 3))
 
     for i, extrinsic in enumerate(sfm['poses']):
         view = views_by_pose[extrinsic['poseId']][0]
         intrinsic = intrinsics[view['intrinsicId']]
-        transform = extrinsic['pose']['transform']
-
-        R = Matrix(tuple([tuple(map(float, transform['rotation'][i:i+3])) for i in range(0, len(transform['rotation']), 3)]))
-        R.transpose()
-        R.rotate(Euler((pi, 0, 0)))
-        c = Vector(tuple(map(float, transform['center'])))
-        t = -1 * R @ c
-
-        cameras.setdefault(i, {
-            'filename': view['path'],
-            'f': float(intrinsic['pxFocalLength']),
-            'k': tuple(map(float, intrinsic.get('distortionParams', [0, 0, 0]))),
-            't': tuple(t),
-            'R': tuple(map(tuple, tuple(R))),
-            'principal': tuple(map(float, intrinsic['principalPoint'])),
-            'trackers': {},
-        })
-
-    return data
\ No newline at end of file
+
+        builder.add_camera(i, view['path'], float(intrinsic['pxFocalLength']),
+                           tuple(map(float, intrinsic.get('distortionParams', [0, 0, 0]))),
+                           R[i], t[i],
+                           principal=tuple(map(float, intrinsic['principalPoint'])))
+
+    return builder.build()
@@ -1,12 +1,10 @@
 import os
 import re
-import subprocess
 import shutil
 import platform
 
 import bpy
-from math import pi
-from mathutils import Matrix, Vector, Euler
+from ..jobs import run_command
 from ..utils import get_binpath_for_module, get_binary_path
 
 
@@ -29,11 +27,12 @@ def interface_colmap(working_folder, input_file, output_file, execute=True):
         '--input-file', input_file,
         '--output-file', output_file,
     ]
-    print(' '.join(args))
     if execute:
-        retcode = subprocess.call(args)
+        retcode = run_command(args)
         if retcode != 0:
             raise Exception(f'openMVS {os.path.basename(exe)} failed, see system console for details')
+    else:
+        print(' '.join(args))
     return args
 
 
@@ -51,11 +50,12 @@ def reconstruct_mesh(working_folder, input_file='scene.mvs', output_file='scene_
         '--input-file', input_file,
         '--output-file', output_file,
     ]
-    print(' '.join(args))
     if execute:
-        retcode = subprocess.call(args)
+        retcode = run_command(args)
         if retcode != 0:
             raise Exception(f'openMVS {os.path.basename(exe)} failed, see system console for details')
+    else:
+        print(' '.join(args))
     return args
 
 
@@ -87,9 +87,10 @@ def texture_mesh(working_folder, input_file='scene_mesh.mvs', output_file='scene
             # empty colour wasn't a single integer value, skip
             pass
     
-    print(' '.join(args))
     if execute:
-        retcode = subprocess.call(args)
+        retcode = run_command(args)
         if retcode != 0:
             raise Exception(f'openMVS {os.path.basename(exe)} failed, see system console for details')
+    else:
+        print(' '.join(args))
     return args
@@ -35,6 +35,15 @@ for package in packages:
     shutil.copy(os.path.join(cwd, '__init__.py'), basepath)
     shutil.copy(os.path.join(cwd, 'utils.py'), basepath)
     shutil.copy(os.path.join(cwd, 'kmeans.py'), basepath)
+    shutil.copy(os.path.join(cwd, 'reconstruction.py'), basepath)
+    shutil.copy(os.path.join(cwd, 'textwriter.py'), basepath)
+    shutil.copy(os.path.join(cwd, 'imageindex.py'), basepath)
+    shutil.copy(os.path.join(cwd, 'imagesize.py'), basepath)
+    shutil.copy(os.path.join(cwd, 'convert.py'), basepath)
+    shutil.copy(os.path.join(cwd, 'jobs.py'), basepath)
+    shutil.copy(os.path.join(cwd, 'stages.py'), basepath)
+    shutil.copy(os.path.join(cwd, 'ply.py'), basepath)
+    shutil.copy(os.path.join(cwd, 'transforms.py'), basepath)
 
     # copy each feature module
     for feature in package['features']:
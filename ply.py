@@ -0,0 +1,322 @@
+"""
+Reads and writes PLY files with NumPy, e.g. to import dense point clouds and meshes or
+to merge the point clouds PMVS produces for each view cluster. The elements of binary
+files are memory-mapped rather than read into memory, so huge point clouds can be
+cropped and decimated (voxel_sample, points_within) without loading them entirely.
+http://paulbourke.net/dataformats/ply/
+"""
+import os
+import numpy as np
+
+
+PLY_TYPES = {
+    'char': 'i1', 'int8': 'i1',
+    'uchar': 'u1', 'uint8': 'u1',
+    'short': 'i2', 'int16': 'i2',
+    'ushort': 'u2', 'uint16': 'u2',
+    'int': 'i4', 'int32': 'i4',
+    'uint': 'u4', 'uint32': 'u4',
+    'float': 'f4', 'float32': 'f4',
+    'double': 'f8', 'float64': 'f8',
+}
+PLY_NAMES = {np.dtype(v).str[1:]: k for k, v in PLY_TYPES.items() if not k[-1].isdigit()}
+PLY_FORMATS = {'binary_little_endian': '<', 'binary_big_endian': '>', 'ascii': None}
+
+
+def read_header(f):
+    """
+    Reads a PLY header from a binary file.
+    :returns: (format, [(element name, count, [(property name, type), ...]), ...]) where the
+              type of a list property is a tuple of its count and item types
+    """
+    if f.readline().strip() != b'ply':
+        raise ValueError('Not a PLY file')
+    fmt = None
+    elements = []
+    while True:
+        line = f.readline()
+        if not line:
+            raise ValueError('PLY header is incomplete')
+        words = line.decode('ascii', 'replace').split()
+        if not words or words[0] in ('comment', 'obj_info'):
+            continue
+        if words[0] == 'end_header':
+            break
+        if words[0] == 'format':
+            fmt = words[1]
+            if fmt not in PLY_FORMATS:
+                raise ValueError(f'Unknown PLY format {fmt}')
+        elif words[0] == 'element':
+            elements.append((words[1], int(words[2]), []))
+        elif words[0] == 'property':
+            if words[1] == 'list':
+                elements[-1][2].append((words[4], (words[2], words[3])))
+            else:
+                elements[-1][2].append((words[2], words[1]))
+    return fmt, elements
+
+
+def read_ply(path):
+    """
+    Reads every element of a PLY file.
+    :returns: {element name: {property name: values}} where values is an array for scalar
+              properties, and a tuple of (counts, values) arrays for list properties
+    """
+    with open(path, 'rb') as f:
+        fmt, elements = read_header(f)
+        offset = f.tell()
+
+    byteorder = PLY_FORMATS[fmt]
+    if byteorder is None:
+        return _read_ascii(path, offset, elements)
+
+    result = {}
+    for name, count, properties in elements:
+        if any(isinstance(t, tuple) for _, t in properties):
+            result[name], offset = _read_list_element(path, offset, count, properties, byteorder)
+        else:
+            dtype = np.dtype([(p, byteorder + PLY_TYPES[t]) for p, t in properties])
+            data = _map(path, dtype, offset, count)
+            result[name] = {p: data[p] for p, _ in properties}
+            offset += dtype.itemsize * count
+    return result
+
+
+def _map(path, dtype, offset, count):
+    if not count:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(count,))
+
+
+def _read_list_element(path, offset, count, properties, byteorder):
+    """ Reads an element with list properties, e.g. faces, returning its properties and the offset following it """
+    # assume every list is as long as those in the first record (e.g. all triangles), so the element has a fixed size
+    fields = []
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        for p, t in properties:
+            if isinstance(t, tuple):
+                count_type, item_type = (np.dtype(byteorder + PLY_TYPES[x]) for x in t)
+                length = int(np.frombuffer(f.read(count_type.itemsize), dtype=count_type)[0]) if count else 0
+                f.seek(length * item_type.itemsize, 1)
+                fields += [(p + '_count', count_type), (p, item_type, (length,))]
+            else:
+                dtype = np.dtype(byteorder + PLY_TYPES[t])
+                f.seek(dtype.itemsize, 1)
+                fields.append((p, dtype))
+
+    # a file too short to hold every record at that size must have shorter lists later on
+    dtype = np.dtype(fields)
+    if offset + dtype.itemsize * count <= os.path.getsize(path):
+        data = _map(path, dtype, offset, count)
+        lists = [(p, data[p].shape[1]) for p, t in properties if isinstance(t, tuple)]
+        if all((data[p + '_count'] == length).all() for p, length in lists):
+            element = {}
+            for p, t in properties:
+                if isinstance(t, tuple):
+                    element[p] = (data[p + '_count'], data[p].reshape(-1))
+                else:
+                    element[p] = data[p]
+            return element, offset + dtype.itemsize * count
+
+    # lists of varying length (e.g. triangles and quads), read one record at a time
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        buffer = f.read()
+    values = {p: [] for p, _ in properties}
+    counts = {p: [] for p, t in properties if isinstance(t, tuple)}
+    position = 0
+    for _ in range(count):
+        for p, t in properties:
+            if isinstance(t, tuple):
+                count_type, item_type = (np.dtype(byteorder + PLY_TYPES[x]) for x in t)
+                length = int(np.frombuffer(buffer, dtype=count_type, count=1, offset=position)[0])
+                position += count_type.itemsize
+                values[p].append(np.frombuffer(buffer, dtype=item_type, count=length, offset=position))
+                counts[p].append(length)
+                position += length * item_type.itemsize
+            else:
+                dtype = np.dtype(byteorder + PLY_TYPES[t])
+                values[p].append(np.frombuffer(buffer, dtype=dtype, count=1, offset=position)[0])
+                position += dtype.itemsize
+    element = {}
+    for p, t in properties:
+        if isinstance(t, tuple):
+            item_type = np.dtype(PLY_TYPES[t[1]])
+            element[p] = (np.array(counts[p], dtype=np.int64),
+                          np.concatenate(values[p]).astype(item_type) if values[p] else np.zeros(0, dtype=item_type))
+        else:
+            element[p] = np.array(values[p], dtype=PLY_TYPES[t])
+    return element, offset + position
+
+
+def _read_ascii(path, offset, elements):
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        tokens = np.fromstring(f.read().decode('ascii'), dtype=np.float64, sep=' ')
+
+    result = {}
+    position = 0
+    for name, count, properties in elements:
+        if not any(isinstance(t, tuple) for _, t in properties):
+            values = tokens[position:position + count * len(properties)].reshape(count, len(properties))
+            result[name] = {p: values[:, i].astype(PLY_TYPES[t]) for i, (p, t) in enumerate(properties)}
+            position += count * len(properties)
+            continue
+
+        values = {p: [] for p, _ in properties}
+        counts = {p: [] for p, t in properties if isinstance(t, tuple)}
+        for _ in range(count):
+            for p, t in properties:
+                if isinstance(t, tuple):
+                    length = int(tokens[position])
+                    values[p].append(tokens[position + 1:position + 1 + length])
+                    counts[p].append(length)
+                    position += 1 + length
+                else:
+                    values[p].append(tokens[position])
+                    position += 1
+        result[name] = {}
+        for p, t in properties:
+            if isinstance(t, tuple):
+                result[name][p] = (np.array(counts[p], dtype=np.int64),
+                                   np.concatenate(values[p] or [np.zeros(0)]).astype(PLY_TYPES[t[1]]))
+            else:
+                result[name][p] = np.array(values[p]).astype(PLY_TYPES[t])
+    return result
+
+
+def vertex_coords(vertex, indices):
+    """ (n, 3) positions of the given vertices of a vertex element returned by read_ply """
+    return np.stack([vertex['x'][indices], vertex['y'][indices], vertex['z'][indices]], axis=1).astype(np.float64)
+
+
+def _chunks(count, indices, chunk_size):
+    """ Slices or index arrays covering every vertex, or only the given indices, chunk_size at a time """
+    for start in range(0, count if indices is None else len(indices), chunk_size):
+        yield slice(start, min(start + chunk_size, count)) if indices is None else indices[start:start + chunk_size]
+
+
+def points_within(vertex, lower, upper, indices=None, chunk_size=1 << 22):
+    """ Indices of the vertices (of all, or of the given indices) within the box from lower to upper """
+    lower, upper = np.asarray(lower, dtype=np.float64), np.asarray(upper, dtype=np.float64)
+    count = len(vertex['x'])
+    result = []
+    for chunk in _chunks(count, indices, chunk_size):
+        co = vertex_coords(vertex, chunk)
+        inside = np.flatnonzero(((co >= lower) & (co <= upper)).all(axis=1))
+        result.append(inside + chunk.start if isinstance(chunk, slice) else chunk[inside])
+    return np.concatenate(result) if result else np.zeros(0, dtype=np.int64)
+
+
+def voxel_sample(vertex, target, indices=None, oversample=16, seed=0):
+    """
+    Decimates vertices (all, or the given indices) to roughly the target number, evenly
+    spread through space rather than following the density of the reconstruction.
+
+    A random subset of oversample * target vertices stands in for the cloud. Their Morton
+    codes are sorted once, so each level of an octree over them is a voxel grid where the
+    first vertex in each occupied cell is kept. The coarsest level with no fewer occupied
+    cells than the target is used, randomly thinned to the target.
+    :returns: sorted vertex indices
+    """
+    count = len(vertex['x']) if indices is None else len(indices)
+    if count <= target:
+        return np.arange(count) if indices is None else np.sort(indices)
+
+    random = np.random.RandomState(seed)
+    if oversample * target < count:
+        chosen = np.zeros(count, dtype=bool)
+        chosen[random.randint(0, count, oversample * target)] = True
+        candidates = np.flatnonzero(chosen)
+    else:
+        candidates = np.arange(count)
+    if indices is not None:
+        candidates = np.sort(np.asarray(indices)[candidates])
+    co = vertex_coords(vertex, candidates)
+    lower = co.min(axis=0)
+    extent = max(float((co.max(axis=0) - lower).max()), 1e-9)
+    cells = np.minimum((co - lower) * ((1 << 21) / extent), (1 << 21) - 1).astype(np.int64)
+
+    codes = _spread(cells[:, 0]) << 2 | _spread(cells[:, 1]) << 1 | _spread(cells[:, 2])
+    order = np.argsort(codes, kind='stable')
+    codes = codes[order]
+
+    # from the coarsest level, each cell being 8 cells of the level below
+    first = np.zeros(1, dtype=np.int64)
+    for level in range(20, -1, -1):
+        shifted = codes >> (3 * level)
+        first = np.flatnonzero(np.r_[True, shifted[1:] != shifted[:-1]])
+        if len(first) >= target:
+            break
+    if len(first) > target:
+        first = random.choice(first, target, replace=False)
+    return np.sort(candidates[order[first]])
+
+
+def _spread(v):
+    """ Spreads the lowest 21 bits of each value to every third bit, for interleaving into Morton codes """
+    v = v & 0x1FFFFF
+    v = (v | v << 32) & 0x1F00000000FFFF
+    v = (v | v << 16) & 0x1F0000FF0000FF
+    v = (v | v << 8) & 0x100F00F00F00F00F
+    v = (v | v << 4) & 0x10C30C30C30C30C3
+    v = (v | v << 2) & 0x1249249249249249
+    return v
+
+
+def _read_vertex_element(path):
+    """ The vertex element of a PLY file as returned by read_ply, checking it can be held in a structured array """
+    vertex = read_ply(path).get('vertex')
+    if vertex is None:
+        raise ValueError(f'{path} has no vertices')
+    if any(isinstance(values, tuple) for values in vertex.values()):
+        raise ValueError(f'{path} has list properties on its vertices')
+    return vertex
+
+
+def read_vertices(path):
+    """ Reads the vertex element of a PLY file into memory as a structured array """
+    vertex = _read_vertex_element(path)
+    vertices = np.empty(len(next(iter(vertex.values()), ())), dtype=[(p, values.dtype.newbyteorder('=')) for p, values in vertex.items()])
+    for p, values in vertex.items():
+        vertices[p] = values
+    return vertices
+
+
+def _vertex_header(dtype, count):
+    header = ['ply', 'format binary_little_endian 1.0', f'element vertex {count}']
+    header += [f'property {PLY_NAMES[dtype[p].str[1:]]} {p}' for p in dtype.names]
+    header += ['end_header']
+    return ('\n'.join(header) + '\n').encode('ascii')
+
+
+def write_vertices(path, vertices):
+    """ Writes a structured array of vertices as a binary little endian PLY file """
+    dtype = vertices.dtype.newbyteorder('<')
+    with open(path, 'wb') as f:
+        f.write(_vertex_header(dtype, len(vertices)))
+        np.ascontiguousarray(vertices, dtype=dtype).tofile(f)
+
+
+def merge_vertices(paths, target, chunk_size=1 << 20):
+    """
+    Concatenates the vertices of PLY files with the same properties into a single binary
+    file. The vertices of binary files are memory-mapped and copied chunk_size at a time.
+    """
+    vertices = [_read_vertex_element(path) for path in paths]
+    names = list(vertices[0])
+    if any(list(vertex) != names for vertex in vertices):
+        raise ValueError('PLY files to merge must have the same vertex properties')
+    dtype = np.dtype([(p, values.dtype.newbyteorder('<')) for p, values in vertices[0].items()])
+    counts = [len(next(iter(vertex.values()), ())) for vertex in vertices]
+
+    with open(target, 'wb') as f:
+        f.write(_vertex_header(dtype, sum(counts)))
+        buffer = np.empty(min(chunk_size, max(counts, default=0)), dtype=dtype)
+        for vertex, count in zip(vertices, counts):
+            for chunk in _chunks(count, None, chunk_size):
+                block = buffer[:chunk.stop - chunk.start]
+                for p in names:
+                    block[p] = vertex[p][chunk]
+                block.tofile(f)
@@ -0,0 +1,42 @@
+import numpy as np
+
+
+def cluster_cameras(covisibility, clusters, overlap=0.5):
+    """
+    Splits cameras into view clusters for PMVS, in the spirit of CMVS, using the number of
+    points each pair of cameras sees in common.
+
+    Cameras are divided into the given number of clusters of similar size, each grown
+    greedily from the unassigned camera with the most shared points, by adding the camera
+    sharing the most points with the cluster so far. Each cluster is then extended with the
+    cameras outside of it sharing the most points with it (up to overlap * its size), which
+    PMVS uses for matching only so points along the cluster boundaries are still
+    reconstructed.
+    :returns: list of (targets, others) camera index arrays, one per cluster
+    """
+    n = len(covisibility)
+    shared = np.array(covisibility, dtype=np.float64)
+    np.fill_diagonal(shared, 0)
+    size = int(np.ceil(n / max(1, clusters)))
+
+    unassigned = np.ones(n, dtype=bool)
+    result = []
+    while unassigned.any():
+        remaining = np.flatnonzero(unassigned)
+        seed = remaining[np.argmax(shared[np.ix_(remaining, remaining)].sum(axis=1))]
+        members = [seed]
+        unassigned[seed] = False
+        affinity = shared[seed].copy()
+        while len(members) < size and unassigned.any():
+            candidates = np.flatnonzero(unassigned)
+            best = candidates[np.argmax(affinity[candidates])]
+            members.append(best)
+            unassigned[best] = False
+            affinity += shared[best]
+
+        outside = np.ones(n, dtype=bool)
+        outside[members] = False
+        candidates = np.flatnonzero(outside & (affinity > 0))
+        others = candidates[np.argsort(-affinity[candidates], kind='stable')][:int(overlap * len(members))]
+        result.append((np.sort(members), np.sort(others)))
+    return result
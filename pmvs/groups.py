@@ -9,7 +9,11 @@ class PHOTOGRAMMETRY_PG_pmvs(PropertyGroup):
     threshold: FloatProperty(name='Threshold', default=0.7, min=0.15, description='A patch reconstruction is accepted as a success and kept, if its associcated photometric consistency measure is above this threshold. The software repeats three iterations of the reconstruction pipeline, and this threshold is relaxed (decreased) by 0.05 at the end of each iteration')
     wsize: IntProperty(name='Window Size', default=7, min=1, description='The software samples wsize x wsize pixel colors from each image to compute photometric consistency score.  Increasing the value leads to more stable reconstructions, but the program becomes slower')
     minImageNum: IntProperty(name='Min Image Num', default=3, min=2, description='Each 3D point must be visible in at least this many images to be reconstructed. If images are poor quality, increase this value')
+    clusters: IntProperty(name='Clusters', default=1, min=1, description='Number of overlapping view clusters to reconstruct separately and merge, each using a share of the images')
+    overlap: FloatProperty(name='Cluster Overlap', default=0.5, min=0.0, max=2.0, description='Images outside each cluster sharing the most points with it are also used to match its points, up to this fraction of the cluster size')
+    workers: IntProperty(name='Parallel Processes', default=0, min=0, description='Number of PMVS processes to run at once, 0 uses the Parallel Workers preference')
     import_points: BoolProperty(name='Import point cloud after reconstruction', default=False)
+    preview_points: IntProperty(name='Preview Points', default=0, min=0, description='Import the point cloud as a decimated preview of roughly this many points, leaving the full reconstruction on disk to load on demand (0 = every point)')
     
     def draw(self, layout):
         layout.prop(self, 'dirpath')
@@ -18,4 +22,10 @@ class PHOTOGRAMMETRY_PG_pmvs(PropertyGroup):
         layout.prop(self, 'threshold')
         layout.prop(self, 'wsize')
         layout.prop(self, 'minImageNum')
+        layout.prop(self, 'clusters')
+        if self.clusters > 1:
+            layout.prop(self, 'overlap')
+            layout.prop(self, 'workers')
         layout.prop(self, 'import_points')
+        if self.import_points:
+            layout.prop(self, 'preview_points')
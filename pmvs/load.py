@@ -1,13 +1,20 @@
 import os
 import re
-import subprocess
 import shutil
+import filecmp
 import platform
 
 import bpy
 
+import numpy as np
+
 from ..bundler.load import load as load_bundler
-from ..utils import set_active_collection, get_binpath_for_module, get_binary_path
+from ..jobs import call_main, run_command
+from ..ply import merge_vertices
+from ..reconstruction import as_reconstruction
+from ..stages import Stage, StageGraph
+from ..utils import set_active_collection, get_binpath_for_module, get_binary_path, get_worker_count, import_ply
+from .clusters import cluster_cameras
 
 
 class BundlerProperties(object):
@@ -21,7 +28,8 @@ def prepare_workspace(properties, data):
     Prepares a PMVS workspace.
     :returns: Path to the PMVS options file
     """
-    dirpath = bpy.path.abspath(properties.dirpath)
+    # relative paths are resolved against the blend file, which can only be read on the main thread
+    dirpath = call_main(bpy.path.abspath, properties.dirpath)
     if not dirpath:
         raise AttributeError('PMVS Workspace Directory must be provided for output')
 
@@ -31,80 +39,139 @@ def prepare_workspace(properties, data):
     # running PMVS requires transforming to Bundler first
     load_bundler(BundlerProperties(dirpath=dirpath), data)
 
-    cwd = os.getcwd()
-    try:
-        os.chdir(dirpath)
-        subprocess.call([get_binary_path(binpath, 'Bundle2PMVS'), 'list.txt', 'bundle.out', target, ])
-        subprocess.call([get_binary_path(binpath, 'RadialUndistort'), 'list.txt', 'bundle.out', target, ])
-
-        def mkdir(path):
-            if not os.path.exists(path):
-                os.mkdir(path)
-
-        mkdir(os.path.join(target, 'models'))
-        mkdir(os.path.join(target, 'txt'))
-        mkdir(os.path.join(target, 'visualize'))
-
-        with open(os.path.join(target, 'list.rd.txt'), 'r') as f:
-            images = f.readlines()
-
-        # copy 00000000.txt to txt\00000000.txt
-        # copy image.rd.jpg to visualize\00000000.jpg
-
-        # v0.3 format
-        #int_format = '{:0>4}'
-
-        # v0.4 format
-        int_format = '{:0>8}'
-
-        for i, path in enumerate(images):
-            shutil.move(
-                os.path.join(target, (int_format + '.txt').format(i)),
-                os.path.join(target, 'txt', (int_format + '.txt').format(i)))
-            shutil.move(
-                os.path.join(target, '{}.rd.jpg'.format(os.path.basename(os.path.splitext(path)[0]))),
-                os.path.join(target, 'visualize', (int_format + '.jpg').format(i)))
-
-        # rewrite list.txt to include path to visualize\00000000.jpg
-        with open(os.path.join(target, 'list.rd.txt'), 'w+') as f:
-            f.writelines([('visualize\\' + int_format + '.jpg\n').format(i) for i, data in enumerate(images)])
-
-        # rewrite pmvs_options.txt to skip vis.dat as we won't be using cmvs here
-        pmvs_options = {
-            'level': properties.level,
-            'csize': properties.csize,
-            'threshold': properties.threshold,
-            'wsize': properties.wsize,
-            'minImageNum': properties.minImageNum,
-            'useVisData': 0,
-        }
-        pattern = re.compile(r'^([^\s]+)\s')
-        with open(os.path.join(target, 'pmvs_options.txt'), 'r') as f:
-            lines = f.readlines()
-            for i, line in enumerate(lines):
-                match = pattern.search(line)
-                if match and match.group(1) in pmvs_options:
-                    lines[i] = '{key} {value}\n'.format(key=match.group(1), value=pmvs_options[match.group(1)])
-        
-        os.chdir(target)
-        options_path = 'reconstruction'
-        with open(options_path, 'w+') as f:
-            f.writelines(lines)
+    # run the binaries from within the bundler directory, without changing Blender's working directory
+    workspace = os.path.join(dirpath, target)
+    run_command([get_binary_path(binpath, 'Bundle2PMVS'), 'list.txt', 'bundle.out', target, ], cwd=dirpath)
+    run_command([get_binary_path(binpath, 'RadialUndistort'), 'list.txt', 'bundle.out', target, ], cwd=dirpath)
+
+    def mkdir(path):
+        if not os.path.exists(path):
+            os.mkdir(path)
+
+    mkdir(os.path.join(workspace, 'models'))
+    mkdir(os.path.join(workspace, 'txt'))
+    mkdir(os.path.join(workspace, 'visualize'))
+
+    with open(os.path.join(workspace, 'list.rd.txt'), 'r') as f:
+        images = f.readlines()
+
+    # copy 00000000.txt to txt\00000000.txt
+    # copy image.rd.jpg to visualize\00000000.jpg
+
+    # v0.3 format
+    #int_format = '{:0>4}'
+
+    # v0.4 format
+    int_format = '{:0>8}'
+
+    # files that haven't changed are left alone, so the PMVS stages reading them aren't run again
+    for i, path in enumerate(images):
+        move_if_changed(
+            os.path.join(workspace, (int_format + '.txt').format(i)),
+            os.path.join(workspace, 'txt', (int_format + '.txt').format(i)))
+        move_if_changed(
+            os.path.join(workspace, '{}.rd.jpg'.format(os.path.basename(os.path.splitext(path)[0]))),
+            os.path.join(workspace, 'visualize', (int_format + '.jpg').format(i)))
+
+    # rewrite list.txt to include path to visualize\00000000.jpg
+    with open(os.path.join(workspace, 'list.rd.txt'), 'w+') as f:
+        f.writelines([('visualize\\' + int_format + '.jpg\n').format(i) for i, data in enumerate(images)])
+
+    # rewrite pmvs_options.txt to skip vis.dat as we won't be using cmvs here
+    pmvs_options = {
+        'level': properties.level,
+        'csize': properties.csize,
+        'threshold': properties.threshold,
+        'wsize': properties.wsize,
+        'minImageNum': properties.minImageNum,
+        'useVisData': 0,
+    }
+    with open(os.path.join(workspace, 'pmvs_options.txt'), 'r') as f:
+        lines = f.readlines()
+
+    options_path = 'reconstruction'
+    write_options(os.path.join(workspace, options_path), lines, pmvs_options)
 
-        return os.path.join(dirpath, target, options_path)
+    return os.path.join(dirpath, target, options_path)
 
-    finally:
-        os.chdir(cwd)
 
 # https://www.di.ens.fr/pmvs/documentation.html
 def load(properties, data, *args, **kwargs):
+    data = as_reconstruction(data)
     options_path = prepare_workspace(properties, data)
-    os.chdir(os.path.dirname(options_path))
-    
+    workspace = os.path.dirname(options_path)
+    model = os.path.join(workspace, 'models', 'reconstruction.ply')
+
     binpath = get_binpath_for_module(os.path.realpath(__file__))
-    subprocess.call([get_binary_path(binpath, 'pmvs2'), '.{}'.format(os.sep), os.path.basename(options_path), ])
+    pmvs2 = get_binary_path(binpath, 'pmvs2')
+    workers = properties.workers or get_worker_count()
+    inputs = [os.path.join(workspace, 'txt'), os.path.join(workspace, 'visualize')]
+
+    if properties.clusters <= 1:
+        stages = [Stage('pmvs2', [pmvs2, '.{}'.format(os.sep), os.path.basename(options_path)],
+                        inputs=[options_path] + inputs, outputs=[model], cwd=workspace)]
+    else:
+        # Bundle2PMVS only keeps cameras with a focal length, PMVS image indices are their positions within those
+        registered = np.flatnonzero(data.focal != 0)
+        covisibility = data.covisibility()[np.ix_(registered, registered)]
+        with open(options_path, 'r') as f:
+            lines = f.readlines()
+
+        # split the CPU threads PMVS uses between the processes running at once
+        cpus = max(1, (os.cpu_count() or 1) // min(workers, properties.clusters))
+        stages = []
+        for i, (targets, others) in enumerate(cluster_cameras(covisibility, properties.clusters, properties.overlap)):
+            name = 'option-{:0>4}'.format(i)
+            write_options(os.path.join(workspace, name), lines, {
+                'CPU': cpus,
+                'timages': ' '.join(map(str, [len(targets)] + targets.tolist())),
+                'oimages': ' '.join(map(str, [len(others)] + others.tolist())),
+            })
+            stages.append(Stage(f'pmvs2 {name}', [pmvs2, '.{}'.format(os.sep), name],
+                                inputs=[os.path.join(workspace, name)] + inputs,
+                                outputs=[os.path.join(workspace, 'models', f'{name}.ply')], cwd=workspace))
+
+        # merged once every cluster is reconstructed, and again only when any of them change
+        clusters = [p for stage in stages for p in stage.outputs]
+        stages.append(Stage('merge clusters', ['merge_vertices'], inputs=clusters, outputs=[model],
+                            func=lambda: merge_vertices([p for p in clusters if os.path.exists(p)], model)))
+
+    # clusters are reconstructed by separate pmvs2 processes at once
+    StageGraph(stages, os.path.join(workspace, '.stages.json')).run(workers=workers)
 
-    model = os.path.join('models', 'reconstruction.ply')
     if os.path.exists(model) and properties.import_points:
-        set_active_collection(**kwargs)
-        bpy.ops.import_mesh.ply(filepath=model)
+        call_main(import_points, model, properties.preview_points, **kwargs)
+
+
+def write_options(path, lines, options):
+    """
+    Writes a PMVS options file from the lines of another, replacing the values of the given
+    options. An existing file with the same options is left untouched.
+    """
+    pattern = re.compile(r'^([^\s]+)\s')
+    lines = list(lines)
+    for i, line in enumerate(lines):
+        match = pattern.search(line)
+        if match and match.group(1) in options:
+            lines[i] = '{key} {value}\n'.format(key=match.group(1), value=options.pop(match.group(1)))
+    lines += ['{key} {value}\n'.format(key=key, value=value) for key, value in options.items()]
+    try:
+        with open(path, 'r') as f:
+            if f.readlines() == lines:
+                return
+    except OSError:
+        pass
+    with open(path, 'w+') as f:
+        f.writelines(lines)
+
+
+def move_if_changed(source, target):
+    """ Moves source to target, unless target already has the same content, in which case source is removed """
+    if os.path.exists(target) and filecmp.cmp(source, target, shallow=False):
+        os.remove(source)
+    else:
+        shutil.move(source, target)
+
+
+def import_points(model, points=0, **kwargs):
+    import_ply(model, collection=set_active_collection(**kwargs), points=points)
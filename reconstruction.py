@@ -0,0 +1,481 @@
+"""
+Columnar interchange format shared by every importer and exporter.
+
+Cameras, points and observations are held as NumPy arrays rather than nested dicts:
+
+    cameras:      camera_ids (N,) int64, filenames [N], focal (N,), distortion (N, 3),
+                  rotation (N, 3, 3), translation (N, 3), principal (N, 2) (NaN when absent)
+    points:       point_ids (P,) int64, coords (P, 3) float64, colours (P, 3) uint8,
+                  errors (P,) float64 (NaN when absent)
+    observations: CSR table sorted by point, where the observations of point p are
+                  track_cameras[track_offsets[p]:track_offsets[p + 1]] (camera index) and
+                  track_xy[...] (pixel position, origin in image centre)
+
+For compatibility, a Reconstruction also behaves like the legacy dict:
+    data['resolution'], data['cameras'][id]['trackers'][tid], data['trackers'][tid]['co'], etc.
+"""
+from array import array
+from collections.abc import Mapping, MutableMapping
+
+import numpy as np
+
+
+def _lookup(ids, keys, name):
+    """ Maps each value in keys to its index in ids """
+    ids = np.asarray(ids)
+    keys = np.asarray(keys, dtype=np.int64)
+    if not len(keys):
+        return np.zeros(0, dtype=np.int64)
+    sorter = np.argsort(ids, kind='stable')
+    pos = np.searchsorted(ids, keys, sorter=sorter)
+    pos[pos >= len(ids)] = 0
+    found = sorter[pos] if len(ids) else pos
+    if len(ids) == 0 or np.any(ids[found] != keys):
+        raise KeyError(f'Observation references unknown {name}')
+    return found
+
+
+class Reconstruction(Mapping):
+    def __init__(self, camera_ids=None, filenames=None, focal=None, distortion=None, rotation=None,
+                 translation=None, principal=None, camera_extras=None,
+                 point_ids=None, coords=None, colours=None, errors=None,
+                 track_points=None, track_cameras=None, track_xy=None, resolution=None):
+        """
+        All observation arrays are given in index space: track_points indexes the points
+        and track_cameras indexes the cameras. Observations may be given in any order and
+        will be sorted into a per-point CSR table, ordered by camera index within a point.
+        Duplicate (point, camera) observations keep the first occurrence.
+        """
+        filenames = list(filenames or [])
+        n = len(filenames)
+        self.filenames = filenames
+        self.camera_ids = np.arange(n, dtype=np.int64) if camera_ids is None else np.asarray(camera_ids, dtype=np.int64)
+        self.focal = np.zeros(n) if focal is None else np.asarray(focal, dtype=np.float64).reshape(n)
+        self.distortion = np.zeros((n, 3)) if distortion is None else np.asarray(distortion, dtype=np.float64).reshape(n, 3)
+        self.rotation = np.tile(np.eye(3), (n, 1, 1)) if rotation is None else np.asarray(rotation, dtype=np.float64).reshape(n, 3, 3)
+        self.translation = np.zeros((n, 3)) if translation is None else np.asarray(translation, dtype=np.float64).reshape(n, 3)
+        self.principal = np.full((n, 2), np.nan) if principal is None else np.asarray(principal, dtype=np.float64).reshape(n, 2)
+        # any additional per-camera values (name -> list of length N, None when absent)
+        self.camera_extras = dict(camera_extras or {})
+
+        self.coords = np.zeros((0, 3)) if coords is None else np.asarray(coords, dtype=np.float64).reshape(-1, 3)
+        p = len(self.coords)
+        self.point_ids = np.arange(p, dtype=np.int64) if point_ids is None else np.asarray(point_ids, dtype=np.int64)
+        self.colours = np.zeros((p, 3), dtype=np.uint8) if colours is None else np.asarray(colours).reshape(p, 3).astype(np.uint8, copy=False)
+        self.errors = np.full(p, np.nan) if errors is None else np.asarray(errors, dtype=np.float64).reshape(p)
+
+        track_points = np.zeros(0, dtype=np.int64) if track_points is None else np.asarray(track_points, dtype=np.int64)
+        track_cameras = np.zeros(0, dtype=np.int64) if track_cameras is None else np.asarray(track_cameras, dtype=np.int64)
+        track_xy = np.zeros((0, 2)) if track_xy is None else np.asarray(track_xy, dtype=np.float64).reshape(-1, 2)
+
+        # sort observations by point, then camera, and drop duplicate (point, camera) pairs
+        order = np.lexsort((track_cameras, track_points))
+        track_points = track_points[order]
+        track_cameras = track_cameras[order]
+        keep = np.ones(len(order), dtype=bool)
+        keep[1:] = (track_points[1:] != track_points[:-1]) | (track_cameras[1:] != track_cameras[:-1])
+        self.track_cameras = track_cameras[keep].astype(np.int32)
+        self.track_xy = track_xy[order[keep]]
+        self.track_offsets = np.zeros(p + 1, dtype=np.int64)
+        np.cumsum(np.bincount(track_points[keep], minlength=p), out=self.track_offsets[1:])
+
+        self.resolution = tuple(map(int, resolution)) if resolution else None
+        self._camera_tracks = None
+        self._camera_index = None
+        self._point_index = None
+
+    @classmethod
+    def from_dict(cls, data):
+        """ Converts the legacy nested dict interchange format """
+        builder = ReconstructionBuilder()
+        for cid, camera in data.get('cameras', {}).items():
+            extras = {key: value for key, value in camera.items()
+                      if key not in ('filename', 'f', 'k', 'R', 't', 'principal', 'trackers')}
+            builder.add_camera(cid, camera['filename'], camera['f'], camera.get('k', (0, 0, 0)), camera['R'], camera['t'],
+                               principal=camera.get('principal', None), **extras)
+        trackers = data.get('trackers', {})
+        for tid, tracker in trackers.items():
+            builder.add_point(tid, tracker['co'], tracker.get('rgb', (0, 0, 0)), tracker.get('error', None))
+        for cid, camera in data.get('cameras', {}).items():
+            for tid, co in camera.get('trackers', {}).items():
+                # observations of unknown points were never exported, so discard them here
+                if tid in trackers:
+                    builder.add_observation(tid, cid, co)
+        return builder.build(resolution=data.get('resolution', None))
+
+    @property
+    def num_cameras(self):
+        return len(self.filenames)
+
+    @property
+    def num_points(self):
+        return len(self.coords)
+
+    @property
+    def num_observations(self):
+        return len(self.track_cameras)
+
+    @property
+    def track_lengths(self):
+        return np.diff(self.track_offsets)
+
+    @property
+    def track_points(self):
+        """ Point index of each observation in the CSR table """
+        return np.repeat(np.arange(self.num_points), self.track_lengths)
+
+    @property
+    def intrinsics(self):
+        """ (N, 3, 3) calibration matrices, using the image centre where no principal point is known """
+        K = np.zeros((self.num_cameras, 3, 3))
+        K[:, 0, 0] = K[:, 1, 1] = self.focal
+        K[:, 2, 2] = 1.0
+        principal = self.principal.copy()
+        if self.resolution:
+            centre = np.array(self.resolution, dtype=np.float64) / 2.0
+            principal = np.where(np.isnan(principal), centre, principal)
+        K[:, 0:2, 2] = principal
+        return K
+
+    def camera_index(self, camera_id):
+        if self._camera_index is None:
+            self._camera_index = {cid: idx for idx, cid in enumerate(self.camera_ids.tolist())}
+        return self._camera_index[camera_id]
+
+    def point_index(self, point_id):
+        if self._point_index is None:
+            self._point_index = {tid: idx for idx, tid in enumerate(self.point_ids.tolist())}
+        return self._point_index[point_id]
+
+    def camera_tracks(self):
+        """
+        Camera-major view of the observation table, computed once and cached.
+        :returns: (offsets (N+1,), order (M,)) where the observations seen by camera i are
+                  order[offsets[i]:offsets[i + 1]], sorted by point index.
+        """
+        if self._camera_tracks is None:
+            order = np.argsort(self.track_cameras, kind='stable')
+            offsets = np.zeros(self.num_cameras + 1, dtype=np.int64)
+            np.cumsum(np.bincount(self.track_cameras, minlength=self.num_cameras), out=offsets[1:])
+            self._camera_tracks = (offsets, order)
+        return self._camera_tracks
+
+    def covisibility(self, chunk_size=1 << 22):
+        """
+        (N, N) matrix of the number of points seen by each pair of cameras, where the diagonal
+        is the number of points each camera sees. Tracks of the same length are expanded into
+        camera pairs together, in chunks of at most chunk_size pairs.
+        """
+        n = self.num_cameras
+        counts = np.zeros(n * n, dtype=np.int64)
+        lengths = self.track_lengths
+        starts = self.track_offsets[:-1]
+        for length in np.unique(lengths).tolist():
+            if not length:
+                continue
+            a, b = np.triu_indices(length)
+            group = starts[lengths == length]
+            step = max(1, chunk_size // len(a))
+            for first in range(0, len(group), step):
+                tracks = self.track_cameras[group[first:first + step, None] + np.arange(length)].astype(np.int64)
+                counts += np.bincount((tracks[:, a] * n + tracks[:, b]).ravel(), minlength=n * n)
+        counts = counts.reshape(n, n)
+        # cameras within a track are sorted, so only the upper triangle has been counted
+        return counts + np.triu(counts, 1).T
+
+    # legacy dict interface
+    def __getitem__(self, key):
+        if key == 'cameras':
+            return _CamerasView(self)
+        elif key == 'trackers':
+            return _TrackersView(self)
+        elif key == 'resolution' and self.resolution:
+            return self.resolution
+        raise KeyError(key)
+
+    def __iter__(self):
+        if self.resolution:
+            yield 'resolution'
+        yield 'cameras'
+        yield 'trackers'
+
+    def __len__(self):
+        return 3 if self.resolution else 2
+
+    def __repr__(self):
+        return (f'<Reconstruction: {self.num_cameras} cameras, {self.num_points} points, '
+                f'{self.num_observations} observations, resolution={self.resolution}>')
+
+
+def as_reconstruction(data):
+    """ Returns data as a Reconstruction, converting from the legacy dict format if required """
+    if isinstance(data, Reconstruction):
+        return data
+    return Reconstruction.from_dict(data)
+
+
+class ReconstructionBuilder(object):
+    """
+    Accumulates cameras, points and observations into compact typed buffers, keyed by
+    their source ids, and produces a Reconstruction. Both single values and NumPy arrays
+    may be appended.
+    """
+    def __init__(self):
+        self.camera_ids = array('q')
+        self.filenames = []
+        self.focal = array('d')
+        self.distortion = array('d')
+        self.rotation = array('d')
+        self.translation = array('d')
+        self.principal = array('d')
+        self.camera_extras = {}
+
+        self.point_ids = array('q')
+        self.coords = array('d')
+        self.colours = array('B')
+        self.errors = array('d')
+
+        self.track_point_ids = array('q')
+        self.track_camera_ids = array('q')
+        self.track_xy = array('d')
+
+    def add_camera(self, camera_id, filename, f, k, R, t, principal=None, **extras):
+        index = len(self.filenames)
+        self.camera_ids.append(int(camera_id))
+        self.filenames.append(filename)
+        self.focal.append(float(f))
+        self.distortion.extend((tuple(map(float, k)) + (0.0, 0.0, 0.0))[:3])
+        self.rotation.extend(np.asarray(R, dtype=np.float64).ravel().tolist())
+        self.translation.extend(map(float, t))
+        self.principal.extend(map(float, principal) if principal is not None else (np.nan, np.nan))
+        for key in set(self.camera_extras).union(extras):
+            self.camera_extras.setdefault(key, [None] * index).append(extras.get(key, None))
+        return index
+
+    def add_point(self, point_id, co, rgb=(0, 0, 0), error=None):
+        self.point_ids.append(int(point_id))
+        self.coords.extend(map(float, co))
+        self.colours.extend(map(int, rgb))
+        self.errors.append(np.nan if error is None else float(error))
+
+    def add_points(self, point_ids, co, rgb=None, error=None):
+        point_ids = np.asarray(point_ids, dtype=np.int64)
+        n = len(point_ids)
+        self.point_ids.frombytes(point_ids.tobytes())
+        self.coords.frombytes(np.ascontiguousarray(co, dtype=np.float64).reshape(n, 3).tobytes())
+        self.colours.frombytes((np.zeros((n, 3), dtype=np.uint8) if rgb is None else
+                                np.ascontiguousarray(rgb).reshape(n, 3).astype(np.uint8)).tobytes())
+        self.errors.frombytes((np.full(n, np.nan) if error is None else
+                               np.ascontiguousarray(error, dtype=np.float64).reshape(n)).tobytes())
+
+    def add_observation(self, point_id, camera_id, xy):
+        self.track_point_ids.append(int(point_id))
+        self.track_camera_ids.append(int(camera_id))
+        self.track_xy.extend(map(float, xy))
+
+    def add_observations(self, point_ids, camera_ids, xy):
+        camera_ids = np.asarray(camera_ids, dtype=np.int64)
+        n = len(camera_ids)
+        self.track_point_ids.frombytes(np.broadcast_to(np.asarray(point_ids, dtype=np.int64), (n,)).tobytes())
+        self.track_camera_ids.frombytes(camera_ids.tobytes())
+        self.track_xy.frombytes(np.ascontiguousarray(xy, dtype=np.float64).reshape(n, 2).tobytes())
+
+    def build(self, resolution=None):
+        camera_ids = np.array(self.camera_ids, dtype=np.int64)
+        point_ids = np.frombuffer(self.point_ids, dtype=np.int64)
+        n = len(self.filenames)
+        for values in self.camera_extras.values():
+            values.extend([None] * (n - len(values)))
+        return Reconstruction(
+            camera_ids=camera_ids,
+            filenames=self.filenames,
+            focal=np.array(self.focal, dtype=np.float64),
+            distortion=np.array(self.distortion, dtype=np.float64),
+            rotation=np.array(self.rotation, dtype=np.float64),
+            translation=np.array(self.translation, dtype=np.float64),
+            principal=np.array(self.principal, dtype=np.float64),
+            camera_extras=self.camera_extras,
+            point_ids=point_ids,
+            coords=np.frombuffer(self.coords, dtype=np.float64),
+            colours=np.frombuffer(self.colours, dtype=np.uint8),
+            errors=np.frombuffer(self.errors, dtype=np.float64),
+            track_points=_lookup(point_ids, np.frombuffer(self.track_point_ids, dtype=np.int64), 'point'),
+            track_cameras=_lookup(camera_ids, np.frombuffer(self.track_camera_ids, dtype=np.int64), 'camera'),
+            track_xy=np.frombuffer(self.track_xy, dtype=np.float64),
+            resolution=resolution)
+
+
+class _CamerasView(Mapping):
+    def __init__(self, reconstruction):
+        self._r = reconstruction
+
+    def __getitem__(self, camera_id):
+        return _CameraView(self._r, self._r.camera_index(camera_id))
+
+    def __iter__(self):
+        return iter(self._r.camera_ids.tolist())
+
+    def __len__(self):
+        return self._r.num_cameras
+
+    def __contains__(self, camera_id):
+        try:
+            self._r.camera_index(camera_id)
+            return True
+        except KeyError:
+            return False
+
+
+class _CameraView(MutableMapping):
+    """ Dict-like view of a single camera, assignments are written through to the arrays """
+    _fields = ('filename', 'f', 'k', 't', 'R', 'principal', 'trackers')
+
+    def __init__(self, reconstruction, index):
+        self._r = reconstruction
+        self._i = index
+
+    def __getitem__(self, key):
+        r, i = self._r, self._i
+        if key == 'filename':
+            return r.filenames[i]
+        elif key == 'f':
+            return float(r.focal[i])
+        elif key == 'k':
+            return tuple(r.distortion[i].tolist())
+        elif key == 't':
+            return tuple(r.translation[i].tolist())
+        elif key == 'R':
+            return tuple(map(tuple, r.rotation[i].tolist()))
+        elif key == 'principal' and not np.isnan(r.principal[i]).any():
+            return tuple(r.principal[i].tolist())
+        elif key == 'trackers':
+            return _CameraTrackersView(r, i)
+        elif key in r.camera_extras and r.camera_extras[key][i] is not None:
+            return r.camera_extras[key][i]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        r, i = self._r, self._i
+        if key == 'filename':
+            r.filenames[i] = value
+        elif key == 'f':
+            r.focal[i] = value
+        elif key == 'k':
+            r.distortion[i] = (tuple(value) + (0, 0, 0))[:3]
+        elif key == 't':
+            r.translation[i] = value
+        elif key == 'R':
+            r.rotation[i] = value
+        elif key == 'principal':
+            r.principal[i] = value
+        elif key == 'trackers':
+            raise TypeError('Camera observations are read-only in a Reconstruction')
+        else:
+            r.camera_extras.setdefault(key, [None] * r.num_cameras)[i] = value
+
+    def __delitem__(self, key):
+        if key in self._r.camera_extras:
+            self._r.camera_extras[key][self._i] = None
+        elif key == 'principal':
+            self._r.principal[self._i] = np.nan
+        else:
+            raise KeyError(key)
+
+    def __iter__(self):
+        for key in self._fields:
+            if key in self:
+                yield key
+        for key, values in self._r.camera_extras.items():
+            if values[self._i] is not None:
+                yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __contains__(self, key):
+        try:
+            self[key]
+            return True
+        except KeyError:
+            return False
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class _CameraTrackersView(Mapping):
+    """ Point id -> (x, y) for the observations of a single camera """
+    def __init__(self, reconstruction, index):
+        offsets, order = reconstruction.camera_tracks()
+        self._r = reconstruction
+        self._obs = order[offsets[index]:offsets[index + 1]]
+        self._lookup = None
+
+    def _points(self):
+        return np.searchsorted(self._r.track_offsets, self._obs, side='right') - 1
+
+    def __getitem__(self, point_id):
+        if self._lookup is None:
+            self._lookup = dict(zip(self._r.point_ids[self._points()].tolist(), self._obs.tolist()))
+        return tuple(self._r.track_xy[self._lookup[point_id]].tolist())
+
+    def __iter__(self):
+        return iter(self._r.point_ids[self._points()].tolist())
+
+    def __len__(self):
+        return len(self._obs)
+
+    def items(self):
+        return zip(self._r.point_ids[self._points()].tolist(), map(tuple, self._r.track_xy[self._obs].tolist()))
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+
+class _TrackersView(Mapping):
+    def __init__(self, reconstruction):
+        self._r = reconstruction
+
+    def __getitem__(self, point_id):
+        return _TrackerView(self._r, self._r.point_index(point_id))
+
+    def __iter__(self):
+        return iter(self._r.point_ids.tolist())
+
+    def __len__(self):
+        return self._r.num_points
+
+    def __contains__(self, point_id):
+        try:
+            self._r.point_index(point_id)
+            return True
+        except KeyError:
+            return False
+
+
+class _TrackerView(Mapping):
+    def __init__(self, reconstruction, index):
+        self._r = reconstruction
+        self._i = index
+
+    def __getitem__(self, key):
+        r, i = self._r, self._i
+        if key == 'co':
+            return tuple(r.coords[i].tolist())
+        elif key == 'rgb':
+            return tuple(r.colours[i].tolist())
+        elif key == 'error' and not np.isnan(r.errors[i]):
+            return float(r.errors[i])
+        raise KeyError(key)
+
+    def __iter__(self):
+        yield 'co'
+        yield 'rgb'
+        if not np.isnan(self._r.errors[self._i]):
+            yield 'error'
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return repr(dict(self))
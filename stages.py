@@ -0,0 +1,147 @@
+"""
+A small dependency graph for pipelines of external binaries, such as COLMAP's dense
+reconstruction followed by meshing.
+
+Each Stage declares the command it runs, or a Python function to call instead, along with
+the files and directories it reads and writes. A stage depends on the earlier stages that write any of its inputs, and it's
+only run again when the hash of its command, parameters and inputs has changed since it
+last succeeded, or when its outputs are missing or have been modified since. Stages whose
+dependencies are complete run concurrently.
+"""
+import os
+import json
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from .jobs import current_job, run_command, submit
+
+
+class Stage(object):
+    def __init__(self, name, args, inputs=(), outputs=(), params=None, env=None, cwd=None, func=None):
+        self.name = name
+        self.args = [str(a) for a in args]
+        self.func = func
+        self.inputs = [os.path.normpath(p) for p in inputs]
+        self.outputs = [os.path.normpath(p) for p in outputs]
+        self.params = params or {}
+        self.env = env
+        self.cwd = cwd
+        self.depends = []
+
+    def __repr__(self):
+        return f'Stage({self.name})'
+
+
+def signature(path):
+    """ The size and mtime of a file, or of every file within a directory, None if it doesn't exist """
+    if os.path.isdir(path):
+        files = []
+        for root, dirs, filenames in os.walk(path):
+            dirs.sort()
+            for filename in sorted(filenames):
+                st = os.stat(os.path.join(root, filename))
+                files.append([os.path.relpath(os.path.join(root, filename), path), st.st_size, st.st_mtime_ns])
+        return files
+    try:
+        st = os.stat(path)
+        return [st.st_size, st.st_mtime_ns]
+    except OSError:
+        return None
+
+
+def _overlaps(a, b):
+    """ Whether two paths are the same or one is within the other """
+    return a == b or a.startswith(b + os.sep) or b.startswith(a + os.sep)
+
+
+class StageGraph(object):
+    """
+    Stages must be given in an order where each comes after the stages producing its
+    inputs. The hash recorded for each stage is kept in a JSON file (state_path).
+    """
+    def __init__(self, stages, state_path):
+        self.stages = list(stages)
+        self.state_path = state_path
+        self._lock = threading.Lock()
+        for i, stage in enumerate(self.stages):
+            stage.depends = [s for s in self.stages[:i] if any(_overlaps(o, p) for o in s.outputs for p in stage.inputs)]
+        try:
+            with open(state_path, 'r') as f:
+                self.state = json.load(f)
+        except (OSError, ValueError):
+            self.state = {}
+
+    def digest(self, stage):
+        content = {
+            'args': stage.args,
+            'params': stage.params,
+            'inputs': {p: signature(p) for p in stage.inputs},
+        }
+        return hashlib.sha1(json.dumps(content, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def is_current(self, stage):
+        entry = self.state.get(stage.name)
+        return bool(entry) and \
+            entry['hash'] == self.digest(stage) and \
+            all(signature(p) is not None for p in stage.outputs) and \
+            entry['outputs'] == {p: signature(p) for p in stage.outputs}
+
+    def outdated(self):
+        """ The stages that would run given the current state of the workspace, in order """
+        stages = []
+        for stage in self.stages:
+            if not self.is_current(stage) or any(d in stages for d in stage.depends):
+                stages.append(stage)
+        return stages
+
+    def run(self, workers=1):
+        """ Runs the outdated stages, raising the first error once any stages already running have finished """
+        pending = list(self.stages)
+        complete = set()
+        running = {}
+        error = None
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            while (pending and not error) or running:
+                if not error:
+                    for stage in [s for s in pending if all(d in complete for d in s.depends)]:
+                        pending.remove(stage)
+                        running[submit(executor, self._run_stage, stage)] = stage
+                if not running:
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    stage = running.pop(future)
+                    try:
+                        future.result()
+                        complete.add(stage)
+                    except Exception as ex:
+                        error = error or ex
+        if error:
+            raise error
+
+    def _run_stage(self, stage):
+        if self.is_current(stage):
+            print(f'Skipping {stage.name}, it is up to date')
+            return
+
+        digest = self.digest(stage)
+        if stage.func is None:
+            retcode = run_command(stage.args, env=stage.env, cwd=stage.cwd)
+            if retcode != 0:
+                raise Exception(f'{stage.name} failed, see system console for details')
+        else:
+            job = current_job()
+            if job:
+                job.set_stage(stage.name)
+            try:
+                stage.func()
+            finally:
+                if job:
+                    job.end_stage()
+
+        with self._lock:
+            self.state[stage.name] = {'hash': digest, 'outputs': {p: signature(p) for p in stage.outputs}}
+            with open(self.state_path + '.tmp', 'w') as f:
+                json.dump(self.state, f)
+            os.replace(self.state_path + '.tmp', self.state_path)
@@ -0,0 +1,44 @@
+"""
+Imports the addon outside of Blender for the tests and benchmarks.
+
+The addon directory is registered as the package 'photogrammetry' without running its
+__init__ (which registers the Blender classes). When Blender's own bpy isn't available, a
+minimal stand-in is installed, enough for the property groups and file writers to import.
+"""
+import os
+import sys
+import types
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _property(*args, **kwargs):
+    return None
+
+
+def _bpy():
+    bpy = types.ModuleType('bpy')
+    bpy.props = types.ModuleType('bpy.props')
+    for name in ['BoolProperty', 'IntProperty', 'FloatProperty', 'StringProperty', 'EnumProperty',
+                 'PointerProperty', 'CollectionProperty', 'FloatVectorProperty', 'IntVectorProperty']:
+        setattr(bpy.props, name, _property)
+    bpy.types = types.ModuleType('bpy.types')
+    for name in ['PropertyGroup', 'Panel', 'Operator', 'AddonPreferences', 'Menu', 'UIList']:
+        setattr(bpy.types, name, type(name, (object,), {}))
+    bpy.path = types.SimpleNamespace(abspath=lambda path: path, relpath=lambda path: path)
+    bpy.app = types.SimpleNamespace(version=(4, 0, 0), background=True)
+    return bpy
+
+
+def import_addon(name='photogrammetry'):
+    if name not in sys.modules:
+        try:
+            import bpy
+        except ImportError:
+            bpy = _bpy()
+            sys.modules.update({'bpy': bpy, 'bpy.props': bpy.props, 'bpy.types': bpy.types})
+        package = types.ModuleType(name)
+        package.__path__ = [ROOT]
+        sys.modules[name] = package
+    return sys.modules[name]
@@ -0,0 +1,95 @@
+"""
+Benchmarks assigning the POINT2D_IDX of each observation when exporting a COLMAP model, on a
+synthetic scene (by default 100k points seen by 2-7 of 500 cameras each).
+
+    python tests/benchmark_colmap_export.py [--points 100000] [--cameras 500] [--sample 100]
+
+The vectorised assignment used by colmap.load is compared against the per-observation
+list.index lookup and the original scan of every camera for every point, which is timed on
+a sample of points and extrapolated. All three must agree on the sampled points.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from addon import import_addon
+
+
+def synthetic_scene(points, cameras, seed=0):
+    from photogrammetry.reconstruction import ReconstructionBuilder
+
+    random = np.random.RandomState(seed)
+    builder = ReconstructionBuilder()
+    for i in range(cameras):
+        builder.add_camera(i + 1, f'image_{i:05}.jpg', 1000.0, (0, 0, 0), np.eye(3), (0, 0, 0))
+    builder.add_points(np.arange(points) + 1, random.uniform(-10, 10, (points, 3)), random.randint(0, 256, (points, 3)))
+
+    # each point is seen by a distinct set of cameras
+    lengths = random.randint(2, 8, points)
+    camera_ids = np.concatenate([random.choice(cameras, n, replace=False) for n in lengths]) + 1
+    xy = random.uniform(-500, 500, (len(camera_ids), 2))
+    builder.add_observations(np.repeat(np.arange(points) + 1, lengths), camera_ids, xy)
+    return builder.build(resolution=(1000, 1000))
+
+
+def per_observation_index(data):
+    """ POINT2D_IDX of each observation from list.index into the image's point3D_ids """
+    offsets, order = data.camera_tracks()
+    point3D_ids = data.point_ids[data.track_points[order]].tolist()
+    images = [point3D_ids[offsets[i]:offsets[i + 1]] for i in range(data.num_cameras)]
+    point_ids = data.point_ids.tolist()
+    track_points = data.track_points.tolist()
+    return [images[camera].index(point_ids[track_points[i]]) for i, camera in enumerate(data.track_cameras.tolist())]
+
+
+def per_camera_scan(cameras, points):
+    """ (IMAGE_ID, POINT2D_IDX) track of each of the given points, scanning the trackers of every camera """
+    tracks = []
+    for tid in points:
+        track = []
+        for cid, trackers in cameras.items():
+            if tid in trackers:
+                track.append((cid, list(trackers.keys()).index(tid)))
+        tracks.append(track)
+    return tracks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--points', type=int, default=100000)
+    parser.add_argument('--cameras', type=int, default=500)
+    parser.add_argument('--sample', type=int, default=100, help='Number of points timed with the original per-camera scan')
+    args = parser.parse_args()
+
+    import_addon()
+    from photogrammetry.colmap.load import get_point2D_idxs
+
+    data = synthetic_scene(args.points, args.cameras)
+    print(f'{data.num_points} points, {data.num_cameras} cameras, {data.num_observations} observations')
+
+    start = time.perf_counter()
+    point2D_idxs = get_point2D_idxs(data)
+    vectorised = time.perf_counter() - start
+    print(f'vectorised assignment:      {vectorised:.3f} s')
+
+    start = time.perf_counter()
+    indexed = per_observation_index(data)
+    print(f'per-observation list.index: {time.perf_counter() - start:.3f} s')
+    assert point2D_idxs.tolist() == indexed
+
+    # the trackers of each camera from the legacy dict view, in the order the original exporter saw them
+    cameras = {cid: dict(camera['trackers']) for cid, camera in data['cameras'].items()}
+    sample = data.point_ids[:args.sample].tolist()
+    start = time.perf_counter()
+    scanned = per_camera_scan(cameras, sample)
+    elapsed = time.perf_counter() - start
+    print(f'original per-camera scan:   {elapsed * data.num_points / len(sample):.1f} s (extrapolated from {len(sample)} points)')
+    image_ids = data.camera_ids[data.track_cameras].tolist()
+    for p, track in enumerate(scanned):
+        start, end = data.track_offsets[p], data.track_offsets[p + 1]
+        assert sorted(track) == sorted(zip(image_ids[start:end], point2D_idxs[start:end].tolist()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,4 @@
+from addon import import_addon
+
+
+import_addon()
@@ -0,0 +1,53 @@
+import os
+import threading
+import time
+
+import pytest
+
+from photogrammetry import convert
+from photogrammetry.jobs import JobCancelled
+
+
+class CancelledProgress(object):
+    """ Cancels the job once the first image has been converted """
+    def update(self, target):
+        raise JobCancelled()
+
+
+def test_cancel_drops_queued_conversions(monkeypatch):
+    converted = []
+    lock = threading.Lock()
+
+    def convert_image_pillow(source, target, max_size):
+        time.sleep(0.01)
+        with lock:
+            converted.append(target)
+
+    monkeypatch.setattr(convert, 'convert_image_pillow', convert_image_pillow)
+    jobs = [(f'{i}.png', f'{i}.jpg') for i in range(200)]
+    with pytest.raises(JobCancelled):
+        convert._convert_threaded(jobs, 4, 3000, CancelledProgress())
+
+    # only the conversions already running when the job was cancelled finish
+    assert len(converted) <= 8
+
+
+@pytest.mark.parametrize('size', [10, 3 << 20])
+def test_fingerprint_detects_replaced_source(tmp_path, size):
+    source, target = str(tmp_path / 'movie.mp4'), str(tmp_path / 'frame.jpg')
+    with open(source, 'wb') as f:
+        f.write(b'a' * size)
+    with open(target, 'wb') as f:
+        f.write(b'frame')
+    cache = convert.ConversionCache(str(tmp_path), fingerprint=True)
+    cache.update([(source, target)], [target], {'frame': 1})
+    cache.save()
+    assert convert.ConversionCache(str(tmp_path), fingerprint=True).is_current(source, target, {'frame': 1})
+
+    # the same size and mtime, but different content at the end
+    st = os.stat(source)
+    with open(source, 'r+b') as f:
+        f.seek(size - 1)
+        f.write(b'b')
+    os.utime(source, ns=(st.st_atime_ns, st.st_mtime_ns))
+    assert not convert.ConversionCache(str(tmp_path), fingerprint=True).is_current(source, target, {'frame': 1})
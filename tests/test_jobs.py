@@ -0,0 +1,34 @@
+import threading
+
+from photogrammetry.jobs import Job
+
+
+def test_parallel_stages_report_their_own_progress():
+    job = Job('test', None)
+    started = threading.Barrier(3)
+    finished = threading.Barrier(3)
+
+    def stage(name, progress):
+        job.set_stage(name)
+        job.set_progress(progress)
+        started.wait()
+        finished.wait()
+        job.end_stage()
+
+    threads = [threading.Thread(target=stage, args=args) for args in [('first', 0.25), ('second', 0.75)]]
+    for thread in threads:
+        thread.start()
+    started.wait()
+    assert sorted(job.stages) == [('first', 0.25), ('second', 0.75)]
+    finished.wait()
+    for thread in threads:
+        thread.join()
+    assert job.stages == [('test', None)]
+
+
+def test_set_stage_resets_progress():
+    job = Job('test', None)
+    job.set_stage('first')
+    job.set_progress(0.5)
+    job.set_stage('second')
+    assert job.stages == [('second', None)]
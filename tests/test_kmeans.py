@@ -0,0 +1,23 @@
+import numpy as np
+
+from photogrammetry.kmeans import K_Means
+
+
+def test_clusters():
+    random = np.random.RandomState(0)
+    data = np.concatenate([random.normal(0, 1, (100, 3)), random.normal(50, 1, (50, 3))])
+    clf = K_Means(k=2).fit(data)
+    assert sorted(clf.counts.tolist()) == [50, 100]
+    assert sorted(np.round(clf.centroids[:, 0] / 50).tolist()) == [0, 1]
+
+
+def test_empty():
+    clf = K_Means(k=3).fit(np.zeros((0, 3)))
+    assert clf.centroids.shape == (0, 3)
+    assert clf.labels.tolist() == [] and clf.counts.tolist() == []
+
+
+def test_fewer_rows_than_centroids():
+    clf = K_Means(k=3).fit([[1.0, 2.0]])
+    assert clf.centroids.tolist() == [[1.0, 2.0]]
+    assert clf.counts.tolist() == [1]
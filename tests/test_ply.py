@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+
+from photogrammetry.ply import read_ply, read_vertices, write_vertices, merge_vertices
+
+
+VERTICES = np.array([(0.5, -1.0, 2.0, 255, 0, 10), (1.0, 2.0, 3.0, 1, 2, 3), (-4.0, 0.25, 8.0, 9, 8, 7), (1e6, 0.0, -0.5, 0, 0, 0)],
+                    dtype=[('x', 'f4'), ('y', 'f4'), ('z', 'f4'), ('red', 'u1'), ('green', 'u1'), ('blue', 'u1')])
+
+
+def write_ply(path, fmt, faces, trailing=False):
+    """ Writes VERTICES and the given faces (lists of vertex indices), optionally followed by another element """
+    header = ['ply', f'format {fmt} 1.0', f'element vertex {len(VERTICES)}',
+              'property float x', 'property float y', 'property float z',
+              'property uchar red', 'property uchar green', 'property uchar blue',
+              f'element face {len(faces)}', 'property list uchar int vertex_indices']
+    if trailing:
+        header += ['element extra 1', 'property int value']
+    header += ['end_header']
+    with open(path, 'wb') as f:
+        f.write(('\n'.join(header) + '\n').encode('ascii'))
+        if fmt == 'ascii':
+            f.write(''.join(' '.join(map(str, v)) + '\n' for v in VERTICES.tolist()).encode('ascii'))
+            f.write(''.join(f'{len(face)} ' + ' '.join(map(str, face)) + '\n' for face in faces).encode('ascii'))
+            if trailing:
+                f.write(b'42\n')
+            return
+        order = '<' if fmt == 'binary_little_endian' else '>'
+        f.write(VERTICES.astype(VERTICES.dtype.newbyteorder(order)).tobytes())
+        for face in faces:
+            f.write(np.uint8(len(face)).tobytes() + np.array(face, dtype=order + 'i4').tobytes())
+        if trailing:
+            f.write(np.array([42], dtype=order + 'i4').tobytes())
+
+
+FORMATS = ['binary_little_endian', 'binary_big_endian', 'ascii']
+FACES = {
+    'triangles': [[0, 1, 2], [1, 2, 3], [0, 2, 3]],
+    'quad first': [[0, 1, 2, 3], [0, 1, 2], [1, 2, 3], [0, 2, 3]],
+    'triangle first': [[0, 1, 2], [0, 1, 2, 3], [1, 2, 3]],
+}
+
+
+@pytest.mark.parametrize('fmt', FORMATS)
+@pytest.mark.parametrize('faces', FACES.values(), ids=FACES.keys())
+@pytest.mark.parametrize('trailing', [False, True])
+def test_read_ply(tmp_path, fmt, faces, trailing):
+    path = str(tmp_path / 'mesh.ply')
+    write_ply(path, fmt, faces, trailing)
+    ply = read_ply(path)
+
+    for p in VERTICES.dtype.names:
+        assert np.array_equal(ply['vertex'][p], VERTICES[p])
+    counts, indices = ply['face']['vertex_indices']
+    assert counts.tolist() == [len(face) for face in faces]
+    assert indices.tolist() == [i for face in faces for i in face]
+    if trailing:
+        assert ply['extra']['value'].tolist() == [42]
+
+
+@pytest.mark.parametrize('fmt', FORMATS)
+def test_read_vertices(tmp_path, fmt):
+    path = str(tmp_path / 'mesh.ply')
+    write_ply(path, fmt, FACES['quad first'])
+    vertices = read_vertices(path)
+    assert vertices.dtype.names == VERTICES.dtype.names
+    assert all(np.array_equal(vertices[p], VERTICES[p]) for p in VERTICES.dtype.names)
+
+
+@pytest.mark.parametrize('chunk_size', [1 << 20, 3])
+def test_merge_vertices(tmp_path, chunk_size):
+    paths = [str(tmp_path / f'{fmt}.ply') for fmt in FORMATS]
+    for path, fmt in zip(paths, FORMATS):
+        write_ply(path, fmt, FACES['triangles'])
+    merge_vertices(paths, str(tmp_path / 'merged.ply'), chunk_size=chunk_size)
+
+    merged = read_vertices(str(tmp_path / 'merged.ply'))
+    expected = np.concatenate([VERTICES] * len(paths))
+    assert all(np.array_equal(merged[p], expected[p]) for p in VERTICES.dtype.names)
+
+
+def test_write_vertices_round_trip(tmp_path):
+    write_vertices(str(tmp_path / 'points.ply'), VERTICES.astype(VERTICES.dtype.newbyteorder('>')))
+    vertices = read_vertices(str(tmp_path / 'points.ply'))
+    assert all(np.array_equal(vertices[p], VERTICES[p]) for p in VERTICES.dtype.names)
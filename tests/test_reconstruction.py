@@ -0,0 +1,209 @@
+import numpy as np
+import pytest
+
+from photogrammetry.reconstruction import Reconstruction, ReconstructionBuilder, as_reconstruction, _lookup
+
+
+R0 = ((1.0, 0.0, 0.0), (0.0, 1.0, 0.0), (0.0, 0.0, 1.0))
+R1 = ((0.0, -1.0, 0.0), (1.0, 0.0, 0.0), (0.0, 0.0, 1.0))
+
+# legacy dict reconstruction with non-contiguous ids, a point seen by no camera, a camera
+# seeing no point and an observation of a point that isn't in the trackers
+LEGACY = {
+    'resolution': (640, 480),
+    'cameras': {
+        30: {'filename': 'a.jpg', 'f': 500.0, 'k': (0.1, 0.2, 0.0), 'R': R0, 't': (1.0, 2.0, 3.0),
+             'trackers': {5: (10.0, 20.0), 9: (11.0, 21.0)}},
+        10: {'filename': 'b.jpg', 'f': 600.0, 'k': (0.0, 0.0, 0.0), 'R': R1, 't': (0.0, 0.0, -1.0),
+             'principal': (320.0, 240.0), 'group': 'left', 'trackers': {9: (-5.0, 6.0), 7: (1.5, 2.5), 4: (0.0, 0.0)}},
+        20: {'filename': 'c.jpg', 'f': 700.0, 'k': (0.0, 0.0, 0.0), 'R': R0, 't': (0.0, 0.0, 0.0),
+             'trackers': {}},
+    },
+    'trackers': {
+        9: {'co': (0.0, 0.0, 1.0), 'rgb': (255, 0, 0), 'error': 0.5},
+        5: {'co': (1.0, 0.0, 1.0), 'rgb': (0, 255, 0)},
+        7: {'co': (2.0, 0.0, 1.0), 'rgb': (0, 0, 255)},
+        3: {'co': (3.0, 0.0, 1.0), 'rgb': (9, 9, 9)},
+    },
+}
+
+
+def plain(view):
+    """ Converts the legacy views of a Reconstruction back into nested dicts """
+    if hasattr(view, 'items'):
+        return {key: plain(value) for key, value in view.items()}
+    return view
+
+
+@pytest.fixture
+def data():
+    return Reconstruction.from_dict(LEGACY)
+
+
+def test_builder_arrays():
+    builder = ReconstructionBuilder()
+    builder.add_camera(7, 'a.jpg', 100, (0.1,), np.eye(3), (1, 2, 3), principal=(5, 6), lens='wide')
+    builder.add_camera(3, 'b.jpg', 200, (0.1, 0.2, 0.3), np.eye(3), (0, 0, 0))
+    builder.add_point(11, (1, 2, 3), (255, 128, 0), 0.25)
+    builder.add_points([13, 12], [(4, 5, 6), (7, 8, 9)])
+    # observations out of order, with a duplicate (point 11, camera 3) whose first occurrence is kept
+    builder.add_observation(11, 3, (1.0, 1.0))
+    builder.add_observations([12, 11, 11], [7, 7, 3], [(2.0, 2.0), (3.0, 3.0), (4.0, 4.0)])
+    data = builder.build(resolution=(640, 480))
+
+    assert data.camera_ids.tolist() == [7, 3]
+    assert data.filenames == ['a.jpg', 'b.jpg']
+    assert data.distortion.tolist() == [[0.1, 0.0, 0.0], [0.1, 0.2, 0.3]]
+    assert data.principal[0].tolist() == [5.0, 6.0] and np.isnan(data.principal[1]).all()
+    assert data.camera_extras == {'lens': ['wide', None]}
+    assert data.point_ids.tolist() == [11, 13, 12]
+    assert data.colours.dtype == np.uint8 and data.colours.tolist() == [[255, 128, 0], [0, 0, 0], [0, 0, 0]]
+    assert data.errors[0] == 0.25 and np.isnan(data.errors[1:]).all()
+    assert data.resolution == (640, 480)
+
+    # sorted by point, then camera index
+    assert data.track_offsets.tolist() == [0, 2, 2, 3]
+    assert data.track_cameras.dtype == np.int32
+    assert data.track_cameras.tolist() == [0, 1, 0]
+    assert data.track_xy.tolist() == [[3.0, 3.0], [1.0, 1.0], [2.0, 2.0]]
+    assert data.track_points.tolist() == [0, 0, 2]
+    assert data.track_lengths.tolist() == [2, 0, 1]
+    assert (data.num_cameras, data.num_points, data.num_observations) == (2, 3, 3)
+
+
+def test_intrinsics(data):
+    K = data.intrinsics
+    assert K[:, 0, 0].tolist() == [500.0, 600.0, 700.0]
+    # the image centre stands in for missing principal points
+    assert K[:, 0:2, 2].tolist() == [[320.0, 240.0], [320.0, 240.0], [320.0, 240.0]]
+
+
+@pytest.mark.parametrize('camera_id', [3, 8])
+def test_unknown_camera(camera_id):
+    builder = ReconstructionBuilder()
+    builder.add_camera(5, 'a.jpg', 100, (0,), np.eye(3), (0, 0, 0))
+    builder.add_point(1, (0, 0, 0))
+    builder.add_observation(1, camera_id, (0, 0))
+    with pytest.raises(KeyError, match='camera'):
+        builder.build()
+
+
+def test_unknown_point():
+    builder = ReconstructionBuilder()
+    builder.add_camera(5, 'a.jpg', 100, (0,), np.eye(3), (0, 0, 0))
+    builder.add_observation(1, 5, (0, 0))
+    with pytest.raises(KeyError, match='point'):
+        builder.build()
+
+
+def test_lookup():
+    ids = np.array([40, 10, 30, 20])
+    assert _lookup(ids, [30, 10, 40, 40, 20], 'camera').tolist() == [2, 1, 0, 0, 3]
+    assert _lookup(ids, [], 'camera').tolist() == []
+    # below, between and above the known ids
+    for key in [5, 25, 50]:
+        with pytest.raises(KeyError):
+            _lookup(ids, [10, key], 'camera')
+    with pytest.raises(KeyError):
+        _lookup([], [1], 'camera')
+
+
+def test_camera_tracks(data):
+    offsets, order = data.camera_tracks()
+    assert data.camera_tracks()[1] is order
+    assert offsets.tolist() == [0, 2, 4, 4]
+    # within each camera, observations stay in point order
+    assert data.track_points[order].tolist() == [0, 1, 0, 2]
+    assert data.track_cameras[order].tolist() == [0, 0, 1, 1]
+
+
+def test_covisibility():
+    random = np.random.RandomState(0)
+    cameras, points = 9, 300
+    builder = ReconstructionBuilder()
+    for i in range(cameras):
+        builder.add_camera(i, f'{i}.jpg', 100, (0,), np.eye(3), (0, 0, 0))
+    builder.add_points(np.arange(points), random.normal(size=(points, 3)))
+    lengths = random.randint(0, 7, points)
+    camera_ids = np.concatenate([random.choice(cameras, n, replace=False) for n in lengths])
+    builder.add_observations(np.repeat(np.arange(points), lengths), camera_ids, np.zeros((len(camera_ids), 2)))
+    data = builder.build()
+
+    visible = np.zeros((points, cameras), dtype=np.int64)
+    visible[data.track_points, data.track_cameras] = 1
+    expected = visible.T @ visible
+    assert np.array_equal(data.covisibility(), expected)
+    # chunks smaller than a single track still count every pair
+    assert np.array_equal(data.covisibility(chunk_size=1), expected)
+
+
+def test_covisibility_empty():
+    assert Reconstruction().covisibility().shape == (0, 0)
+    data = Reconstruction.from_dict({'cameras': {1: {'filename': 'a.jpg', 'f': 1, 'R': R0, 't': (0, 0, 0)}}, 'trackers': {}})
+    assert data.covisibility().tolist() == [[0]]
+
+
+def test_legacy_views(data):
+    expected = dict(LEGACY)
+    expected['cameras'] = {cid: dict(camera, trackers={tid: xy for tid, xy in camera['trackers'].items() if tid in LEGACY['trackers']})
+                           for cid, camera in LEGACY['cameras'].items()}
+    assert plain(data) == expected
+    assert as_reconstruction(data) is data
+    assert as_reconstruction(LEGACY).camera_ids.tolist() == [30, 10, 20]
+
+    assert list(data) == ['resolution', 'cameras', 'trackers'] and len(data) == 3
+    assert list(Reconstruction()) == ['cameras', 'trackers'] and len(Reconstruction()) == 2
+    with pytest.raises(KeyError):
+        Reconstruction()['resolution']
+
+    cameras = data['cameras']
+    assert list(cameras) == [30, 10, 20] and len(cameras) == 3
+    assert 10 in cameras and 11 not in cameras
+    with pytest.raises(KeyError):
+        cameras[11]
+
+    trackers = data['trackers']
+    assert list(trackers) == [9, 5, 7, 3] and len(trackers) == 4
+    assert 3 in trackers and 4 not in trackers
+    assert dict(trackers[9]) == {'co': (0.0, 0.0, 1.0), 'rgb': (255, 0, 0), 'error': 0.5}
+    assert list(trackers[5]) == ['co', 'rgb'] and len(trackers[5]) == 2
+    with pytest.raises(KeyError):
+        trackers[5]['error']
+
+
+def test_camera_view(data):
+    camera = data['cameras'][10]
+    assert list(camera) == ['filename', 'f', 'k', 't', 'R', 'principal', 'trackers', 'group']
+    assert len(camera) == 8
+    assert 'principal' not in data['cameras'][30] and 'group' not in data['cameras'][30]
+
+    # trackers of a camera are in point order
+    trackers = camera['trackers']
+    assert list(trackers) == [9, 7] and len(trackers) == 2
+    assert trackers[7] == (1.5, 2.5)
+    assert list(trackers.items()) == [(9, (-5.0, 6.0)), (7, (1.5, 2.5))]
+    assert 4 not in trackers
+    assert dict(data['cameras'][20]['trackers']) == {}
+
+    # assignments are written through to the arrays
+    camera['filename'] = 'd.jpg'
+    camera['f'] = 650
+    camera['k'] = (0.3,)
+    camera['t'] = (1, 1, 1)
+    camera['R'] = R0
+    camera['group'] = 'right'
+    data['cameras'][30]['lens'] = 'wide'
+    assert data.filenames[1] == 'd.jpg'
+    assert data.focal[1] == 650.0
+    assert data.distortion[1].tolist() == [0.3, 0.0, 0.0]
+    assert data.translation[1].tolist() == [1.0, 1.0, 1.0]
+    assert data.rotation[1].tolist() == np.eye(3).tolist()
+    assert data.camera_extras == {'group': [None, 'right', None], 'lens': ['wide', None, None]}
+
+    del camera['principal']
+    del camera['group']
+    assert 'principal' not in camera and 'group' not in camera
+    with pytest.raises(KeyError):
+        del camera['f']
+    with pytest.raises(TypeError):
+        camera['trackers'] = {}
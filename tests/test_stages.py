@@ -0,0 +1,34 @@
+import os
+
+from photogrammetry.stages import Stage, StageGraph
+
+
+def test_function_stage_runs_only_when_inputs_change(tmp_path):
+    source, target = str(tmp_path / 'source.txt'), str(tmp_path / 'target.txt')
+    with open(source, 'w') as f:
+        f.write('a')
+    calls = []
+
+    def copy():
+        calls.append(source)
+        with open(source, 'r') as f, open(target, 'w') as out:
+            out.write(f.read())
+
+    def run():
+        stage = Stage('copy', ['copy'], inputs=[source], outputs=[target], func=copy)
+        StageGraph([stage], str(tmp_path / 'stages.json')).run()
+
+    run()
+    run()
+    assert len(calls) == 1
+
+    with open(source, 'w') as f:
+        f.write('bb')
+    run()
+    assert len(calls) == 2
+
+    os.remove(target)
+    run()
+    assert len(calls) == 3
+    with open(target, 'r') as f:
+        assert f.read() == 'bb'
@@ -0,0 +1,115 @@
+"""
+Round trip properties of the batched conversions, checked over large seeded batches of
+random rotations along with the edge cases (180 degree rotations and gimbal lock).
+"""
+import numpy as np
+import pytest
+
+from photogrammetry.transforms import quaternion_to_matrix, matrix_to_quaternion, matrix_to_euler, euler_to_matrix, \
+    camera_centre, camera_translation, flip_axes
+
+
+SEEDS = range(5)
+BATCH = 10000
+
+
+def random_quaternions(random, shape=(BATCH,)):
+    q = random.normal(size=shape + (4,))
+    q /= np.linalg.norm(q, axis=-1, keepdims=True)
+    return np.where(q[..., :1] < 0, -q, q)
+
+
+# identity and 180 degree rotations about each axis, where the quaternion's largest component isn't w
+EDGE_QUATERNIONS = np.array([[1, 0, 0, 0], [0, 1, 0, 0], [0, 0, 1, 0], [0, 0, 0, 1], [0, 0.6, 0.8, 0], [1e-9, 0, 0.6, 0.8]])
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_quaternion_matrix_round_trip(seed):
+    q = random_quaternions(np.random.RandomState(seed))
+    R = quaternion_to_matrix(q)
+    assert np.allclose(R @ np.swapaxes(R, -1, -2), np.eye(3), atol=1e-12)
+    assert np.allclose(np.linalg.det(R), 1, atol=1e-12)
+    assert np.allclose(matrix_to_quaternion(R), q, atol=1e-12)
+
+
+def test_quaternion_edge_cases():
+    q = EDGE_QUATERNIONS / np.linalg.norm(EDGE_QUATERNIONS, axis=-1, keepdims=True)
+    R = quaternion_to_matrix(q)
+    back = matrix_to_quaternion(R)
+    # q and -q are the same rotation, which only matters when w is 0
+    assert np.allclose(np.abs((back * q).sum(axis=-1)), 1, atol=1e-12)
+    assert np.allclose(quaternion_to_matrix(back), R, atol=1e-12)
+    assert (back[:, 0] >= 0).all()
+
+
+def test_quaternions_are_normalised():
+    q = random_quaternions(np.random.RandomState(0), (100,))
+    assert np.allclose(quaternion_to_matrix(q * 3.5), quaternion_to_matrix(q))
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_euler_matrix_round_trip(seed):
+    R = quaternion_to_matrix(random_quaternions(np.random.RandomState(seed)))
+    euler = matrix_to_euler(R)
+    assert np.allclose(euler_to_matrix(euler), R, atol=1e-12)
+    assert (np.abs(euler) <= np.pi).all()
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_euler_is_the_smaller_solution(seed):
+    # every XYZ rotation can also be written as (x + pi, pi - y, z + pi), the smaller of the two is chosen
+    euler = np.random.RandomState(seed).uniform(-np.pi, np.pi, (BATCH, 3))
+    euler[:, 1] /= 2
+    alternative = euler + (np.pi, np.pi, np.pi)
+    alternative[:, 1] = np.pi - euler[:, 1]
+    alternative = (alternative + np.pi) % (2 * np.pi) - np.pi
+    result = matrix_to_euler(euler_to_matrix(np.concatenate([euler, alternative])))
+    smaller = np.where((np.abs(euler).sum(axis=-1) <= np.abs(alternative).sum(axis=-1))[:, None], euler, alternative)
+    assert np.allclose(np.abs(result).sum(axis=-1), np.tile(np.abs(smaller).sum(axis=-1), 2), atol=1e-9)
+
+
+@pytest.mark.parametrize('pitch', [np.pi / 2, -np.pi / 2, np.pi / 2 - 1e-9])
+def test_euler_gimbal_lock(pitch):
+    random = np.random.RandomState(0)
+    euler = np.stack([random.uniform(-np.pi, np.pi, 100), np.full(100, pitch), random.uniform(-np.pi, np.pi, 100)], axis=-1)
+    R = euler_to_matrix(euler)
+    result = matrix_to_euler(R)
+    # X and Z rotate about the same axis, so Z is taken as 0
+    assert np.allclose(result[:, 2], 0)
+    assert np.allclose(result[:, 1], np.sign(pitch) * np.pi / 2, atol=1e-6)
+    assert np.allclose(euler_to_matrix(result), R, atol=1e-6)
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_centre_translation_round_trip(seed):
+    random = np.random.RandomState(seed)
+    R = quaternion_to_matrix(random_quaternions(random))
+    c = random.normal(0, 100, (BATCH, 3))
+    t = camera_translation(R, c)
+    assert np.allclose(camera_centre(R, t), c, atol=1e-9)
+    # the camera centre projects to the camera's origin
+    assert np.allclose(np.einsum('nij,nj->ni', R, c) + t, 0, atol=1e-9)
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_flip_axes(seed):
+    random = np.random.RandomState(seed)
+    R = quaternion_to_matrix(random_quaternions(random))
+    t = random.normal(0, 100, (BATCH, 3))
+    flipped = flip_axes(R)
+    assert np.array_equal(flip_axes(flipped), R)
+    assert np.allclose(np.linalg.det(flipped), 1, atol=1e-12)
+    # flipping the camera's axes doesn't move it, its viewing direction is reversed
+    assert np.allclose(camera_centre(flipped, camera_translation(flipped, camera_centre(R, t))), camera_centre(R, t), atol=1e-9)
+    assert np.allclose(flipped[:, 2], -R[:, 2])
+
+
+def test_leading_dimensions():
+    q = random_quaternions(np.random.RandomState(0), (2, 3))
+    R = quaternion_to_matrix(q)
+    assert R.shape == (2, 3, 3, 3)
+    assert matrix_to_quaternion(R).shape == (2, 3, 4)
+    assert matrix_to_euler(R).shape == (2, 3, 3)
+    assert camera_centre(R, np.zeros((2, 3, 3))).shape == (2, 3, 3)
+    assert np.allclose(quaternion_to_matrix(q[0, 0]), R[0, 0])
+    assert np.allclose(camera_translation(np.eye(3), (1, 2, 3)), (-1, -2, -3))
@@ -0,0 +1,249 @@
+"""
+The buffered block writers must write exactly the same bytes as the writers they replaced.
+
+The baselines are the write loops of the original bundler, visualsfm and colmap exporters,
+pasted unchanged apart from taking the output path as an argument. They are fed the legacy
+nested dict the exporters used to receive, while the new writers get the Reconstruction
+converted from the same dict. NVM camera poses are now computed in double precision rather
+than with mathutils, so those lines are compared numerically.
+"""
+from math import pi
+
+import numpy as np
+import pytest
+
+from photogrammetry.bundler.load import write_bundle
+from photogrammetry.colmap.read_model import ImagesArrays, Points3DArrays, images_from_arrays, points3D_from_arrays, qvec2rotmat
+from photogrammetry.colmap.write_model import write_images_text, write_points3D_text
+from photogrammetry.reconstruction import Reconstruction
+from photogrammetry.visualsfm.load import write_nvm
+
+
+def baseline_bundle(path, data):
+    cameras = data['cameras']
+    camera_keys = list(cameras.keys())
+    trackers = data['trackers']
+
+    # now write the bundle file
+    sift = 0
+    with open(path, 'w+') as f:
+        f.write('# Bundle file v0.3\n')
+        f.write('{} {}\n'.format(len(cameras.items()), len(trackers.items())))
+        for idx, key in enumerate(camera_keys):
+            camera = cameras[key]
+            f.write('{f} {k[0]} {k[1]}\n'.format(**camera))
+            f.write('{} {} {}\n'.format(*camera['R'][0]))
+            f.write('{} {} {}\n'.format(*camera['R'][1]))
+            f.write('{} {} {}\n'.format(*camera['R'][2]))
+            f.write('{} {} {}\n'.format(*camera['t']))
+
+        # now write the points and corresponding matching cameras
+        for tid, track in trackers.items():
+            f.write('{} {} {}\n'.format(*track['co']))
+            f.write('{} {} {}\n'.format(*track['rgb']))
+            # calculate view list
+            visible_in = {}
+            for key, camera in cameras.items():
+                if tid in camera['trackers']:
+                    visible_in[key] = camera['trackers'][tid]  # visible_in[camera 4]: (x, y)
+
+            f.write('{count}'.format(count=len(visible_in.items())))
+            for camera_key, co in visible_in.items():
+                # The pixel positions are floating point numbers in a coordinate system where the origin is the center of the image,
+                # the x-axis increases to the right, and the y-axis increases towards the top of the image. Thus, (-w/2, -h/2) is
+                # the lower-left corner of the image, and (w/2, h/2) is the top-right corner (where w and h are the width and height of the image).
+                # http://www.cs.cornell.edu/~snavely/bundler/bundler-v0.4-manual.html
+                f.write(' {idx} {sift} {co[0]} {co[1]}'.format(
+                    idx=camera_keys.index(camera_key),
+                    sift=sift,
+                    co=co,))
+                sift += 1
+            f.write('\n')
+
+
+def baseline_nvm(path, data):
+    from mathutils import Vector, Matrix, Euler
+
+    cameras = data['cameras']
+    camera_keys = list(cameras.keys())
+    trackers = data['trackers']
+
+    # now write the nvm file
+    with open(path, 'w+') as f:
+        f.write('NVM_V3\n\n')
+        f.write(f'{len(cameras.items())}\n')
+        for idx, key in enumerate(camera_keys):
+            camera = cameras[key]
+
+            # transform camera extrinsics appropriately
+            R = Matrix(camera['R'])
+            R.transpose()
+            c = Vector(camera['t'])
+            t = -1 * R @ c
+            R.transpose()
+            R.rotate(Euler((pi, 0, 0)))
+
+            # TODO: confirm whether the distortion coefficient needs inverting
+            # <Camera> = <File name> <focal length> <quaternion WXYZ> <camera center> <radial distortion> 0
+            f.write('{filename} {f} {q[0]} {q[1]} {q[2]} {q[3]} {t[0]} {t[1]} {t[2]} {k[0]} 0\n'.format(
+                filename=camera['filename'],
+                f=camera['f'],
+                q=R.to_quaternion(),
+                t=t,
+                k=camera['k']))
+
+        # now write the points and corresponding matching cameras
+        f.write(f'\n{len(trackers.items())}\n')
+        sift = 0
+        for tid, track in trackers.items():
+            # <Point> = <XYZ> <RGB> <number of measurements> <List of Measurements>
+            # <Measurement> = <Image index> <Feature Index> <xy>
+            measurements = {}
+            for cid, camera in cameras.items():
+                if tid in camera['trackers']:
+                    measurements.setdefault(cid, camera['trackers'][tid])
+
+            f.write('{co[0]} {co[1]} {co[2]} {rgb[0]} {rgb[1]} {rgb[2]} {num_measurements}'.format(**track, num_measurements=len(measurements.items())))
+            for cid, measurement in measurements.items():
+                f.write(' {image_idx} {feature_idx} {x} {y}'.format(image_idx=cid,
+                                                                    feature_idx=sift,
+                                                                    x=measurement[0],
+                                                                    y=-1 * measurement[1]))
+                sift += 1
+            f.write('\n')
+
+        f.write('\n\n\n0\n\n')
+        f.write('#the last part of NVM file points to the PLY files\n')
+        f.write('#the first number is the number of associated PLY files\n')
+        f.write('#each following number gives a model-index that has PLY\n')
+        f.write('0\n')
+
+
+def baseline_images_text(path, images):
+    with open(path, "w") as fid:
+        fid.writelines(map(lambda line: f'{line}\n',
+                           ['# Image list with two lines of data per image:',
+                            '#   IMAGE_ID, QW, QX, QY, QZ, TX, TY, TZ, CAMERA_ID, NAME',
+                            '#   POINTS2D[] as (X, Y, POINT3D_ID)',
+                            f'# Number of images: {len(images)}, mean observations per image: ']))
+        for image in images:
+            fid.write(f'{image.id} ')
+            fid.write('{} '.format(' '.join(map(str, image.qvec))))
+            fid.write('{} '.format(' '.join(map(str, image.tvec))))
+            fid.write(f'{image.camera_id} ')
+            fid.write(f'{image.name.strip()}\n')
+            for i in range(len(image.xys)):
+                fid.write(f'{image.xys[i][0]} {image.xys[i][1]} {image.point3D_ids[i]} ')
+            fid.write('\n')
+
+
+def baseline_points3D_text(path, points3D):
+    with open(path, "w") as fid:
+        fid.writelines(map(lambda line: f'{line}\n',
+                           ['# 3D point list with one line of data per point:',
+                            '#   POINT3D_ID, X, Y, Z, R, G, B, ERROR, TRACK[] as (IMAGE_ID, POINT2D_IDX)',
+                            f'# Number of points: {len(points3D)}, mean track length: ']))
+        for point in points3D:
+            fid.write(f'{point.id} ')
+            fid.write('{} '.format(' '.join(map(str, point.xyz))))
+            fid.write('{} '.format(' '.join(map(str, point.rgb))))
+            fid.write(f'{point.error} ')
+            for i in range(len(point.image_ids)):
+                fid.write(f'{point.image_ids[i]} {point.point2D_idxs[i]} ')
+            fid.write('\n')
+
+
+@pytest.fixture(params=[0, 1, 2])
+def legacy(request):
+    """
+    Synthetic legacy dict reconstruction with awkward floats, points without observations,
+    non-contiguous point ids and an observation of a point that isn't in the trackers.
+    Camera ids are 0..N-1 because the original NVM writer wrote the camera id as the image index.
+    """
+    random = np.random.RandomState(request.param)
+    num_cameras, num_points = 12, 500
+    point_ids = (np.arange(num_points) * 2 + 1).tolist()
+    coords = random.normal(0, 1, (num_points, 3)) * 10.0 ** random.randint(-8, 8, (num_points, 3))
+    coords[0] = (0.1, -0.0, 1e-300)
+    trackers = {tid: {'co': co, 'rgb': rgb}
+                for tid, co, rgb in zip(point_ids, coords.tolist(), random.randint(0, 256, (num_points, 3)).tolist())}
+
+    cameras = {}
+    for cid in range(num_cameras):
+        qvec = random.normal(size=4)
+        cameras[cid] = {
+            'filename': f'IMG_{cid:04}.jpg',
+            'f': random.uniform(500, 5000),
+            'k': random.normal(0, 0.1, 3).tolist(),
+            'R': qvec2rotmat(qvec / np.linalg.norm(qvec)).tolist(),
+            't': random.normal(0, 100, 3).tolist(),
+            'trackers': {},
+        }
+    for tid in point_ids:
+        for cid in sorted(random.choice(num_cameras, random.randint(0, 6), replace=False).tolist()):
+            cameras[cid]['trackers'][tid] = tuple(random.uniform(-960, 960, 2).tolist())
+    cameras[0]['trackers'][2] = (1.0, 2.0)
+    return {'cameras': cameras, 'trackers': trackers, 'resolution': (1920, 1080)}
+
+
+def assert_same_bytes(tmp_path, write, baseline):
+    write(str(tmp_path / 'written'))
+    baseline(str(tmp_path / 'baseline'))
+    assert (tmp_path / 'written').read_bytes() == (tmp_path / 'baseline').read_bytes()
+
+
+def test_bundle(legacy, tmp_path):
+    data = Reconstruction.from_dict(legacy)
+    assert_same_bytes(tmp_path, lambda path: write_bundle(path, data), lambda path: baseline_bundle(path, legacy))
+
+
+def test_nvm(legacy, tmp_path):
+    pytest.importorskip('mathutils')
+    data = Reconstruction.from_dict(legacy)
+    filenames = [camera['filename'] for camera in legacy['cameras'].values()]
+    write_nvm(str(tmp_path / 'written'), data, filenames)
+    baseline_nvm(str(tmp_path / 'baseline'), legacy)
+    written = (tmp_path / 'written').read_text().split('\n')
+    baseline = (tmp_path / 'baseline').read_text().split('\n')
+
+    # camera poses were computed in mathutils' single precision, so only those lines differ
+    cameras = slice(3, 3 + data.num_cameras)
+    assert written[:cameras.start] + written[cameras.stop:] == baseline[:cameras.start] + baseline[cameras.stop:]
+    for line, expected in zip(written[cameras], baseline[cameras]):
+        line, expected = line.split(), expected.split()
+        assert line[0] == expected[0]
+        values, expected = np.array(line[1:], dtype=np.float64), np.array(expected[1:], dtype=np.float64)
+        # either sign of the quaternion is the same rotation
+        values[1:5] *= np.sign(values[1]) * np.sign(expected[1])
+        assert np.allclose(values, expected, rtol=1e-5, atol=1e-4)
+
+
+def test_colmap_text(legacy, tmp_path):
+    data = Reconstruction.from_dict(legacy)
+    random = np.random.RandomState(0)
+    offsets, order = data.camera_tracks()
+    images = ImagesArrays(
+        ids=data.camera_ids,
+        qvecs=random.normal(size=(data.num_cameras, 4)),
+        tvecs=data.translation,
+        camera_ids=np.ones(data.num_cameras, dtype=np.int64),
+        names=[f'IMG_{i:04}.JPG ' for i in range(data.num_cameras)],
+        point2D_offsets=offsets,
+        xys=data.track_xy[order] + (959.5, 539.5),
+        point3D_ids=data.point_ids[data.track_points[order]])
+    points3D = Points3DArrays(
+        ids=data.point_ids,
+        xyz=data.coords,
+        rgb=data.colours,
+        error=random.exponential(1, data.num_points),
+        track_offsets=data.track_offsets,
+        image_ids=data.camera_ids[data.track_cameras],
+        point2D_idxs=random.randint(0, 1000, data.num_observations))
+
+    write_images_text(str(tmp_path / 'images.txt'), images)
+    baseline_images_text(str(tmp_path / 'baseline_images.txt'), images_from_arrays(images).values())
+    assert (tmp_path / 'images.txt').read_bytes() == (tmp_path / 'baseline_images.txt').read_bytes()
+
+    write_points3D_text(str(tmp_path / 'points3D.txt'), points3D)
+    baseline_points3D_text(str(tmp_path / 'baseline_points3D.txt'), points3D_from_arrays(points3D).values())
+    assert (tmp_path / 'points3D.txt').read_bytes() == (tmp_path / 'baseline_points3D.txt').read_bytes()
@@ -0,0 +1,66 @@
+import numpy as np
+
+
+class BufferedTextWriter(object):
+    """
+    Formats whole blocks of rows at once and writes them to the underlying file in
+    large chunks, rather than calling write() for every value.
+
+    Values are converted with ndarray.tolist() before formatting, so floats are written
+    with Python's shortest round-trip representation (the same text str() produced for
+    the previous per-value writers) and read back to exactly the same float64.
+
+    Row formats use str.format with one positional field per column, where columns with
+    more than one dimension are indexed within the field, e.g. '{0} {1[0]} {1[1]}\n'.
+    """
+    def __init__(self, fid, chunk_size=1 << 22, block_rows=1 << 14):
+        self.fid = fid
+        self.chunk_size = chunk_size
+        self.block_rows = block_rows
+        self._parts = []
+        self._size = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.flush()
+
+    def write(self, text):
+        self._parts.append(text)
+        self._size += len(text)
+        if self._size >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if self._parts:
+            self.fid.write(''.join(self._parts))
+            self._parts = []
+            self._size = 0
+
+    def write_rows(self, row_format, *columns):
+        """ Writes one formatted row for each entry of the given equal length columns """
+        columns = [np.asarray(c) for c in columns]
+        rows = len(columns[0]) if columns else 0
+        for first in range(0, rows, self.block_rows):
+            last = min(first + self.block_rows, rows)
+            self.write(''.join(map(row_format.format, *[c[first:last].tolist() for c in columns])))
+
+    def write_ragged(self, row_format, row_columns, item_format, item_columns, offsets, row_end='\n'):
+        """
+        Writes rows with a variable number of items, such as a point and its track:
+            row_format.format(*row) + item_format.format(*item) for each item + row_end
+        where the items of row i are item_columns[offsets[i]:offsets[i + 1]].
+        """
+        row_columns = [np.asarray(c) for c in row_columns]
+        item_columns = [np.asarray(c) for c in item_columns]
+        offsets = np.asarray(offsets, dtype=np.int64)
+        rows = len(offsets) - 1
+        for first in range(0, rows, self.block_rows):
+            last = min(first + self.block_rows, rows)
+            start, end = offsets[first], offsets[last]
+            heads = list(map(row_format.format, *[c[first:last].tolist() for c in row_columns]))
+            items = list(map(item_format.format, *[c[start:end].tolist() for c in item_columns]))
+            bounds = (offsets[first:last + 1] - start).tolist()
+            self.write(''.join([heads[i] + ''.join(items[bounds[i]:bounds[i + 1]]) + row_end
+                                for i in range(last - first)]))
@@ -0,0 +1,98 @@
+"""
+Batched camera coordinate frame conversions shared by the importers and exporters.
+
+Every function accepts arrays with any number of leading dimensions, e.g. (N, 3, 3)
+rotation matrices or (N, 4) quaternions for N cameras, as well as a single camera.
+Quaternions are (w, x, y, z), as used by COLMAP, VisualSfM and mathutils.
+
+Rotations in the interchange format (see reconstruction.py) are world to camera in the
+graphics convention used by Bundler and Blender, where cameras look along -Z with Y up.
+Computer vision tools (COLMAP, VisualSfM, Meshroom) look along +Z with Y down, which is
+the same rotation flipped 180 degrees about the camera's X axis (flip_axes).
+"""
+import numpy as np
+
+
+# rotation of 180 degrees about X, i.e. mathutils' R.rotate(Euler((pi, 0, 0)))
+FLIP = np.diag([1.0, -1.0, -1.0])
+
+
+def quaternion_to_matrix(q):
+    """ Rotation matrices of (..., 4) quaternions, which are normalised first """
+    q = np.asarray(q, dtype=np.float64)
+    q = q / np.linalg.norm(q, axis=-1, keepdims=True)
+    w, x, y, z = np.moveaxis(q, -1, 0)
+    return np.stack([
+        np.stack([1 - 2 * (y * y + z * z), 2 * (x * y - w * z), 2 * (x * z + w * y)], axis=-1),
+        np.stack([2 * (x * y + w * z), 1 - 2 * (x * x + z * z), 2 * (y * z - w * x)], axis=-1),
+        np.stack([2 * (x * z - w * y), 2 * (y * z + w * x), 1 - 2 * (x * x + y * y)], axis=-1),
+    ], axis=-2)
+
+
+def matrix_to_quaternion(R):
+    """ Unit quaternions of (..., 3, 3) rotation matrices, with w >= 0 """
+    R = np.asarray(R, dtype=np.float64)
+    m00, m01, m02 = R[..., 0, 0], R[..., 0, 1], R[..., 0, 2]
+    m10, m11, m12 = R[..., 1, 0], R[..., 1, 1], R[..., 1, 2]
+    m20, m21, m22 = R[..., 2, 0], R[..., 2, 1], R[..., 2, 2]
+
+    # each of w, x, y and z can be found from the diagonal, use whichever is largest for precision
+    diagonal = np.stack([m00 + m11 + m22, m00 - m11 - m22, m11 - m00 - m22, m22 - m00 - m11], axis=-1)
+    s = 2 * np.sqrt(np.maximum(1 + diagonal, 1e-12))
+    candidates = np.stack([
+        np.stack([s[..., 0] / 4, (m21 - m12) / s[..., 0], (m02 - m20) / s[..., 0], (m10 - m01) / s[..., 0]], axis=-1),
+        np.stack([(m21 - m12) / s[..., 1], s[..., 1] / 4, (m01 + m10) / s[..., 1], (m02 + m20) / s[..., 1]], axis=-1),
+        np.stack([(m02 - m20) / s[..., 2], (m01 + m10) / s[..., 2], s[..., 2] / 4, (m12 + m21) / s[..., 2]], axis=-1),
+        np.stack([(m10 - m01) / s[..., 3], (m02 + m20) / s[..., 3], (m12 + m21) / s[..., 3], s[..., 3] / 4], axis=-1),
+    ], axis=-2)
+    q = np.take_along_axis(candidates, np.argmax(diagonal, axis=-1)[..., None, None], axis=-2)[..., 0, :]
+    q = q / np.linalg.norm(q, axis=-1, keepdims=True)
+    return np.where(q[..., :1] < 0, -q, q)
+
+
+def matrix_to_euler(R):
+    """
+    XYZ Euler angles of (..., 3, 3) rotation matrices, matching mathutils' to_euler('XYZ'),
+    which chooses the smaller of the two possible solutions.
+    """
+    R = np.asarray(R, dtype=np.float64)
+    R = R / np.linalg.norm(R, axis=-2, keepdims=True)
+    cy = np.hypot(R[..., 0, 0], R[..., 1, 0])
+    first = np.stack([np.arctan2(R[..., 2, 1], R[..., 2, 2]),
+                      np.arctan2(-R[..., 2, 0], cy),
+                      np.arctan2(R[..., 1, 0], R[..., 0, 0])], axis=-1)
+    second = np.stack([np.arctan2(-R[..., 2, 1], -R[..., 2, 2]),
+                       np.arctan2(-R[..., 2, 0], -cy),
+                       np.arctan2(-R[..., 1, 0], -R[..., 0, 0])], axis=-1)
+    # gimbal lock, where Z can be taken as 0
+    locked = np.stack([np.arctan2(-R[..., 1, 2], R[..., 1, 1]),
+                       np.arctan2(-R[..., 2, 0], cy),
+                       np.zeros_like(cy)], axis=-1)
+    euler = np.where((np.abs(first).sum(axis=-1) > np.abs(second).sum(axis=-1))[..., None], second, first)
+    return np.where((cy > 16 * np.finfo(np.float32).eps)[..., None], euler, locked)
+
+
+def euler_to_matrix(euler):
+    """ Rotation matrices of (..., 3) XYZ Euler angles, i.e. Rz @ Ry @ Rx """
+    euler = np.asarray(euler, dtype=np.float64)
+    (cx, cy, cz), (sx, sy, sz) = np.moveaxis(np.cos(euler), -1, 0), np.moveaxis(np.sin(euler), -1, 0)
+    return np.stack([
+        np.stack([cy * cz, sx * sy * cz - cx * sz, cx * sy * cz + sx * sz], axis=-1),
+        np.stack([cy * sz, sx * sy * sz + cx * cz, cx * sy * sz - sx * cz], axis=-1),
+        np.stack([-sy, sx * cy, cx * cy], axis=-1),
+    ], axis=-2)
+
+
+def camera_centre(R, t):
+    """ World positions of cameras from their rotations and translations, c = -R^T t """
+    return -np.einsum('...ji,...j->...i', np.asarray(R, dtype=np.float64), np.asarray(t, dtype=np.float64))
+
+
+def camera_translation(R, c):
+    """ Translations of cameras from their rotations and world positions, t = -R c """
+    return -np.einsum('...ij,...j->...i', np.asarray(R, dtype=np.float64), np.asarray(c, dtype=np.float64))
+
+
+def flip_axes(R):
+    """ Converts world to camera rotations between the computer vision and graphics conventions (its own inverse) """
+    return FLIP @ np.asarray(R, dtype=np.float64)
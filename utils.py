@@ -4,18 +4,24 @@ import bpy
 import numpy as np
 import platform
 from pprint import PrettyPrinter
+from types import SimpleNamespace
 from .kmeans import K_Means
+from .imagesize import probe_image_size
+from .jobs import call_main
+from .ply import read_ply, points_within, voxel_sample
 
 
 osname = platform.system().lower()
 
 
 class PhotogrammetryModule(object):
-    def __init__(self, name, description, property_group, func):
+    def __init__(self, name, description, property_group, func, background=True):
         self.name = name
         self.description = description
         self.property_group = property_group
         self.func = func
+        # exporters run as a background job unless they need to modify the scene throughout
+        self.background = background
     
     def __unicode__(self):
         return self.name
@@ -88,7 +94,32 @@ def get_binary_path(module_binary_path, binary_name):
     return None
 
 
+# (path, mtime) -> (width, height)
+_image_sizes = {}
+
+
 def get_image_size(filename):
+    """
+    Returns the (width, height) of an image, reading only the header of JPEG, PNG and TIFF
+    files and falling back to loading the image in Blender for any other format.
+    """
+    try:
+        key = (os.path.abspath(filename), os.stat(filename).st_mtime_ns)
+    except OSError:
+        key = None
+    if key in _image_sizes:
+        return _image_sizes[key]
+
+    size = probe_image_size(filename)
+    if size is None:
+        size = call_main(load_image_size, filename)
+
+    if key:
+        _image_sizes[key] = size
+    return size
+
+
+def load_image_size(filename):
     img = bpy.data.images.load(filename)
     try:
         return tuple(img.size)
@@ -141,30 +172,154 @@ class CroppingPrettyPrinter(PrettyPrinter):
                 break
 
 
+def freeze_properties(properties):
+    """ Copies the values of a property group so they can be read by a background job """
+    return SimpleNamespace(**{key: getattr(properties, key) for key in type(properties).__annotations__})
+
+
 def get_prefs():
     module_re = re.compile('^blender.photogrammetry.*$')
     return next((m.preferences for m in bpy.context.preferences.addons if module_re.match(m.module)), None)
 
 
-def get_dominant_colours(image, num_colours=1, samples=1000):
-    # image = bpy.data.images['0001.jpg']
-    width, height = image.size
-
-    # get image pixels as 0-255 range, reshaped into RGBA arrays, with alpha channel removed
-    pixels = np.delete((np.array(image.pixels) * 255).astype(int).reshape(width * height, 4), 3, 1)
+def get_worker_count():
+    """ Number of tasks to run in parallel, from the addon preferences (0 being one per CPU) """
+    prefs = call_main(get_prefs)
+    return (prefs and prefs.max_workers) or os.cpu_count() or 1
 
-    # decimated by number of samples
-    pixels = pixels[::int((width * height) / samples) or 1]
 
-    clf = K_Means(k=num_colours)
-    clf.fit(pixels)
-
-    #for centroid in clf.centroids:
-    #    print(clf.centroids[centroid])
-    #for classification in clf.classifications:
-    #    print(classification, len(clf.classifications[classification]))
-    
-    return [(tuple(map(int, clf.centroids[classification])), len(clf.classifications[classification])) for classification in clf.classifications]
+def get_dominant_colours(image, num_colours=1, samples=1000):
+    """ :returns: [((r, g, b), count), ...] of the centroids of a sample of the image's pixels, empty for an empty image """
+    width, height = image.size
+    if not width * height:
+        return []
+
+    # read the pixels of a copy scaled down to about the number of samples, rather than every pixel of the image
+    scale = min(1.0, (samples / (width * height)) ** 0.5)
+    sample = image
+    if scale < 1.0:
+        sample = image.copy()
+        sample.scale(max(1, round(width * scale)), max(1, round(height * scale)))
+    try:
+        width, height = sample.size
+        pixels = np.empty(width * height * 4, dtype=np.float32)
+        try:
+            sample.pixels.foreach_get(pixels)
+        except AttributeError:
+            # image pixels only support foreach_get from Blender 2.83
+            pixels[:] = sample.pixels[:]
+    finally:
+        if sample is not image:
+            bpy.data.images.remove(sample)
+    pixels = pixels.reshape(width * height, 4)[:, :3] * 255
+
+    clf = K_Means(k=num_colours).fit(pixels)
+    return [(tuple(map(int, centroid)), int(count)) for centroid, count in zip(clf.centroids, clf.counts)]
+
+
+# attribute type -> (property of each attribute value, number of floats per value)
+ATTRIBUTE_VALUES = {
+    'FLOAT': ('value', 1),
+    'FLOAT_VECTOR': ('vector', 3),
+    'FLOAT_COLOR': ('color', 4),
+}
+
+
+def create_mesh(name, coords, faces=None, colours=None, normals=None, attributes=None):
+    """
+    Creates a mesh filled in bulk with foreach_set rather than one vertex or face at a time,
+    of unconnected vertices when no faces are given.
+    :param coords: (n, 3) vertex positions
+    :param faces: optional (counts, indices) of the number of vertices in each face and their concatenated vertex indices
+    :param colours: optional (n, 3) RGB colours of each vertex, as 0-255 integers or 0-1 floats
+    :param normals: optional (n, 3) vertex normals, used as custom normals for faces or as a point attribute otherwise
+    :param attributes: optional {name: (type, values)} of additional point attributes, where type is a key of ATTRIBUTE_VALUES
+    """
+    coords = np.ascontiguousarray(coords, dtype=np.float32).reshape(-1, 3)
+    mesh = bpy.data.meshes.new(name)
+    mesh.vertices.add(len(coords))
+    mesh.vertices.foreach_set('co', coords.ravel())
+
+    if faces is not None:
+        counts, indices = faces
+        counts = np.asarray(counts, dtype=np.int32)
+        starts = np.zeros(len(counts), dtype=np.int32)
+        np.cumsum(counts[:-1], out=starts[1:])
+        mesh.loops.add(len(indices))
+        mesh.loops.foreach_set('vertex_index', np.ascontiguousarray(indices, dtype=np.int32))
+        mesh.polygons.add(len(counts))
+        mesh.polygons.foreach_set('loop_start', starts)
+        # the number of loops in a polygon is derived from the loop starts from Blender 4.0
+        if bpy.app.version < (4, 0, 0):
+            mesh.polygons.foreach_set('loop_total', counts)
+
+    attributes = dict(attributes or {})
+    if colours is not None:
+        colours = np.asarray(colours).reshape(-1, 3)
+        rgba = np.ones((len(coords), 4), dtype=np.float32)
+        rgba[:, :3] = colours / 255.0 if colours.dtype.kind in 'ui' else colours
+        attributes['Col'] = ('FLOAT_COLOR', rgba)
+    if normals is not None and faces is None:
+        attributes['Normal'] = ('FLOAT_VECTOR', normals)
+
+    # generic mesh attributes are only available from Blender 2.91
+    if hasattr(mesh, 'attributes'):
+        for attribute_name, (attribute_type, values) in attributes.items():
+            key, size = ATTRIBUTE_VALUES[attribute_type]
+            attribute = mesh.attributes.new(attribute_name, attribute_type, 'POINT')
+            attribute.data.foreach_set(key, np.ascontiguousarray(values, dtype=np.float32).reshape(len(coords) * size))
+
+    mesh.update(calc_edges=faces is not None)
+    if normals is not None and faces is not None:
+        # custom normals require auto smooth before Blender 4.1
+        if hasattr(mesh, 'use_auto_smooth'):
+            mesh.use_auto_smooth = True
+        mesh.normals_split_custom_set_from_vertices(np.asarray(normals, dtype=np.float32).reshape(-1, 3))
+    return mesh
+
+
+def load_ply_mesh(filepath, name=None, points=0, bounds=None):
+    """
+    Creates a mesh from a PLY file, with its vertex colours and normals when present.
+    Point clouds can be limited to the points within bounds (lower, upper) and decimated
+    to roughly the given number of points (0 = every point). Meshes are always loaded in full.
+    """
+    elements = read_ply(filepath)
+    vertex = elements['vertex']
+    faces = elements.get('face', {})
+    faces = faces.get('vertex_indices', faces.get('vertex_index', None))
+
+    indices = slice(None)
+    if faces is None and (points or bounds):
+        selected = points_within(vertex, *bounds) if bounds else None
+        if points:
+            selected = voxel_sample(vertex, points, indices=selected)
+        indices = selected
+
+    def stack(*names):
+        return np.stack([vertex[n][indices] for n in names], axis=1) if all(n in vertex for n in names) else None
+
+    # PMVS names its colours diffuse_red, etc.
+    colours = stack('red', 'green', 'blue')
+    if colours is None:
+        colours = stack('diffuse_red', 'diffuse_green', 'diffuse_blue')
+
+    name = name or os.path.splitext(os.path.basename(filepath))[0]
+    return create_mesh(name, stack('x', 'y', 'z'), faces=faces, colours=colours, normals=stack('nx', 'ny', 'nz'))
+
+
+def import_ply(filepath, collection=None, points=0):
+    """
+    Imports a PLY point cloud or mesh as a new object. Point clouds may be imported as a
+    preview of roughly the given number of points, and remember the file they came from so
+    PHOTOGRAMMETRY_OT_load_points can load them again in more detail.
+    """
+    mesh = load_ply_mesh(filepath, points=points)
+    obj = bpy.data.objects.new(mesh.name, mesh)
+    if not len(mesh.polygons):
+        obj['photogrammetry_ply'] = filepath
+    (collection or bpy.context.collection).objects.link(obj)
+    return obj
 
 
 # def create_debug_svg(bpy_module, bundle_path):
@@ -2,10 +2,12 @@ import bpy
 import os
 import shutil
 import subprocess
-import re
-from math import pi
-from mathutils import Vector, Matrix, Quaternion, Euler
-from collections import namedtuple
+import numpy as np
+from collections import deque
+from itertools import islice
+from ..imageindex import ImageIndex
+from ..reconstruction import ReconstructionBuilder
+from ..transforms import quaternion_to_matrix, camera_translation, flip_axes
 from ..utils import get_image_size
 
 
@@ -47,48 +49,43 @@ def extract(properties, *args, **kargs):
     # # TODO: read list.txt to get image paths to detect image size
     # resolution_x = int(scene.render.resolution_x * (scene.render.resolution_percentage / 100))
 
-    with open(filepath, 'r') as f:
-        lines = f.readlines()
-
-    # TODO: read optional calibration from file (tuple stored against each camera as key 'principal' (x, y) floating-point pixels)
-    if len(lines) == 0 or not lines[0].startswith('NVM_V3'):
-        raise Exception('Not a valid NVM file')
-
-    cameras = {}
-    trackers = {}
-    data = {
-        'trackers': trackers,
-        'cameras': cameras,
-    }
-
-    total_cameras = int(lines[2])
-    total_points = int(lines[4 + total_cameras])
-
-    # numbers: optional negative, digit(s), optional decimal point and following digit(s), optional scientific notation "e-0"
-    num = r'-?\d+(?:\.\d+)?(?:e[+-]\d+)?'
-    camera_re = re.compile(rf'^(?P<name>.*?)\s+(?P<f>{num})\s+(?P<QW>{num})\s+(?P<QX>{num})\s+(?P<QY>{num})\s+(?P<QZ>{num})\s+(?P<X>{num})\s+(?P<Y>{num})\s+(?P<Z>{num})\s+(?P<k1>{num})\s+{num}\s*$')
-    for i in range(int(total_cameras)):
-        # each camera uses 1 line
-        match = camera_re.match(lines[3 + i])
-        if not match:
-            raise Exception(f'Camera {i} did not match the format specification')
-        
-        # find any filename that exists
-        filenames = [fp for fp in [os.path.join(*parts) for parts in zip(imagepaths, [match.group('name'),] * len(imagepaths))] if os.path.exists(fp)]
-        if not filenames:
-            # wasn't in a root path, do we search sub directories?
-            if properties.subdirs:
-                for imagepath in imagepaths:
-                    for root, dirs, files in os.walk(imagepath):
-                        if match.group('name') in files:
-                            filenames = [os.path.join(root, match.group('name'))]
-
-            # still didn't find file?
-            if not filenames:
-                raise AttributeError(f'VisualSfM image not found for camera {i}:\n"{match.group("name")}""')
+    images = ImageIndex(imagepaths, subdirs=properties.subdirs)
+    builder = ReconstructionBuilder()
+    resolution = None
 
-        # create cameras
-        q = Quaternion(tuple(map(float, [match.group('QW'), match.group('QX'), match.group('QY'), match.group('QZ')])))
+    with open(filepath, 'r') as f:
+        # TODO: read optional calibration from file (tuple stored against each camera as key 'principal' (x, y) floating-point pixels)
+        if not f.readline().startswith('NVM_V3'):
+            raise Exception('Not a valid NVM file')
+
+        # stream the remaining lines, where blank lines only separate sections
+        lines = (line for line in f if line.strip())
+
+        # skip the models before the requested one, each is <cameras> <points> and a count of 0 cameras ends the list
+        for model in range(properties.model + 1):
+            total_cameras = int(next(lines, '0'))
+            if not total_cameras:
+                raise AttributeError(f'VisualSfM model {properties.model} requested but the file only contains {model} model(s)')
+            if model < properties.model:
+                skip(lines, total_cameras)
+                skip(lines, int(next(lines, '0')))
+
+        filenames = []
+        cameras = np.empty((total_cameras, 10))
+        for i in range(total_cameras):
+            # each camera uses 1 line, the name can't contain whitespace but it is kept as the remainder of the line regardless
+            # <File name> <focal length> <quaternion WXYZ> <camera center> <radial distortion> 0
+            try:
+                name, *values = next(lines).rsplit(None, 10)
+                cameras[i] = tuple(map(float, values))
+            except (StopIteration, ValueError):
+                raise Exception(f'Camera {i} did not match the format specification')
+
+            # find any filename that exists
+            filename = images.find(name)
+            if not filename:
+                raise AttributeError(f'VisualSfM image not found for camera {i}:\n"{name}""')
+            filenames.append(filename)
 
         """
         https://github.com/SBCV/Blender-Addon-Photogrammetry-Importer/blob/75189215dffde50dad106144111a48f29b1fed32/photogrammetry_importer/file_handler/nvm_file_handler.py#L55
@@ -101,48 +98,57 @@ def extract(properties, *args, **kargs):
         which are rotated around the x axis by 180 degree
         i.e. the y and z axis of the CAMERA MATRICES are inverted
         """
-        R = q.to_matrix()
-        R.rotate(Euler((pi, 0, 0)))
-        R.transpose()
-        c = Vector(tuple(map(float, [match.group('X'), match.group('Y'), match.group('Z')])))
-        t = -1 * R @ c
-        R.transpose()
-
-        # TODO: confirm whether the distortion coefficient needs inverting
-        cameras.setdefault(i, {
-            'filename': filenames[0],
-            'f': float(match.group('f')),
-            'k': (float(match.group('k1')), 0, 0),
-            't': tuple(t),
-            'R': tuple(map(tuple, tuple(R))),
-            'trackers': {},
-        })
-        
-        if 'resolution' not in data:
-            data.setdefault('resolution', get_image_size(filenames[0]))
-    
-    marker_re = re.compile(rf'^(?P<X>{num})\s+(?P<Y>{num})\s+(?P<Z>{num})\s+(?P<R>\d+)\s+(?P<G>\d+)\s+(?P<B>\d+)\s+(?P<num_measurements>{num})\s+(?P<measurements>.*?)\s*$')
-    measurement_re = re.compile(rf'^(?P<image_idx>\d+)\s+(?P<feature_idx>\d+)\s+(?P<X>{num})\s+(?P<Y>{num}).*')
-    for i in range(int(total_points)):
-        # each point uses a single line
-        idx = 5 + int(total_cameras) + i
-        match = marker_re.match(lines[idx])
-        if not match:
-            raise AttributeError(f'VisualSfM marker {i} did not match the format specification')
-        
-        trackers.setdefault(i, {
-            'co': tuple(map(float, [match.group('X'), match.group('Y'), match.group('Z')])),
-            'rgb': tuple(map(int, [match.group('R'), match.group('G'), match.group('B')])),
-        })
-
-        cur = match.group('measurements')
-        for m in range(int(match.group('num_measurements'))):
-            measurement_match = measurement_re.match(cur)
-            if not measurement_match:
-                raise AttributeError(f'VisualSfM marker {i} did not match measurement {m} format specification')
-            # Let the measurement be (mx, my), which is relative to principal point (typically image center)
-            # As for the image coordinate system, X-axis points right, and Y-axis points downward, so Z-axis points forward.
-            cameras[int(measurement_match.group('image_idx'))]['trackers'].setdefault(i, (float(measurement_match.group('X')), -1 * float(measurement_match.group('Y'))))
-            cur = cur[measurement_match.end(len(measurement_match.groups())):].strip()
-    
-    return data
\ No newline at end of file
+        R = flip_axes(quaternion_to_matrix(cameras[:, 1:5]))
+        t = camera_translation(R, cameras[:, 5:8])
+
+        # create cameras
+        for i, (filename, focal, k1) in enumerate(zip(filenames, cameras[:, 0].tolist(), cameras[:, 8].tolist())):
+            # TODO: confirm whether the distortion coefficient needs inverting
+            builder.add_camera(i, filename, focal, (k1, 0, 0), R[i], t[i])
+
+        if filenames:
+            resolution = get_image_size(filenames[0])
+
+        read_points(lines, builder, int(next(lines, '0')))
+
+    return builder.build(resolution=resolution)
+
+
+def skip(lines, count):
+    """ Consumes count lines without parsing them """
+    deque(islice(lines, count), maxlen=0)
+
+
+def read_points(lines, builder, total_points, block_size=1 << 14):
+    """
+    Reads point lines in blocks, where each block is parsed into a single array of numbers
+    and every point's measurements are gathered from it as an (n, 4) block.
+    <Point>  = <XYZ> <RGB> <number of measurements> <List of Measurements>
+    <Measurement> = <Image index> <Feature Index> <xy>
+    """
+    for first in range(0, total_points, block_size):
+        block = list(islice(lines, min(block_size, total_points - first)))
+        values = np.fromstring(' '.join(block), dtype=np.float64, sep=' ')
+
+        # each point is 7 values followed by 4 per measurement
+        starts = np.empty(len(block), dtype=np.int64)
+        position = 0
+        try:
+            for p in range(len(block)):
+                starts[p] = position
+                position += 7 + 4 * int(values[position + 6])
+        except IndexError:
+            position = -1
+        if len(block) != min(block_size, total_points - first) or position != len(values):
+            raise AttributeError(f'VisualSfM marker {first + len(block) - 1} did not match the format specification')
+
+        point_ids = first + np.arange(len(block))
+        headers = values[starts[:, None] + np.arange(7)]
+        builder.add_points(point_ids, headers[:, 0:3], headers[:, 3:6])
+
+        counts = headers[:, 6].astype(np.int64)
+        offsets = np.concatenate(([0], np.cumsum(counts)))
+        measurements = values[(np.repeat(starts + 7 - 4 * offsets[:-1], counts) + 4 * np.arange(offsets[-1]))[:, None] + np.arange(4)]
+        # Let the measurement be (mx, my), which is relative to principal point (typically image center)
+        # As for the image coordinate system, X-axis points right, and Y-axis points downward, so Z-axis points forward.
+        builder.add_observations(np.repeat(point_ids, counts), measurements[:, 0].astype(np.int64), measurements[:, 2:4] * (1, -1))
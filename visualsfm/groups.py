@@ -1,15 +1,17 @@
-from bpy.props import StringProperty, BoolProperty
+from bpy.props import StringProperty, BoolProperty, IntProperty
 from bpy.types import PropertyGroup
 
 class PHOTOGRAMMETRY_PG_input_visualsfm(PropertyGroup):
     filepath: StringProperty(name="Filepath", description="Filename of NVM file", subtype='FILE_PATH')
     imagepath: StringProperty(name="Image directory", subtype='DIR_PATH', description="Path to directory containg images referenced by NVM file. Defaults to same directory as NVM file")
     subdirs: BoolProperty(name='Search subdirectories for images', default=True)
+    model: IntProperty(name='Model', default=0, min=0, description='Index of the reconstructed model to read, as an NVM file may contain several')
 
     def draw(self, layout):
         layout.prop(self, 'filepath')
         layout.prop(self, 'imagepath')
         layout.prop(self, 'subdirs')
+        layout.prop(self, 'model')
 
 
 class PHOTOGRAMMETRY_PG_output_visualsfm(PropertyGroup):
@@ -1,100 +1,72 @@
 import bpy
 import os
 import shutil
-from math import floor, pi
-from mathutils import Vector, Matrix, Quaternion, Euler
+import numpy as np
 from pprint import pprint
 
-def convert_image(filepath, target):
-    """ Creates a scene specifically for saving an image as JPG """
-    sc = bpy.data.scenes.new('photogrammetry_helper')
-    try:
-        img = bpy.data.images.load(filepath)
-        r = sc.render
-        r.resolution_x = img.size[0]
-        r.resolution_y = img.size[1]
-        r.resolution_percentage = floor(100 * min(1.0, (3000 / max(r.resolution_x, r.resolution_y))))  # 3000px limit on PMVS
-        r.image_settings.file_format = 'JPEG'
-        r.image_settings.quality = 100
-
-        sc.display_settings.display_device = 'sRGB'
-        img.save_render(target, scene=sc)
-        bpy.data.images.remove(img)
-    finally:
-        # remove the temporary export scene
-        bpy.data.scenes.remove(sc)
-
+from ..reconstruction import as_reconstruction
+from ..textwriter import BufferedTextWriter
+from ..transforms import matrix_to_quaternion, camera_centre, flip_axes
+from ..convert import convert_images, ConversionCache
+from ..jobs import call_main
+from ..utils import get_worker_count
 
 def load(properties, data, *args, **kwargs):
     """
     Takes the structure calculated from parsing the input and writes to the NVM file structure
     """
-    dirpath = bpy.path.abspath(properties.dirpath)
+    # relative paths are resolved against the blend file, which can only be read on the main thread
+    dirpath = call_main(bpy.path.abspath, properties.dirpath)
     if not dirpath:
         raise AttributeError('VisualSfM Workspace Directory must be provided for output')
 
-    cameras = data['cameras']
-    camera_keys = list(cameras.keys())
-    trackers = data['trackers']
+    data = as_reconstruction(data)
 
     if not os.path.exists(dirpath):
         os.makedirs(dirpath)
 
     # copy and convert all images into visualsfm folder
-    for idx, key in enumerate(camera_keys):
-        camera = cameras[key]
-        filepath = camera['filename']
-        target = os.path.join(dirpath, os.path.splitext(os.path.basename(filepath))[0] + '.jpg')
-        convert_image(filepath, target)
-        #shutil.copy(camera['filename'], dirpath)
-        camera['filename'] = os.path.basename(target)
+    targets = [os.path.join(dirpath, os.path.splitext(os.path.basename(filepath))[0] + '.jpg') for filepath in data.filenames]
+    convert_images(zip(data.filenames, targets), workers=get_worker_count(), cache=ConversionCache(dirpath))
+    filenames = [os.path.basename(target) for target in targets]
 
     # now write the nvm file
-    with open(os.path.join(dirpath, 'bundle.nvm'), 'w+') as f:
-        f.write('NVM_V3\n\n')
-        f.write(f'{len(cameras.items())}\n')
-        for idx, key in enumerate(camera_keys):
-            camera = cameras[key]
+    write_nvm(os.path.join(dirpath, 'bundle.nvm'), data, filenames)
 
-            # transform camera extrinsics appropriately
-            R = Matrix(camera['R'])
-            R.transpose()
-            c = Vector(camera['t'])
-            t = -1 * R @ c
-            R.transpose()
-            R.rotate(Euler((pi, 0, 0)))
 
+def write_nvm(path, data, filenames):
+    """
+    Writes a Reconstruction as a single model NVM file, with points and their measurements
+    formatted in blocks from the observation index.
+    """
+    with open(path, 'w+') as f, BufferedTextWriter(f) as writer:
+        writer.write('NVM_V3\n\n')
+        writer.write(f'{data.num_cameras}\n')
+        # transform camera extrinsics appropriately
+        quaternions = matrix_to_quaternion(flip_axes(data.rotation))
+        centres = camera_centre(data.rotation, data.translation)
+        for filename, focal, k, q, c in zip(filenames, data.focal.tolist(), data.distortion.tolist(), quaternions.tolist(), centres.tolist()):
             # TODO: confirm whether the distortion coefficient needs inverting
             # <Camera> = <File name> <focal length> <quaternion WXYZ> <camera center> <radial distortion> 0
-            f.write('{filename} {f} {q[0]} {q[1]} {q[2]} {q[3]} {t[0]} {t[1]} {t[2]} {k[0]} 0\n'.format(
-                filename=camera['filename'],
-                f=camera['f'],
-                q=R.to_quaternion(),
-                t=t,
-                k=camera['k']))
+            writer.write('{filename} {f} {q[0]} {q[1]} {q[2]} {q[3]} {c[0]} {c[1]} {c[2]} {k[0]} 0\n'.format(
+                filename=filename,
+                f=focal,
+                q=q,
+                c=c,
+                k=k))
         
         # now write the points and corresponding matching cameras
-        f.write(f'\n{len(trackers.items())}\n')
-        sift = 0
-        for tid, track in trackers.items():
-            # <Point> = <XYZ> <RGB> <number of measurements> <List of Measurements>
-            # <Measurement> = <Image index> <Feature Index> <xy>
-            measurements = {}
-            for cid, camera in cameras.items():
-                if tid in camera['trackers']:
-                    measurements.setdefault(cid, camera['trackers'][tid])
-            
-            f.write('{co[0]} {co[1]} {co[2]} {rgb[0]} {rgb[1]} {rgb[2]} {num_measurements}'.format(**track, num_measurements=len(measurements.items())))
-            for cid, measurement in measurements.items():
-                f.write(' {image_idx} {feature_idx} {x} {y}'.format(image_idx=cid,
-                                                                    feature_idx=sift,
-                                                                    x=measurement[0],
-                                                                    y=-1 * measurement[1]))
-                sift += 1
-            f.write('\n')
+        # <Point> = <XYZ> <RGB> <number of measurements> <List of Measurements>
+        # <Measurement> = <Image index> <Feature Index> <xy>
+        writer.write(f'\n{data.num_points}\n')
+        writer.write_ragged('{0[0]} {0[1]} {0[2]} {1[0]} {1[1]} {1[2]} {2}',
+                            [data.coords, data.colours, data.track_lengths],
+                            ' {0} {1} {2[0]} {2[1]}',
+                            [data.track_cameras, np.arange(data.num_observations), data.track_xy * (1, -1)],
+                            data.track_offsets)
 
-        f.write('\n\n\n0\n\n')
-        f.write('#the last part of NVM file points to the PLY files\n')
-        f.write('#the first number is the number of associated PLY files\n')
-        f.write('#each following number gives a model-index that has PLY\n')
-        f.write('0\n')
+        writer.write('\n\n\n0\n\n')
+        writer.write('#the last part of NVM file points to the PLY files\n')
+        writer.write('#the first number is the number of associated PLY files\n')
+        writer.write('#each following number gives a model-index that has PLY\n')
+        writer.write('0\n')